@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""Compressed and delta-encoded storage of the series revisions
+
+Each archived version is stored as a reverse delta: the difference needed to
+rebuild the version N from the version N+1 (changed metadata, changed or
+removed observations). Every ARCHIVES_SNAPSHOT_INTERVAL versions, a full
+copy of the series is stored instead, so a version is rebuilt with at most
+ARCHIVES_SNAPSHOT_INTERVAL deltas.
+"""
+
+import logging
+import zlib
+
+from bson import BSON, Binary
+
+from widukind_common.utils import series_archives_load
+from widukind_common.debug import timeit
+
+from dlstats import constants
+from dlstats.utils import clean_datetime
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_FORMAT_DELTA = "delta"
+ARCHIVE_FORMAT_SNAPSHOT = "snapshot"
+
+EXCLUDE_FIELDS = ["_id", "values"]
+
+_MISSING = object()
+
+def compress_datas(datas):
+    return Binary(zlib.compress(BSON.encode(datas)))
+
+def uncompress_datas(datas):
+    return BSON(zlib.decompress(datas)).decode()
+
+@timeit("archives.series_delta", stats_only=True)
+def series_delta(old_bson, new_bson):
+    """Return the delta for rebuild old_bson from new_bson
+
+    :param dict old_bson: Previous version of the series
+    :param dict new_bson: Next version of the series
+    """
+    fields = {}
+    unset = []
+
+    for key, value in old_bson.items():
+        if key in EXCLUDE_FIELDS:
+            continue
+        if new_bson.get(key, _MISSING) != value:
+            fields[key] = value
+
+    for key in new_bson.keys():
+        if not key in EXCLUDE_FIELDS and not key in old_bson:
+            unset.append(key)
+
+    old_values = old_bson["values"]
+    new_values = new_bson["values"]
+    count_new = len(new_values)
+
+    if old_values and new_values and old_values[0]["period"] == new_values[0]["period"]:
+        changed = [[i, obs] for i, obs in enumerate(old_values)
+                   if i >= count_new or obs != new_values[i]]
+        values = {"count": len(old_values), "changed": changed}
+    else:
+        values = {"count": len(old_values), "full": old_values}
+
+    return {"fields": fields, "unset": unset, "values": values}
+
+@timeit("archives.series_apply_delta", stats_only=True)
+def series_apply_delta(bson, delta):
+    """Return the previous version of bson from a delta of :func:`series_delta`"""
+
+    unset = delta["unset"]
+    old_bson = {k: v for k, v in bson.items() if k != "_id" and not k in unset}
+    old_bson.update(delta["fields"])
+
+    values = delta["values"]
+    if "full" in values:
+        old_bson["values"] = values["full"]
+    else:
+        count = values["count"]
+        old_values = list(bson["values"][:count])
+        old_values.extend([None] * (count - len(old_values)))
+        for i, obs in values["changed"]:
+            old_values[i] = obs
+        old_bson["values"] = old_values
+
+    return old_bson
+
+def series_archives_delta_store(old_bson, new_bson, snapshot=False):
+    """Return the document to insert in series archives collection
+
+    :param dict old_bson: Version to archive
+    :param dict new_bson: Version replacing old_bson
+    :param bool snapshot: Store a full copy of old_bson if True
+    """
+    if snapshot:
+        archive_format = ARCHIVE_FORMAT_SNAPSHOT
+        datas = {k: v for k, v in old_bson.items() if k != "_id"}
+    else:
+        archive_format = ARCHIVE_FORMAT_DELTA
+        datas = series_delta(old_bson, new_bson)
+
+    return {
+        "provider_name": old_bson["provider_name"],
+        "dataset_code": old_bson["dataset_code"],
+        "key": old_bson["key"],
+        "slug": old_bson["slug"],
+        "version": old_bson.get("version", 0),
+        "archive_format": archive_format,
+        "created": clean_datetime(),
+        "datas": compress_datas(datas)
+    }
+
+def is_snapshot_version(version):
+    interval = constants.ARCHIVES_SNAPSHOT_INTERVAL
+    return interval <= 1 or version % interval == 0
+
+def _load_archive(doc):
+    archive_format = doc.get("archive_format")
+    if archive_format is None:
+        # format of widukind_common.utils.series_archives_store
+        return series_archives_load(doc)
+    return uncompress_datas(doc["datas"])
+
+@timeit("archives.series_archives_load_version")
+def series_archives_load_version(db, slug, version):
+    """Rebuild the version of one series
+
+    Return None if this version is not found
+
+    :param pymongo.database.Database db: MongoDB Database instance
+    :param str slug: Series slug
+    :param int version: Version to rebuild
+    """
+    query = {"slug": slug, "version": {"$gte": version}}
+    cursor = db[constants.COL_SERIES_ARCHIVES].find(query).sort("version", 1)
+
+    chain = []
+    bson = None
+    for doc in cursor:
+        if doc.get("archive_format") == ARCHIVE_FORMAT_DELTA:
+            chain.append(doc)
+        else:
+            bson = _load_archive(doc)
+            bson.setdefault("version", doc.get("version", 0))
+            break
+
+    if bson is None:
+        bson = db[constants.COL_SERIES].find_one({"slug": slug})
+        if not bson:
+            return None
+        bson.pop("_id")
+
+    current_version = bson.get("version", 0)
+    for doc in reversed(chain):
+        if doc["version"] != current_version - 1:
+            msg = "broken archives chain for series[%s] - version[%s]"
+            logger.error(msg % (slug, doc["version"]))
+            return None
+        bson = series_apply_delta(bson, _load_archive(doc))
+        current_version = doc["version"]
+
+    if current_version != version:
+        return None
+
+    return bson
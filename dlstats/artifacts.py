@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+
+"""Content-addressed local store for the downloaded files
+
+The store is shared by the runs and the workers of one host:
+
+- objects/<sha[:2]>/<sha>.gz : gzip content - sha is the sha256 of the content
+- urls/<url_hash>.json : index by url - {"url", "sha256", "size", "stored",
+  "headers"}
+
+All files are written in a temporary file and moved with os.replace, so a
+reader never sees a partial file. The access time of the objects (mtime) is
+updated on each read and the least recently used objects are removed when
+the size of the store exceeds max_size. The size is scanned once by process
+and updated by put() (the objects stored by the other workers are counted
+at the next eviction).
+
+A read from the store returns an :class:`ArtifactResponse` (status 200 and
+the stored headers of the response) for the callers of the Downloader.
+"""
+
+import os
+import time
+import json
+import gzip
+import shutil
+import hashlib
+import logging
+import tempfile
+import threading
+
+from requests.structures import CaseInsensitiveDict
+
+from widukind_common.debug import timeit
+
+from dlstats.utils import get_url_hash
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024 * 1024 #10Go
+
+DEFAULT_MAX_AGE = 60 * 60 * 24 #24H
+
+CHUNK_SIZE = 64 * 1024
+
+# not valid for the stored (decoded) content
+EXCLUDE_HEADERS = ["content-encoding", "content-length", "transfer-encoding",
+                   "set-cookie"]
+
+artifacts = None
+
+def _atomic_path(dirpath, prefix=".tmp-"):
+    fd, tmp_path = tempfile.mkstemp(prefix=prefix, dir=dirpath)
+    os.close(fd)
+    return tmp_path
+
+def file_sha256(filepath):
+    sha = hashlib.sha256()
+    with open(filepath, "rb") as fp:
+        for chunk in iter(lambda: fp.read(CHUNK_SIZE), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+class ArtifactResponse(object):
+    """Response of a download read from the store"""
+
+    status_code = 200
+    reason = "OK"
+    from_artifacts = True
+
+    def __init__(self, url, entry):
+        self.url = url
+        self.headers = CaseInsensitiveDict(entry.get("headers") or {})
+
+    def raise_for_status(self):
+        pass
+
+class ArtifactStore(object):
+
+    def __init__(self,
+                 root=None,
+                 max_size=DEFAULT_MAX_SIZE,
+                 max_age=DEFAULT_MAX_AGE,
+                 compress_level=6):
+        """
+        :param str root: Store directory
+        :param int max_size: Max size of the objects (bytes) - 0 for unlimited
+        :param int max_age: Default freshness (seconds) - 0 for unlimited
+        :param int compress_level: gzip compress level
+        """
+        if not root:
+            raise ValueError("root is required")
+
+        self.root = os.path.abspath(root)
+        self.max_size = max_size
+        self.max_age = max_age
+        self.compress_level = compress_level
+
+        # size of the objects (bytes) - None if not scanned
+        self._size = None
+        self._lock = threading.Lock()
+
+        self.objects_path = os.path.join(self.root, "objects")
+        self.urls_path = os.path.join(self.root, "urls")
+        os.makedirs(self.objects_path, exist_ok=True)
+        os.makedirs(self.urls_path, exist_ok=True)
+
+    def object_path(self, sha256):
+        return os.path.join(self.objects_path, sha256[:2], "%s.gz" % sha256)
+
+    def url_path(self, url):
+        return os.path.join(self.urls_path, "%s.json" % get_url_hash(url))
+
+    def lookup(self, url, max_age=None):
+        """Return the index entry of url or None if missing or not fresh
+
+        :param int max_age: Freshness (seconds) - default: self.max_age
+        """
+        if max_age is None:
+            max_age = self.max_age
+
+        try:
+            with open(self.url_path(url)) as fp:
+                entry = json.load(fp)
+        except (OSError, ValueError):
+            return None
+
+        if entry.get("url") != url:
+            return None
+
+        # entry stored without the headers of the response
+        if not "headers" in entry:
+            return None
+
+        if max_age and entry["stored"] < time.time() - max_age:
+            return None
+
+        if not os.path.exists(self.object_path(entry["sha256"])):
+            return None
+
+        return entry
+
+    @timeit("artifacts.get", stats_only=True)
+    def get(self, url, filepath, max_age=None):
+        """Write the content of url in filepath - return the entry or None"""
+        entry = self.lookup(url, max_age=max_age)
+        if not entry:
+            return None
+
+        obj_path = self.object_path(entry["sha256"])
+        dirpath = os.path.dirname(os.path.abspath(filepath))
+        tmp_path = _atomic_path(dirpath)
+        try:
+            with gzip.open(obj_path, "rb") as src, open(tmp_path, "wb") as dst:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+            os.replace(tmp_path, filepath)
+        except OSError as err:
+            # object removed by eviction in another worker
+            logger.warning("artifact not readable for url[%s] : %s" % (url, str(err)))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return None
+
+        try:
+            os.utime(obj_path)
+        except OSError:
+            pass
+
+        return entry
+
+    @timeit("artifacts.put", stats_only=True)
+    def put(self, url, filepath, headers=None):
+        """Store the content of filepath for url - return the sha256
+
+        :param dict headers: Headers of the response
+        """
+        sha256 = file_sha256(filepath)
+        obj_path = self.object_path(sha256)
+
+        if os.path.exists(obj_path):
+            os.utime(obj_path)
+        else:
+            self.current_size()
+            dirpath = os.path.dirname(obj_path)
+            os.makedirs(dirpath, exist_ok=True)
+            tmp_path = _atomic_path(dirpath)
+            try:
+                with open(filepath, "rb") as src, \
+                        gzip.open(tmp_path, "wb", compresslevel=self.compress_level) as dst:
+                    shutil.copyfileobj(src, dst, CHUNK_SIZE)
+                os.replace(tmp_path, obj_path)
+            except Exception:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+            self._add_size(os.path.getsize(obj_path))
+
+        entry = {"url": url,
+                 "sha256": sha256,
+                 "size": os.path.getsize(filepath),
+                 "stored": time.time(),
+                 "headers": dict((k, v) for k, v in (headers or {}).items()
+                                 if not k.lower() in EXCLUDE_HEADERS)}
+        tmp_path = _atomic_path(self.urls_path)
+        with open(tmp_path, "w") as fp:
+            json.dump(entry, fp)
+        os.replace(tmp_path, self.url_path(url))
+
+        if self.max_size and self.current_size() > self.max_size:
+            self.evict()
+
+        return sha256
+
+    def iter_objects(self):
+        for dirpath, dirnames, filenames in os.walk(self.objects_path):
+            for filename in filenames:
+                if not filename.endswith(".gz"):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                yield path, stat.st_size, stat.st_mtime
+
+    def size(self):
+        """Size of the objects (scan of the store)"""
+        return sum(size for path, size, mtime in self.iter_objects())
+
+    def current_size(self):
+        """Size of the objects - scanned on first call then updated"""
+        with self._lock:
+            if self._size is None:
+                self._size = self.size()
+            return self._size
+
+    def _add_size(self, size):
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+
+    @timeit("artifacts.evict", stats_only=True)
+    def evict(self, max_size=None):
+        """Remove the least recently used objects - return count removed
+
+        The url entries of the removed objects are misses for lookup.
+        """
+        max_size = self.max_size if max_size is None else max_size
+        if not max_size:
+            return 0
+
+        objects = list(self.iter_objects())
+        total = sum(size for path, size, mtime in objects)
+        if total <= max_size:
+            with self._lock:
+                self._size = total
+            return 0
+
+        count = 0
+        for path, size, mtime in sorted(objects, key=lambda o: o[2]):
+            if total <= max_size:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            count += 1
+
+        with self._lock:
+            self._size = total
+
+        logger.info("artifacts evict - removed[%s] - size[%s]" % (count, total))
+        return count
+
+    def clear(self):
+        shutil.rmtree(self.objects_path, ignore_errors=True)
+        shutil.rmtree(self.urls_path, ignore_errors=True)
+        os.makedirs(self.objects_path, exist_ok=True)
+        os.makedirs(self.urls_path, exist_ok=True)
+        with self._lock:
+            self._size = 0
+
+def configure_artifacts(**kwargs):
+    global artifacts
+    artifacts = ArtifactStore(**kwargs)
+    return artifacts
+
+def remove_artifacts():
+    global artifacts
+    artifacts = None
@@ -1,91 +1,54 @@
 
 import logging
-from collections import deque
 import concurrent.futures
 
-import pymongo
-
 from widukind_common.debug import timeit
 
-from dlstats import constants
-from dlstats.utils import last_error
+from dlstats.fetchers._commons import Series, series_update_batch
 
 logger = logging.getLogger(__name__)
 
-from dlstats.fetchers._commons import Series, update_series_list_unit
-
-@timeit("async.concurrent_futures.Series.update_series_list.execute", stats_only=True)
-def bulk_execute(bulk_requests):
-    try:
-        bulk_requests.execute()
-    except pymongo.errors.BulkWriteError as err:
-        logger.critical(str(err.details))
-        raise
+def split_batch(batch, count):
+    """Split batch in count chunks (or less) - the order is kept"""
+    size = max(1, -(-len(batch) // max(1, count)))
+    return [batch[i:i + size] for i in range(0, len(batch), size)]
 
 class AsyncSeries(Series):
+    """Run the CPU part of update_series_list in a pool of threads"""
     
-    @timeit("async.concurrent_futures.Series.update_series_list", stats_only=True)
-    def update_series_list(self):
-        
-        keys = [s['key'] for s in self.series_list]
-    
-        query = {
-            'provider_name': self.provider_name,
-            'dataset_code': self.dataset_code,
-            'key': {'$in': keys}
-        }
-        projection = {"tags": False}
-    
-        db = self.get_db()
-        cursor = db[constants.COL_SERIES].find(query, projection)
+    executor_klass = concurrent.futures.ThreadPoolExecutor
     
-        old_series = {s['key']:s for s in cursor}
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.executor = None
     
-        bulk_insert = []
-        bulk_update = []
+    def get_max_workers(self):
+        return self.fetcher.pool_size
         
-        with concurrent.futures.ThreadPoolExecutor(max_workers=self.fetcher.pool_size) as executor:
-                
-            tasks = []    
-            for data in self.series_list:
-                tasks.append(executor.submit(update_series_list_unit, 
-                                             data, 
-                                             old_series=old_series, 
-                                             last_update=self.last_update, 
-                                             provider_name=self.provider_name, 
-                                             dataset_code=self.dataset_code))
-            
-            for future in concurrent.futures.as_completed(tasks):
-                try:
-                    result = future.result()
-                    if not result:
-                        continue
-                    
-                    _insert, _update = result
-                    if _insert:
-                        bulk_insert.append(_insert)
-                        self.count_inserts += 1
-                    elif _update:
-                        bulk_update.append(_update)
-                        self.count_updates += 1
-                except Exception as err:
-                    self.count_errors += 1
-                    logger.critical(last_error())
-    
-        result = None        
-        if len(bulk_insert) + len(bulk_update) > 0:
-    
-            bulk_requests = db[constants.COL_SERIES].initialize_unordered_bulk_op()
-            
-            for bulk in bulk_insert:
-                bulk_requests.insert(bulk)
+    def get_executor(self):
+        if not self.executor:
+            self.executor = self.executor_klass(max_workers=self.get_max_workers())
+        return self.executor
+
+    def shutdown(self):
+        if self.executor:
+            self.executor.shutdown(wait=True)
+            self.executor = None
             
-            for bulk in bulk_update:
-                bulk_requests.find(bulk[0]).update_one(bulk[1])
-                
-            bulk_execute(bulk_requests) 
-            
-        self.series_list = deque()
-        return result
-    
-    
+    def process_series_data(self):
+        try:
+            return super().process_series_data()
+        finally:
+            self.shutdown()
+    
+    @timeit("async.concurrent_futures.Series.process_series_batch", stats_only=True)
+    def process_series_batch(self, batch):
+        executor = self.get_executor()
+        chunks = split_batch(batch, self.get_max_workers())
+        kwargs = self.get_unit_kwargs()
+        futures = [executor.submit(series_update_batch, chunk, **kwargs) 
+                   for chunk in chunks]
+        results = []
+        for future in futures:
+            results.extend(future.result())
+        return results
@@ -0,0 +1,27 @@
+
+import os
+import logging
+import concurrent.futures
+
+from widukind_common.debug import timeit
+
+from ._concurrent_futures import AsyncSeries
+
+logger = logging.getLogger(__name__)
+
+class MPSeries(AsyncSeries):
+    """Run the CPU part of update_series_list in a pool of processes
+    
+    The series are sent by chunks (one by worker) and the results are 
+    returned in the order of the series. The main process does only the 
+    MongoDB I/O.
+    """
+    
+    executor_klass = concurrent.futures.ProcessPoolExecutor
+
+    def get_max_workers(self):
+        return min(self.fetcher.pool_size or 1, os.cpu_count() or 1)
+
+    @timeit("async.multiprocessing.Series.process_series_batch", stats_only=True)
+    def process_series_batch(self, batch):
+        return super().process_series_batch(batch)
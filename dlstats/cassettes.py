@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+
+"""HTTP record/replay of the fetcher runs (cassettes)
+
+A cassette is a zip archive with the HTTP exchanges of one or more runs:
+
+- index.json : one entry by response - {"method", "url", "body", "status",
+  "reason", "headers", "elapsed", "content"}
+- contents/<sha1> : the decoded response bodies (deflate), stored once by
+  content
+
+The exchanges are recorded or replayed by a requests transport adapter
+(:class:`CassetteAdapter`) mounted on the sessions of the fetchers and on
+the HTTP client of the Downloader, so the fetchers are not changed:
+
+- record: the request is sent, the body is read and stored and the response
+  is served from the stored body
+- replay: the response is built from the cassette without network. A request
+  not found in the cassette raises :class:`CassetteMissing` (a
+  requests ConnectionError). The responses are served at disk speed or with
+  a latency (fixed or the recorded time of the request).
+
+The same request (method, url and body) recorded several times is replayed
+in the recorded order (the last response is repeated).
+
+>>> configure_cassette(path="/tmp/bis.zip", mode=MODE_RECORD)
+>>> # dlstats fetchers run -f BIS -S --cassette /tmp/bis.zip --cassette-mode record
+"""
+
+import io
+import time
+import json
+import hashlib
+import logging
+import zipfile
+import threading
+from collections import OrderedDict
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.response import HTTPResponse
+
+logger = logging.getLogger(__name__)
+
+MODE_RECORD = "record"
+MODE_REPLAY = "replay"
+
+MODES = [MODE_RECORD, MODE_REPLAY]
+
+LATENCY_RECORDED = "recorded"
+
+INDEX_NAME = "index.json"
+
+CONTENTS_PATH = "contents"
+
+# not valid for the decoded body
+EXCLUDE_HEADERS = ["content-encoding", "content-length", "transfer-encoding"]
+
+cassette = None
+
+class CassetteMissing(requests.exceptions.ConnectionError):
+    """Request not recorded in the cassette (replay mode)"""
+
+def get_body_hash(body):
+    """sha1 of the body of a request - None if not body"""
+    if not body:
+        return None
+    if isinstance(body, str):
+        body = body.encode("utf-8")
+    if not isinstance(body, bytes):
+        # stream or generator: not hashable without read
+        return None
+    return hashlib.sha1(body).hexdigest()
+
+def get_request_key(method, url, body_hash=None):
+    return "%s %s %s" % (method.upper(), url, body_hash or "")
+
+class Cassette(object):
+
+    def __init__(self, path=None, mode=MODE_REPLAY, latency=None):
+        """
+        :param str path: Zip archive of the cassette
+        :param str mode: record or replay
+        :param latency: Delay before each replayed response - None for disk speed,
+                        seconds (float) or "recorded" for the time of the recorded request
+        """
+        if not mode in MODES:
+            raise ValueError("not valid cassette mode [%s]" % mode)
+
+        self.path = path
+        self.mode = mode
+        self.latency = latency
+        self.entries = OrderedDict()
+        self.positions = {}
+        self.count_records = 0
+        self.count_replays = 0
+        self.count_missing = 0
+        self._lock = threading.Lock()
+        self._zip = None
+
+        if self.mode == MODE_REPLAY:
+            self._zip = zipfile.ZipFile(self.path, mode="r")
+            for entry in json.loads(self._zip.read(INDEX_NAME).decode("utf-8")):
+                key = get_request_key(entry["method"], entry["url"], entry.get("body"))
+                self.entries.setdefault(key, []).append(entry)
+        else:
+            self._zip = zipfile.ZipFile(self.path, mode="w",
+                                        compression=zipfile.ZIP_DEFLATED)
+            self._contents = set()
+
+    @property
+    def is_recording(self):
+        return self.mode == MODE_RECORD
+
+    def record(self, request, status, reason, headers, content, elapsed):
+        """Store one exchange - return the entry"""
+        name = "%s/%s" % (CONTENTS_PATH, hashlib.sha1(content).hexdigest())
+        headers = dict((k, v) for k, v in headers.items()
+                       if not k.lower() in EXCLUDE_HEADERS)
+        body_hash = get_body_hash(request.body)
+        entry = {"method": request.method,
+                 "url": request.url,
+                 "body": body_hash,
+                 "status": status,
+                 "reason": reason,
+                 "headers": headers,
+                 "elapsed": round(elapsed, 3),
+                 "content": name}
+        key = get_request_key(request.method, request.url, body_hash)
+        with self._lock:
+            if not name in self._contents:
+                self._zip.writestr(name, content)
+                self._contents.add(name)
+            self.entries.setdefault(key, []).append(entry)
+            self.count_records += 1
+        return entry
+
+    def lookup(self, request):
+        """Recorded entry of the request - None if not found"""
+        key = get_request_key(request.method, request.url,
+                              get_body_hash(request.body))
+        with self._lock:
+            entries = self.entries.get(key)
+            if not entries:
+                self.count_missing += 1
+                return None
+            position = self.positions.get(key, 0)
+            self.positions[key] = position + 1
+            self.count_replays += 1
+            return entries[min(position, len(entries) - 1)]
+
+    def read_content(self, entry):
+        with self._lock:
+            return self._zip.read(entry["content"])
+
+    def get_delay(self, entry):
+        if not self.latency:
+            return 0
+        if self.latency == LATENCY_RECORDED:
+            return entry.get("elapsed") or 0
+        return float(self.latency)
+
+    def close(self):
+        with self._lock:
+            if not self._zip:
+                return
+            if self.is_recording:
+                index = [entry for entries in self.entries.values() for entry in entries]
+                self._zip.writestr(INDEX_NAME, json.dumps(index).encode("utf-8"))
+            self._zip.close()
+            self._zip = None
+        logger.info("cassette[%s] closed - mode[%s] - records[%s] - replays[%s] - missing[%s]" % (
+                    self.path, self.mode, self.count_records, self.count_replays,
+                    self.count_missing))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+class CassetteAdapter(HTTPAdapter):
+    """Transport adapter of requests for record or replay the exchanges
+
+    The body is read at once in record mode (not streamed to the caller).
+    """
+
+    def __init__(self, cassette, **kwargs):
+        self.cassette = cassette
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if self.cassette.is_recording:
+            start = time.time()
+            response = super().send(request, **kwargs)
+            content = response.content
+            entry = self.cassette.record(request, response.status_code,
+                                         response.reason, response.headers,
+                                         content, time.time() - start)
+            response.close()
+        else:
+            entry = self.cassette.lookup(request)
+            if not entry:
+                raise CassetteMissing("not recorded request [%s %s]" % (request.method,
+                                                                        request.url),
+                                      request=request)
+            content = self.cassette.read_content(entry)
+            delay = self.cassette.get_delay(entry)
+            if delay:
+                time.sleep(delay)
+
+        headers = dict(entry["headers"])
+        headers["Content-Length"] = str(len(content))
+        raw = HTTPResponse(body=io.BytesIO(content),
+                           headers=headers,
+                           status=entry["status"],
+                           reason=entry["reason"],
+                           preload_content=False,
+                           decode_content=False)
+        return self.build_response(request, raw)
+
+def get_adapter(**kwargs):
+    """HTTPAdapter of the sessions - CassetteAdapter if a cassette is configured"""
+    if cassette:
+        return CassetteAdapter(cassette, **kwargs)
+    return HTTPAdapter(**kwargs)
+
+def mount_cassette(session, **kwargs):
+    """Mount the configured cassette (if any) on the session - return session"""
+    if cassette:
+        adapter = CassetteAdapter(cassette, **kwargs)
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+    return session
+
+def configure_cassette(**kwargs):
+    global cassette
+    remove_cassette()
+    cassette = Cassette(**kwargs)
+    return cassette
+
+def remove_cassette():
+    """Close and remove the configured cassette"""
+    global cassette
+    if cassette:
+        cassette.close()
+    cassette = None
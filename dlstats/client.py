@@ -77,6 +77,44 @@ opt_requests_cache_expire = click.option('--requests-cache-expire',
                                 type=int, 
                                 help='Requests cache expire. default 4 hours. 0 for disabled')
 
+opt_artifacts_path = click.option('--artifacts-path', 
+                               type=click.Path(exists=False),
+                               help='Path for the shared store of downloaded files. Disabled if not set')
+
+opt_artifacts_max_size = click.option('--artifacts-max-size', 
+                                default=10 * 1024, 
+                                type=int, 
+                                show_default=True,
+                                help='Max size of the artifacts store (MB). 0 for unlimited')
+
+opt_artifacts_max_age = click.option('--artifacts-max-age', 
+                                default=60 * 60 * 24, 
+                                type=int, 
+                                show_default=True,
+                                help='Max age of the stored files (seconds). 0 for unlimited')
+
+def _validate_cassette_latency(ctx, param, value):
+    if value is None or value == "recorded":
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        raise click.BadParameter('seconds or "recorded"')
+
+opt_cassette_path = click.option('--cassette', 'cassette_path',
+                               type=click.Path(exists=False, dir_okay=False),
+                               help='HTTP cassette (zip archive) for record or replay the requests. Disabled if not set')
+
+opt_cassette_mode = click.option('--cassette-mode', 
+                               type=click.Choice(["record", "replay"]),
+                               default="replay", 
+                               show_default=True,
+                               help='Record the requests in the cassette or replay the cassette without network')
+
+opt_cassette_latency = click.option('--cassette-latency', 
+                               callback=_validate_cassette_latency,
+                               help='Delay of the replayed responses: seconds or "recorded". Disk speed if not set')
+
 cmd_folder = os.path.abspath(
                     os.path.join(os.path.dirname(__file__), 'commands'))
 
@@ -90,6 +128,9 @@ class Context(object):
                  cache_enable=False,  
                  requests_cache_enable=None, requests_cache_path=None, 
                  requests_cache_expire=None,               
+                 artifacts_path=None, artifacts_max_size=None,
+                 artifacts_max_age=None,
+                 cassette_path=None, cassette_mode=None, cassette_latency=None,
                  debug=False, silent=False, pretty=False, quiet=False):
 
         self.mongo_url = mongo_url
@@ -106,6 +147,14 @@ class Context(object):
         self.requests_cache_path = requests_cache_path
         self.requests_cache_expire = requests_cache_expire
         
+        self.artifacts_path = artifacts_path
+        self.artifacts_max_size = artifacts_max_size
+        self.artifacts_max_age = artifacts_max_age
+        
+        self.cassette_path = cassette_path
+        self.cassette_mode = cassette_mode
+        self.cassette_latency = cassette_latency
+        
         self.log_level = log_level
         self.log_config = log_config
         self.log_file = log_file
@@ -133,6 +182,12 @@ class Context(object):
         if self.requests_cache_enable:
             self._set_requests_cache()
             
+        if self.artifacts_path:
+            self._set_artifacts()
+            
+        if self.cassette_path:
+            self._set_cassette()
+            
         if self.trace:
             from widukind_common import debug
             debug.TRACE_ENABLE = True
@@ -149,6 +204,25 @@ class Context(object):
         from dlstats import cache
         cache.configure_cache(cache_url=CACHE_URL)
             
+    def _set_artifacts(self):
+        from dlstats import artifacts
+        kwargs = {"root": self.artifacts_path}
+        if self.artifacts_max_size is not None:
+            kwargs["max_size"] = self.artifacts_max_size * 1024 * 1024
+        if self.artifacts_max_age is not None:
+            kwargs["max_age"] = self.artifacts_max_age
+        artifacts.configure_artifacts(**kwargs)
+        self.log("Use artifacts store in %s" % self.artifacts_path)
+            
+    def _set_cassette(self):
+        from dlstats import cassettes
+        cassettes.configure_cassette(path=self.cassette_path,
+                                     mode=self.cassette_mode or cassettes.MODE_REPLAY,
+                                     latency=self.cassette_latency)
+        atexit.register(cassettes.remove_cassette)
+        self.log("Use HTTP cassette %s - mode %s" % (self.cassette_path, 
+                                                     cassettes.cassette.mode))
+            
     def _set_requests_cache(self):
 
         cache_settings = {
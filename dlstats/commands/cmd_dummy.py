@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import time
+
+import click
+
+from dlstats import client
+from dlstats import constants
+from dlstats.fetchers.dummy import DUMMY, SyntheticDataset, SyntheticServer
+
+SYNTHETIC_OPTIONS = ["dataset", "series_count", "obs_count", "frequencies",
+                     "dimensions", "revision_rate", "attribute_density",
+                     "seed", "release"]
+
+def parse_pairs(values, convert=int):
+    """"A:1,Q:2" -> [("A", 1), ("Q", 2)]"""
+    pairs = []
+    if not values:
+        return pairs
+    for value in values.split(","):
+        if not ":" in value:
+            raise click.BadParameter("not valid value [%s] - example: A:1,Q:2" % value)
+        key, number = value.split(":", 1)
+        pairs.append((key.strip(), convert(number)))
+    return pairs
+
+def opt_synthetic(func):
+    options = [
+        click.option('--dataset', '-d', default="synthetic", show_default=True,
+                     help='Dataset code'),
+        click.option('--series', '-n', 'series_count', default=1000, type=int,
+                     show_default=True, help='Number of series'),
+        click.option('--obs', '-m', 'obs_count', default=20, type=int,
+                     show_default=True, help='Observations by series'),
+        click.option('--frequencies', default="A:1", show_default=True,
+                     help='Weight by frequency. Example: A:1,Q:2,M:1'),
+        click.option('--dimensions',
+                     help='Cardinality by dimension. Example: COUNTRY:50,INDICATOR:200'),
+        click.option('--revision-rate', default=0.1, type=float,
+                     show_default=True, help='Rate of the series revised by release'),
+        click.option('--attribute-density', default=0.1, type=float,
+                     show_default=True, help='Rate of the observations with an attribute'),
+        click.option('--seed', default=0, type=int, show_default=True,
+                     help='Seed of the generator'),
+        click.option('--release', default=0, type=int, show_default=True,
+                     help='Release of the dataset (0: first release)'),
+    ]
+    for option in reversed(options):
+        func = option(func)
+    return func
+
+def build_synthetic(dataset, series_count, obs_count, frequencies, dimensions,
+                    revision_rate, attribute_density, seed, release):
+    try:
+        return SyntheticDataset(dataset,
+                                series_count=series_count,
+                                obs_count=obs_count,
+                                frequencies=dict(parse_pairs(frequencies)),
+                                dimensions=parse_pairs(dimensions) or None,
+                                revision_rate=revision_rate,
+                                attribute_density=attribute_density,
+                                seed=seed,
+                                release=release)
+    except ValueError as err:
+        raise click.BadParameter(str(err))
+
+@click.group()
+def cli():
+    """Synthetic datasets commands (load tests)."""
+    pass
+
+@cli.command('run', context_settings=client.DLSTATS_SETTINGS)
+@client.opt_verbose
+@client.opt_silent
+@client.opt_quiet
+@client.opt_debug
+@client.opt_logger
+@client.opt_logger_conf
+@client.opt_logger_file
+@client.opt_mongo_url
+@opt_synthetic
+@click.option('--http', is_flag=True,
+              help='Read the series as csv file from a local HTTP server')
+@click.option('--bulk-size', '-B', default=200, type=int,
+              show_default=True, help='Bulk size for batch mode.')
+@click.option('--initial-load', is_flag=True,
+              help="Load all the datasets - insert the series without search the old series for the datasets without series")
+def cmd_run(http=False, bulk_size=200, initial_load=False, **kwargs):
+    """Load a synthetic dataset in the DUMMY provider
+
+    Examples:
+
+    dlstats dummy run -n 100000 -m 40 --frequencies A:1,Q:2,M:1 -S
+    dlstats dummy run -n 100000 -m 40 --frequencies A:1,Q:2,M:1 --release 1 -S
+    dlstats dummy run -n 1000000 --dimensions COUNTRY:200,INDICATOR:5000 --http -S
+    """
+
+    synthetic = build_synthetic(**dict((key, kwargs.pop(key)) for key in SYNTHETIC_OPTIONS))
+
+    ctx = client.Context(**kwargs)
+
+    ctx.log_ok("Load %s series of %s observations in DUMMY.%s (release %s):" % (
+               synthetic.series_count, synthetic.obs_count,
+               synthetic.dataset_code, synthetic.release))
+
+    if ctx.silent or click.confirm('Do you want to continue?', abort=True):
+
+        db = ctx.mongo_database()
+        server = None
+        if http:
+            server = SyntheticServer([synthetic]).start()
+
+        try:
+            fetcher = DUMMY(db=db, datasets=[synthetic],
+                            base_url=server and server.url,
+                            bulk_size=bulk_size,
+                            initial_load=initial_load or None)
+            start = time.time()
+            fetcher.wrap_upsert_dataset(synthetic.dataset_code)
+            duration = time.time() - start
+        finally:
+            if server:
+                server.stop()
+
+        query = {"provider_name": fetcher.provider_name,
+                 "dataset_code": synthetic.dataset_code}
+        count = db[constants.COL_SERIES].count(query)
+        ctx.log_ok("dummy run END: series[%s] - time[%.3f] - series/s[%.1f]" % (
+                   count, duration, synthetic.series_count / duration if duration else 0))
+
+@cli.command('serve', context_settings=client.DLSTATS_SETTINGS)
+@client.opt_verbose
+@client.opt_debug
+@client.opt_logger
+@client.opt_logger_conf
+@opt_synthetic
+@click.option('--host', default="127.0.0.1", show_default=True, help='Listen address')
+@click.option('--port', '-P', default=8080, type=int, show_default=True, help='Listen port')
+def cmd_serve(host="127.0.0.1", port=8080, **kwargs):
+    """Serve a synthetic dataset as csv and SDMX-ML files
+
+    GET /<dataset>.csv or /<dataset>.xml - ?release=N for another release
+
+    Examples:
+
+    dlstats dummy serve -n 100000 --frequencies A:1,M:3 -P 8080
+    """
+
+    synthetic = build_synthetic(**dict((key, kwargs.pop(key)) for key in SYNTHETIC_OPTIONS))
+
+    ctx = client.Context(**kwargs)
+
+    with SyntheticServer([synthetic], host=host, port=port) as server:
+        ctx.log_ok("serve %s/%s.csv and %s/%s.xml - Ctrl+C for stop" % (
+                   server.url, synthetic.dataset_code, server.url, synthetic.dataset_code))
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            pass
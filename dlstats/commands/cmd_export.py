@@ -5,6 +5,8 @@ import click
 from widukind_common.tasks import export_files
 
 from dlstats import client
+from dlstats import constants
+from dlstats import export
 from dlstats.fetchers import FETCHERS
 
 opt_provider = click.option('--provider', '-p', 
@@ -85,3 +87,77 @@ def cmd_export_csvfile(provider=None, dataset=None, filepath=None,
                     fp.write(row)
         else:
             ctx.log_error("file not found: %s" % filename)
+
+@cli.command('series', context_settings=client.DLSTATS_SETTINGS)
+@client.opt_verbose
+@client.opt_silent
+@client.opt_debug
+@client.opt_logger
+@client.opt_logger_conf
+@client.opt_mongo_url
+@opt_provider
+@click.option('--dataset', '-d', 
+              required=False, multiple=True,
+              help='Export selected dataset(s) only. All datasets if not set')
+@click.option('--format', '-t', 'export_format', 
+              type=click.Choice(export.EXPORT_FORMATS),
+              default=export.EXPORT_CSV_LONG,
+              show_default=True, 
+              help='Export format')
+@click.option('--output-dir', '-o', 
+              type=click.Path(exists=False, file_okay=False),
+              default=".",
+              show_default=True, 
+              help='Directory for export files')
+@click.option('--dimension', '-D', 
+              multiple=True,
+              help='Dimension filter. Example: -D country=fra -D country=deu')
+@click.option('--frequency', '-F', 
+              required=False, 
+              type=click.Choice(list(constants.FREQUENCIES_DICT.keys())), 
+              help='Frequency filter')
+@click.option('--batch-size', '-B', default=export.DEFAULT_BATCH_SIZE, type=int, 
+              show_default=True, help='Number of series by MongoDB batch.')
+@click.option('--workers', '-w', default=1, type=int, 
+              show_default=True, help='Datasets exported in parallel.')
+def cmd_export_series(provider=None, dataset=None, export_format=None, 
+                      output_dir=None, dimension=None, frequency=None, 
+                      batch_size=None, workers=1, **kwargs):
+    """Export series directly from MongoDB. 
+
+    One file by dataset is created in output directory.
+
+    Examples:
+    
+    dlstats export series -p Eurostat -d nama_10_a10 -t csv-wide -S
+    dlstats export series -p BIS -t parquet -o /tmp/bis -w 4 -S
+    dlstats export series -p ECB -d EXR -D currency=usd -F M -S
+    """
+
+    ctx = client.Context(**kwargs)
+
+    if ctx.silent or click.confirm('Do you want to continue?', abort=True):
+
+        db = ctx.mongo_database()
+        
+        try:
+            dimensions = export.parse_dimensions_filter(dimension)
+        except ValueError as err:
+            ctx.log_error(str(err))
+            return
+
+        results = export.export_datasets(db, provider, 
+                                         dataset_codes=list(dataset),
+                                         output_dir=output_dir,
+                                         export_format=export_format,
+                                         max_workers=workers,
+                                         dimensions=dimensions,
+                                         frequency=frequency,
+                                         batch_size=batch_size)
+        
+        for dataset_code in sorted(results.keys()):
+            filepath, result = results[dataset_code]
+            if isinstance(result, Exception):
+                ctx.log_error("export error for dataset[%s]: %s" % (dataset_code, str(result)))
+            else:
+                ctx.log_ok("export to %s - rows[%s]" % (filepath, result))
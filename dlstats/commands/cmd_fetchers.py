@@ -9,11 +9,16 @@ from widukind_common.tasks import consolidate
 from widukind_common import errors
 
 from dlstats import constants
+from dlstats import stats
+from dlstats import purge
+from dlstats import orchestrator
 from dlstats.fetchers import FETCHERS
 from dlstats import client
 from dlstats.utils import last_error
 
-async_frameworks = ["future"]#, "gevent", "mp", "tornado"]
+async_frameworks = ["future", "mp"]#, "gevent", "tornado"]
+
+tags_async_frameworks = ["future"]
 
 opt_fetcher = click.option('--fetcher', '-f', 
               required=True, type=click.Choice(FETCHERS.keys()), 
@@ -35,6 +40,10 @@ opt_async_mode = click.option('--async-mode',
               type=click.Choice(async_frameworks), 
               help='Async mode choice')
 
+opt_tags_async_mode = click.option('--async-mode', 
+              type=click.Choice(tags_async_frameworks), 
+              help='Async mode choice')
+
 def _consolidate(ctx, db, fetcher, dataset=None, max_bulk=20):
 
     start = time.time()
@@ -59,7 +68,12 @@ def _consolidate(ctx, db, fetcher, dataset=None, max_bulk=20):
     
     ctx.log("consolidate - END for [%s] - time[%.3f]" % (fetcher, end))
 
-def _update_tags(ctx, db, provider_name, dataset=None, max_bulk=100, update_only=False, dry_mode=False, async_mode=None):
+def _update_tags(ctx, db, provider_name, dataset=None, max_bulk=100, update_only=False, dry_mode=False, async_mode=None, 
+                 series=True):
+    """Update tags of datasets and series (if series is True)
+
+    The tags of series are generated during the run (Series.update_series_list). 
+    """
         
     start = time.time()
 
@@ -77,6 +91,11 @@ def _update_tags(ctx, db, provider_name, dataset=None, max_bulk=100, update_only
     except Exception as err:
         ctx.log_error("Update Datasets tags Fail - provider[%s] - [%s]" % (provider_name, str(err)))
 
+    if not series:
+        end = time.time() - start
+        ctx.log("update tags END: provider[%s] - time[%.3f]" % (provider_name, end))
+        return
+
     ctx.log("Update provider[%s] Series tags..." % provider_name)
     try:
         result = tags.update_tags_series(db,
@@ -155,6 +174,12 @@ def cmd_dataset_list(fetcher, **kwargs):
 @client.opt_requests_cache_enable
 @client.opt_requests_cache_path
 @client.opt_requests_cache_expire
+@client.opt_artifacts_path
+@client.opt_artifacts_max_size
+@client.opt_artifacts_max_age
+@client.opt_cassette_path
+@client.opt_cassette_mode
+@client.opt_cassette_latency
 @click.option('--use-files', is_flag=True,
               help='Use existing files in tmpdir')
 @click.option('--not-remove', is_flag=True,
@@ -275,6 +300,12 @@ def cmd_calendar(fetcher=None, update=False, **kwargs):
 @client.opt_requests_cache_enable
 @client.opt_requests_cache_path
 @client.opt_requests_cache_expire
+@client.opt_artifacts_path
+@client.opt_artifacts_max_size
+@client.opt_artifacts_max_age
+@client.opt_cassette_path
+@client.opt_cassette_mode
+@client.opt_cassette_latency
 @click.option('--max-errors', '-M', default=5, type=int, 
               show_default=True, help='Max errors accepted.')
 @click.option('--datatree', is_flag=True,
@@ -284,7 +315,7 @@ def cmd_calendar(fetcher=None, update=False, **kwargs):
 @click.option('--not-remove', is_flag=True,
               help='Not remove files after process')
 @click.option('--run-full', is_flag=True,
-              help='Run tags and consolidate command after run')
+              help='Run consolidate and datasets tags commands after run')
 @click.option('--dataset-only', is_flag=True,
               help='Load or update dataset only (not series)')
 @click.option('--refresh-meta', is_flag=True,
@@ -293,6 +324,10 @@ def cmd_calendar(fetcher=None, update=False, **kwargs):
 @click.option('--bulk-size', '-B', default=200, type=int, 
               show_default=True, help='Bulk size for batch mode.')
 @click.option('--force-update', is_flag=True, help="Force update")
+@click.option('--initial-load', is_flag=True, 
+              help="Load all the datasets - insert the series without search the old series for the datasets without series")
+@click.option('--defer-indexes', is_flag=True, 
+              help="Drop the secondary indexes of series during the first load of a provider and rebuild them at the end (only if the series of the other providers are not in DB)")
 @opt_fetcher
 @opt_async_mode
 @opt_dataset_multiple
@@ -301,7 +336,7 @@ def cmd_run(fetcher=None, dataset=None,
             async_mode=None, 
             use_files=False, not_remove=False, run_full=False,
             dataset_only=False, refresh_meta=False,
-            force_update=False, 
+            force_update=False, initial_load=False, defer_indexes=False,
             **kwargs):
     """Run Fetcher - All datasets or selected dataset"""
 
@@ -328,7 +363,9 @@ def cmd_run(fetcher=None, dataset=None,
                                       dataset_only=dataset_only,
                                       refresh_meta=refresh_meta,
                                       async_mode=async_mode,
-                                      force_update=force_update)
+                                      force_update=force_update,
+                                      initial_load=initial_load or None,
+                                      defer_indexes=defer_indexes)
                 
                 if not dataset and not hasattr(f, "upsert_all_datasets"):
                     ctx.log_error("upsert_all_datasets method is not implemented for this fetcher.")
@@ -344,17 +381,101 @@ def cmd_run(fetcher=None, dataset=None,
                         f.wrap_upsert_dataset(ds)
                         if run_full:
                             _consolidate(ctx, db, fetcher, dataset=ds)
-                            _update_tags(ctx, db, fetcher, dataset=ds, update_only=True)
+                            _update_tags(ctx, db, fetcher, dataset=ds, update_only=True, series=False)
                 else:
                     f.upsert_all_datasets()
                     if run_full:
                         _consolidate(ctx, db, fetcher)
-                        _update_tags(ctx, db, fetcher, update_only=True)
+                        _update_tags(ctx, db, fetcher, update_only=True, series=False)
                 
         except errors.Locked as err:
             ctx.log_error("run command is locked for key[%s]" % lock_key)
             return False
 
+@cli.command('run-all', context_settings=client.DLSTATS_SETTINGS)
+@client.opt_verbose
+@client.opt_silent
+@client.opt_quiet
+@client.opt_debug
+@client.opt_logger
+@client.opt_logger_conf
+@client.opt_logger_file
+@client.opt_mongo_url
+@client.opt_artifacts_path
+@client.opt_artifacts_max_size
+@client.opt_artifacts_max_age
+@client.opt_cassette_path
+@client.opt_cassette_mode
+@client.opt_cassette_latency
+@click.option('--fetcher', '-f', 
+              required=False, multiple=True, 
+              type=click.Choice(FETCHERS.keys()), 
+              help='Run selected fetcher(s) only. All fetchers if not set')
+@click.option('--max-providers', '-P', default=orchestrator.DEFAULT_MAX_PROVIDERS, type=int, 
+              show_default=True, help='Providers running at the same time.')
+@click.option('--max-per-host', default=orchestrator.DEFAULT_MAX_PER_HOST, type=int, 
+              show_default=True, help='Max concurrent HTTP requests by host (0: unlimited).')
+@click.option('--max-memory', default=0, type=int, 
+              show_default=True, help='No new provider started above this memory (MB - 0: unlimited).')
+@click.option('--max-errors', '-M', default=5, type=int, 
+              show_default=True, help='Max errors accepted.')
+@click.option('--bulk-size', '-B', default=200, type=int, 
+              show_default=True, help='Bulk size for batch mode.')
+@opt_async_mode
+def cmd_run_all(fetcher=None, max_providers=orchestrator.DEFAULT_MAX_PROVIDERS,
+                max_per_host=orchestrator.DEFAULT_MAX_PER_HOST, max_memory=0,
+                max_errors=5, bulk_size=200, async_mode=None, **kwargs):
+    """Run all datasets of several fetchers in one process
+
+    Examples:
+
+    dlstats fetchers run-all -S
+    dlstats fetchers run-all -f BIS -f ECB -f INSEE -P 3 --max-per-host 2 -S
+    """
+
+    ctx = client.Context(**kwargs)
+
+    providers = list(fetcher) or FETCHERS.available()
+
+    ctx.log_ok("Run %s fetchers:" % ", ".join(providers))
+
+    if ctx.silent or click.confirm('Do you want to continue?', abort=True):
+
+        db = ctx.mongo_database()
+
+        runner = orchestrator.Orchestrator(db, providers,
+                                           max_providers=max_providers,
+                                           max_per_host=max_per_host,
+                                           max_memory=max_memory * 1024 * 1024 or None,
+                                           lock=lambda key: ctx.lock(key, "run"),
+                                           fetcher_kwargs={"max_errors": max_errors,
+                                                           "bulk_size": bulk_size,
+                                                           "async_mode": async_mode})
+        results, summary = runner.run()
+
+        fmt = "{0:10} | {1:7} | {2:>8} | {3:>10} | {4:>10} | {5:>10} | {6:>10}"
+        print("---------------------------------------------------------------------------------------------")
+        print(fmt.format("Provider", "Status", "Datasets", "Accepts", "Inserts", "Updates", "Time (s)"))
+        print("---------------------------------------------------------------------------------------------")
+        for result in sorted(results, key=itemgetter("provider_name")):
+            print(fmt.format(result["provider_name"], result["status"], 
+                             result["datasets"], result["count_accepts"],
+                             result["count_inserts"], result["count_updates"],
+                             "%.1f" % result["duration"]))
+        print("---------------------------------------------------------------------------------------------")
+        print(fmt.format("TOTAL", summary["errors"] and "error" or "ok", 
+                         summary["datasets"], summary["count_accepts"],
+                         summary["count_inserts"], summary["count_updates"],
+                         "%.1f" % summary["duration"]))
+        print("---------------------------------------------------------------------------------------------")
+
+        msg = "run-all END: providers[%s] - errors[%s] - time[%.3f] - sum of times[%.3f] - series/s[%.1f]"
+        ctx.log_ok(msg % (summary["providers"], summary["errors"], summary["duration"],
+                          summary["sum_durations"], summary["series_by_second"]))
+        for result in results:
+            if result["error"]:
+                ctx.log_error("provider[%s] error: %s" % (result["provider_name"], result["error"]))
+
 #TODO: multi include/exclude fetcher        
 #TODO: options sort by: series, provider, dataset + asc/desc
 #TODO: categories
@@ -378,22 +499,26 @@ def cmd_report(fetcher=None, **kwargs):
     """
     ctx = client.Context(**kwargs)
     db = ctx.mongo_database()
-    fmt = "{0:10} | {1:4} | {2:30} | {3:10} | {4:15} | {5:20} | {6:20} | {7:7}"
-    print("----------------------------------------------------------------------------------------------------------------------------------------")
+    fmt = "{0:10} | {1:4} | {2:30} | {3:10} | {4:12} | {5:15} | {6:20} | {7:20} | {8:7}"
+    print("-----------------------------------------------------------------------------------------------------------------------------------------------------")
     print("MongoDB: %s :" % ctx.mongo_url)
-    print("----------------------------------------------------------------------------------------------------------------------------------------")
-    print(fmt.format("Provider", "Ver.", "Dataset", "Series", "Last Update", "First Download", "last Download", "Enable"))
-    print("----------------------------------------------------------------------------------------------------------------------------------------")
+    print("-----------------------------------------------------------------------------------------------------------------------------------------------------")
+    print(fmt.format("Provider", "Ver.", "Dataset", "Series", "Obs.", "Last Update", "First Download", "last Download", "Enable"))
+    print("-----------------------------------------------------------------------------------------------------------------------------------------------------")
     query = {}
     if fetcher:
         query["name"] = fetcher
+    
+    datasets_stats = stats.get_datasets_stats(db, provider_name=fetcher)
         
     for provider in db[constants.COL_PROVIDERS].find(query):
         
-        for dataset in db[constants.COL_DATASETS].find({'provider_name': provider['name']}).sort("dataset_code"):
+        projection = {"codelists": False, "concepts": False, "metadata": False}
+        for dataset in db[constants.COL_DATASETS].find({'provider_name': provider['name']}, projection).sort("dataset_code"):
             
-            series_count = db[constants.COL_SERIES].count({'provider_name': provider['name'], 
-                                                           "dataset_code": dataset['dataset_code']})
+            dataset_stats = datasets_stats.get((provider['name'], dataset['dataset_code']), {})
+            series_count = dataset_stats.get("series_count", "?")
+            obs_count = dataset_stats.get("obs_count", "?")
             
             if not provider['enable']:
                 _provider = "%s *" % provider['name']
@@ -404,11 +529,48 @@ def cmd_report(fetcher=None, **kwargs):
                              provider['version'], 
                              dataset['dataset_code'], 
                              series_count,
+                             obs_count,
                              str(dataset['last_update'].strftime("%Y-%m-%d")), 
                              str(dataset['download_first'].strftime("%Y-%m-%d - %H:%M")), 
                              str(dataset['download_last'].strftime("%Y-%m-%d - %H:%M")),
                              str(dataset["enable"])))
-    print("---------------------------------------------------------------------------------------------------------------------------")
+    print("-----------------------------------------------------------------------------------------------------------------------------------------------------")
+    
+@cli.command('stats-reconcile', context_settings=client.DLSTATS_SETTINGS)
+@client.opt_verbose
+@client.opt_silent
+@client.opt_quiet
+@client.opt_debug
+@client.opt_logger
+@client.opt_logger_conf
+@client.opt_mongo_url
+@opt_fetcher_not_required
+@opt_dataset
+def cmd_stats_reconcile(fetcher=None, dataset=None, **kwargs):
+    """Rebuild datasets stats from series collection"""
+    
+    """
+    dlstats fetchers stats-reconcile -f INSEE -S
+    dlstats fetchers stats-reconcile -f BIS -d CNFS -S
+    """
+
+    ctx = client.Context(**kwargs)
+
+    if ctx.silent or click.confirm('Do you want to continue?', abort=True):
+        
+        db = ctx.mongo_database()
+        
+        if fetcher:
+            fetchers = [fetcher]
+        else:
+            fetchers = FETCHERS.keys()
+            
+        for provider_name in fetchers:
+            start = time.time()
+            result = stats.reconcile_datasets_stats(db, provider_name, 
+                                                    dataset_code=dataset)
+            end = time.time() - start
+            ctx.log_ok("stats reconcile provider[%s] - datasets[%s] - time[%.3f]" % (provider_name, result, end))
 
 @cli.command('tags', context_settings=client.DLSTATS_SETTINGS)
 @client.opt_verbose
@@ -420,7 +582,7 @@ def cmd_report(fetcher=None, **kwargs):
 @client.opt_mongo_url
 @opt_fetcher_not_required
 @opt_dataset
-@opt_async_mode
+@opt_tags_async_mode
 @click.option('--max-bulk', '-M', 
               type=click.INT,
               default=100, 
@@ -471,7 +633,7 @@ def cmd_update_tags(fetcher=None, dataset=None, max_bulk=100,
 @client.opt_logger
 @client.opt_logger_conf
 @client.opt_mongo_url
-@opt_async_mode
+@opt_tags_async_mode
 @click.option('--max-bulk', '-M', 
               type=click.INT,
               default=100, 
@@ -600,7 +762,10 @@ def cmd_search(search_type=None, fetcher=None, dataset=None,
               show_default=True,
               help='Max Bulk')
 def cmd_consolidate(fetcher=None, dataset=None, max_bulk=20, **kwargs):
-    """Consolidate codelists and concepts one or more dataset"""
+    """Consolidate codelists and concepts one or more dataset
+    
+    Full scan of the series. The runs only add the codes of the changed series.
+    """
     
     ctx = client.Context(**kwargs)
 
@@ -623,13 +788,26 @@ def cmd_consolidate(fetcher=None, dataset=None, max_bulk=20, **kwargs):
 @opt_dataset_multiple
 @click.option('--purge-all', is_flag=True,
               help='Delete provider and categories')
-def cmd_purge(fetcher=None, dataset=None, purge_all=False, **kwargs):
+@click.option('--batch-size', '-B', default=purge.DEFAULT_BATCH_SIZE, type=int, 
+              show_default=True, help='Documents deleted by batch.')
+@click.option('--max-rate', default=0, type=int, 
+              show_default=True, help='Max documents deleted by second and by collection (0: unlimited).')
+@click.option('--max-lag', default=0, type=int, 
+              show_default=True, help='Wait while the replication lag (seconds) is greater (0: disable).')
+@click.option('--workers', '-w', default=len(purge.PURGE_COLLECTIONS), type=int, 
+              show_default=True, help='Collections purged in parallel.')
+@click.option('--restart', is_flag=True,
+              help='Ignore the checkpoints of an interrupted purge')
+def cmd_purge(fetcher=None, dataset=None, purge_all=False, 
+              batch_size=purge.DEFAULT_BATCH_SIZE, max_rate=0, max_lag=0,
+              workers=len(purge.PURGE_COLLECTIONS), restart=False, **kwargs):
     """Purge one or more dataset"""
     
     """
     dlstats fetchers purge -f INSEE --purge-all
     dlstats fetchers purge -f INSEE -d IPCH-2015-FR-COICOP
     dlstats fetchers purge -f INSEE -d IPCH-2015-FR-COICOP -d IPC-2015-COICOP
+    dlstats fetchers purge -f INSEE -B 5000 --max-rate 20000 --max-lag 10
     """
 
     ctx = client.Context(**kwargs)
@@ -656,23 +834,24 @@ def cmd_purge(fetcher=None, dataset=None, purge_all=False, **kwargs):
             
             ctx.log("Categories deleted: %s" % result.deleted_count)
         
-        query = {"provider_name": fetcher}
-        if not purge_all and dataset:
-            query["dataset_code"] = {"$in": dataset}
-        
-        bulk_requests = [DeleteMany(query)]
-
-        result = db[constants.COL_DATASETS].bulk_write(bulk_requests,
-                                                       ordered=False)
-        ctx.log("Datasets deleted: %s" % result.deleted_count)
-        
-        result = db[constants.COL_SERIES].bulk_write(bulk_requests,
-                                                     ordered=False)
-        ctx.log("Series deleted: %s" % result.deleted_count)
-
-        result = db[constants.COL_SERIES_ARCHIVES].bulk_write(bulk_requests,
-                                                     ordered=False)
-        ctx.log("Series archives deleted: %s" % result.deleted_count)
+        def progress(collection_name, deleted, total):
+            ctx.log_ok("purge [%s] - deleted[%s/%s]" % (collection_name, deleted, total))
+
+        engine = purge.Purge(db, fetcher,
+                             dataset_codes=None if purge_all else dataset,
+                             batch_size=batch_size,
+                             max_rate=max_rate or None,
+                             max_lag=max_lag or None,
+                             workers=workers,
+                             resume=not restart,
+                             progress=progress if ctx.verbose else None)
+        results = engine.run()
+
+        ctx.log("Datasets deleted: %s" % results[constants.COL_DATASETS])
+        ctx.log("Series deleted: %s" % results[constants.COL_SERIES])
+        ctx.log("Series archives deleted: %s" % results[constants.COL_SERIES_ARCHIVES])
+        ctx.log("Series vintages deleted: %s" % results[constants.COL_SERIES_VINTAGES])
+        ctx.log("Datasets stats deleted: %s" % results[constants.COL_DATASETS_STATS])
 
         end = time.time() - start
         
@@ -751,7 +930,7 @@ def cmd_providers(fetcher=None, **kwargs):
         if fetcher:
             _fetchers = [fetcher]
         else:
-            _fetchers = list(FETCHERS.keys())
+            _fetchers = FETCHERS.available()
                 
         for _fetcher in _fetchers:
             ctx.log("Run provider for [%s]" % _fetcher)
@@ -10,6 +10,8 @@ from widukind_common import tests_tools as utils
 
 from dlstats import constants
 from dlstats import client
+from dlstats.fetchers._commons import create_vintages_indexes
+from dlstats import values
 from dlstats.fetchers import schemas
 
 #TODO: move to schemas module
@@ -55,6 +57,7 @@ def cmd_reindex(drop_before=False, **kwargs):
 
         ctx.log("Create or update all indexes !")
         create_or_update_indexes(db)
+        create_vintages_indexes(db)
         
         if not drop_before:
             with click.progressbar(constants.COL_ALL,
@@ -99,6 +102,39 @@ def cmd_check(**kwargs):
         print("------------------------------------------------------")
         
 
+@cli.command('migrate-values', context_settings=client.DLSTATS_SETTINGS)
+@client.opt_verbose
+@client.opt_silent
+@client.opt_debug
+@client.opt_logger
+@client.opt_logger_conf
+@client.opt_mongo_url
+@click.option('--provider', '-p', required=False, help='Provider Name - all if not set')
+@click.option('--dataset', '-d', required=False, multiple=True,
+              help='Selected dataset(s) only. All datasets if not set')
+@click.option('--batch-size', '-B', default=500, type=int, 
+              show_default=True, help='Series updated by bulk.')
+@click.option('--dry-run', is_flag=True, help="Count the series only")
+def cmd_migrate_values(provider=None, dataset=None, batch_size=500, 
+                       dry_run=False, **kwargs):
+    """Convert the str values of the series to numbers and status"""
+
+    ctx = client.Context(**kwargs)
+
+    if ctx.silent or click.confirm('Do you want to continue?', abort=True):
+
+        start = time.time()
+        db = ctx.mongo_database()
+
+        count = values.migrate_series_values(db, provider_name=provider, 
+                                             dataset_codes=list(dataset),
+                                             batch_size=batch_size,
+                                             dry_run=dry_run)
+        end = time.time() - start
+
+        msg = "series to migrate" if dry_run else "series migrated"
+        ctx.log_ok("%s: %s - time[%.3f]" % (msg, count, end))
+
 #TODO: @cli.command('copydb', context_settings=client.DLSTATS_SETTINGS)
 @client.opt_verbose
 @client.opt_silent
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+import sys
+
+import click
+
+from dlstats import client
+from dlstats import constants
+from dlstats import export
+from dlstats import query
+
+QUERY_WIDE = "wide"
+QUERY_LONG = "long"
+QUERY_PARQUET = "parquet"
+
+QUERY_FORMATS = [QUERY_WIDE, QUERY_LONG, QUERY_PARQUET]
+
+@click.group()
+def cli():
+    """Read series commands."""
+    pass
+
+@cli.command('series', context_settings=client.DLSTATS_SETTINGS)
+@client.opt_verbose
+@client.opt_debug
+@client.opt_logger
+@client.opt_logger_conf
+@client.opt_mongo_url
+@click.option('--provider', '-p', required=True, help='Provider Name')
+@click.option('--dataset', '-d', required=False, help='Dataset code')
+@click.option('--key', '-k', multiple=True, help='Series key(s)')
+@click.option('--dimension', '-D',
+              multiple=True,
+              help='Dimension filter. Example: -D country=fra -D country=deu')
+@click.option('--frequency', '-F',
+              required=False,
+              type=click.Choice(list(constants.FREQUENCIES_DICT.keys())),
+              help='Frequency filter')
+@click.option('--format', '-t', 'query_format',
+              type=click.Choice(QUERY_FORMATS),
+              default=QUERY_WIDE,
+              show_default=True,
+              help='Output format')
+@click.option('--output', '-o',
+              type=click.Path(exists=False, dir_okay=False),
+              help='Output file - stdout if not set (csv only)')
+@click.option('--batch-size', '-B', default=export.DEFAULT_BATCH_SIZE, type=int,
+              show_default=True, help='Number of series by MongoDB batch.')
+def cmd_series(provider=None, dataset=None, key=None, dimension=None,
+               frequency=None, query_format=QUERY_WIDE, output=None,
+               batch_size=export.DEFAULT_BATCH_SIZE, **kwargs):
+    """Read series as a table (csv or parquet)
+
+    Examples:
+
+    dlstats query series -p ECB -d EXR -D FREQ=M -D CURRENCY=USD
+    dlstats query series -p BIS -d CNFS -k Q:AU:C:A:M:770:A -t long
+    dlstats query series -p ECB -d EXR -F M -t parquet -o /tmp/exr.parquet
+    """
+
+    ctx = client.Context(**kwargs)
+
+    try:
+        dimensions = export.parse_dimensions_filter(dimension)
+    except ValueError as err:
+        ctx.log_error(str(err))
+        return
+
+    if query_format == QUERY_PARQUET and not output:
+        ctx.log_error("--output is required for parquet format")
+        return
+
+    reader = query.SeriesReader(ctx.mongo_database(), batch_size=batch_size)
+    kwargs = dict(dataset_code=dataset, keys=list(key),
+                  dimensions=dimensions, frequency=frequency)
+
+    try:
+        if query_format == QUERY_WIDE:
+            frame = reader.dataframe(provider, **kwargs)
+            frame.to_csv(output or sys.stdout, index_label="period")
+        elif query_format == QUERY_LONG:
+            frame = reader.long_dataframe(provider, **kwargs)
+            frame.to_csv(output or sys.stdout, index=False)
+        else:
+            import pyarrow.parquet as pq
+            pq.write_table(reader.arrow_table(provider, **kwargs), output)
+    except (ValueError, ImportError) as err:
+        ctx.log_error(str(err))
+        return
+
+    if output:
+        ctx.log_ok("query to %s" % output)
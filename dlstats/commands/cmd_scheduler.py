@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+import click
+
+from dlstats import client
+from dlstats import scheduler
+from dlstats.fetchers import FETCHERS
+
+opt_fetcher_multiple = click.option('--fetcher', '-f',
+              required=False, multiple=True,
+              type=click.Choice(FETCHERS.keys()),
+              help='Schedule selected fetcher(s) only. All fetchers if not set')
+
+@click.group()
+def cli():
+    """Calendar scheduler commands."""
+    pass
+
+@cli.command('run', context_settings=client.DLSTATS_SETTINGS)
+@client.opt_verbose
+@client.opt_silent
+@client.opt_quiet
+@client.opt_debug
+@client.opt_logger
+@client.opt_logger_conf
+@client.opt_logger_file
+@client.opt_mongo_url
+@client.opt_artifacts_path
+@client.opt_artifacts_max_size
+@client.opt_artifacts_max_age
+@opt_fetcher_multiple
+@click.option('--delay', default=300, type=int, show_default=True,
+              help='Seconds between release date and first run.')
+@click.option('--max-retries', default=6, type=int, show_default=True,
+              help='Max retries if the release is not loaded.')
+@click.option('--backoff', default=600, type=int, show_default=True,
+              help='Seconds before first retry (doubled for next retries).')
+@click.option('--sweep-interval', default=7 * 24 * 3600, type=int, show_default=True,
+              help='Seconds between two runs of all datasets for fetchers without calendar.')
+@click.option('--poll-interval', default=60, type=int, show_default=True,
+              help='Seconds between two checks of the due jobs.')
+@click.option('--once', is_flag=True,
+              help='Run the due jobs and exit.')
+@click.option('--bulk-size', '-B', default=200, type=int,
+              show_default=True, help='Bulk size for batch mode.')
+def cmd_run(fetcher=None, delay=300, max_retries=6, backoff=600,
+            sweep_interval=7 * 24 * 3600, poll_interval=60, once=False, bulk_size=200,
+            **kwargs):
+    """Run datasets after the releases of the calendars
+
+    Examples:
+
+    dlstats scheduler run -S
+    dlstats scheduler run -f BIS -f ECB --delay 600 -S
+    dlstats scheduler run --once -S
+    """
+
+    ctx = client.Context(**kwargs)
+
+    if ctx.silent or click.confirm('Do you want to continue?', abort=True):
+
+        db = ctx.mongo_database()
+
+        sched = scheduler.Scheduler(db,
+                                    providers=list(fetcher),
+                                    delay=delay,
+                                    max_retries=max_retries,
+                                    backoff=backoff,
+                                    sweep_interval=sweep_interval,
+                                    lock=lambda key: ctx.lock(key, "scheduler"),
+                                    fetcher_kwargs={"bulk_size": bulk_size})
+
+        if once:
+            sched.create_indexes()
+            for key, status in sched.run_pending():
+                ctx.log_ok("job[%s] - %s" % (key, status))
+        else:
+            ctx.log_ok("scheduler START for %s" % ", ".join(sched.providers))
+            sched.run_forever(poll_interval=poll_interval)
+
+@cli.command('status', context_settings=client.DLSTATS_SETTINGS)
+@client.opt_mongo_url
+@opt_fetcher_multiple
+@click.option('--status', '-s',
+              type=click.Choice(scheduler.JOB_STATUS),
+              help='Job status filter')
+def cmd_status(fetcher=None, status=None, **kwargs):
+    """Display the jobs of the scheduler"""
+
+    ctx = client.Context(**kwargs)
+    db = ctx.mongo_database()
+
+    sched = scheduler.Scheduler(db, providers=list(fetcher))
+
+    fmt = "{0:10} | {1:20} | {2:8} | {3:18} | {4:18} | {5:8}"
+    print("---------------------------------------------------------------------------------------------------------------------------")
+    print(fmt.format("Provider", "Dataset", "Status", "Release", "Next Run", "Attempts"))
+    print("---------------------------------------------------------------------------------------------------------------------------")
+    for job in sched.jobs(status=status):
+        release_date = job.get("release_date")
+        if release_date:
+            release_date = release_date.strftime("%Y-%m-%d - %H:%M")
+        print(fmt.format(job["provider_name"],
+                         job.get("dataset_code") or "ALL",
+                         job["status"],
+                         release_date or "sweep",
+                         job["next_run"].strftime("%Y-%m-%d - %H:%M"),
+                         job["attempts"]))
+    print("---------------------------------------------------------------------------------------------------------------------------")
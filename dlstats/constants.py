@@ -5,4 +5,19 @@ from widukind_common.constants import *
 
 CACHE_URL = os.environ.get('WIDUKIND_CACHE_URL', 'simple') #redis://localhost:6379/0
 
-SCHEMAS_VALIDATION_DISABLE = os.environ.get('WIDUKIND_SCHEMAS_VALIDATION_DISABLE', 'false')
\ No newline at end of file
+SCHEMAS_VALIDATION_DISABLE = os.environ.get('WIDUKIND_SCHEMAS_VALIDATION_DISABLE', 'false')
+
+# store a full copy of the series every N archived versions (deltas between)
+ARCHIVES_SNAPSHOT_INTERVAL = int(os.environ.get('WIDUKIND_ARCHIVES_SNAPSHOT_INTERVAL', 10))
+
+# one document per revised observation (period, old and new value)
+COL_SERIES_VINTAGES = "series_vintages"
+
+# running counters by dataset (see dlstats.stats)
+COL_DATASETS_STATS = "datasets_stats"
+
+# jobs of the calendar scheduler (see dlstats.scheduler)
+COL_SCHEDULER_JOBS = "scheduler_jobs"
+
+# checkpoints of the purge batches (see dlstats.purge)
+COL_PURGE_CHECKPOINTS = "purge_checkpoints"
@@ -0,0 +1,286 @@
+# -*- coding: utf-8 -*-
+
+"""Streaming export of series from MongoDB
+
+Series are read with a projection and a batched cursor and written row by
+row (csv) or by record batches (parquet, arrow), so the memory used does not
+depend on the dataset size.
+"""
+
+import os
+import csv
+import time
+import logging
+import concurrent.futures
+
+from widukind_common.debug import timeit
+
+from dlstats import constants
+from dlstats.utils import last_error
+from dlstats.values import format_value
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CSV_WIDE = "csv-wide"
+EXPORT_CSV_LONG = "csv-long"
+EXPORT_PARQUET = "parquet"
+EXPORT_ARROW = "arrow"
+
+EXPORT_FORMATS = [EXPORT_CSV_WIDE, EXPORT_CSV_LONG, EXPORT_PARQUET, EXPORT_ARROW]
+
+EXPORT_EXTENSIONS = {
+    EXPORT_CSV_WIDE: "csv",
+    EXPORT_CSV_LONG: "csv",
+    EXPORT_PARQUET: "parquet",
+    EXPORT_ARROW: "arrow",
+}
+
+DEFAULT_BATCH_SIZE = 500
+
+DEFAULT_ROWS_PER_BATCH = 100000
+
+SERIES_PROJECTION = {
+    "_id": False,
+    "key": True,
+    "name": True,
+    "frequency": True,
+    "dimensions": True,
+    "values.period": True,
+    "values.value": True,
+    "values.status": True,
+}
+
+def series_query(provider_name, dataset_code=None, dimensions=None,
+                 frequency=None):
+    """Return the MongoDB query for the series to export
+
+    :param str provider_name: Provider name
+    :param str dataset_code: Dataset code
+    :param dict dimensions: Dimension filters - {"country": ["fra", "deu"]}
+    :param str frequency: Frequency filter
+    """
+    query = {"provider_name": provider_name}
+    if dataset_code:
+        query["dataset_code"] = dataset_code
+    if frequency:
+        query["frequency"] = frequency
+    if dimensions:
+        for key, values in dimensions.items():
+            if isinstance(values, (list, tuple, set)):
+                query["dimensions.%s" % key] = {"$in": list(values)}
+            else:
+                query["dimensions.%s" % key] = values
+    return query
+
+def parse_dimensions_filter(filters):
+    """Convert ["country=fra", "country=deu", "unit=eur"] to dict of list"""
+    dimensions = {}
+    for _filter in filters or []:
+        if not "=" in _filter:
+            raise ValueError("invalid dimension filter [%s]" % _filter)
+        key, value = _filter.split("=", 1)
+        dimensions.setdefault(key.strip(), []).append(value.strip())
+    return dimensions
+
+def get_dimension_keys(db, provider_name, dataset_code):
+    query = {"provider_name": provider_name, "dataset_code": dataset_code}
+    dataset = db[constants.COL_DATASETS].find_one(query, {"dimension_keys": True})
+    if not dataset:
+        return []
+    return dataset.get("dimension_keys") or []
+
+def iter_series(db, query, projection=SERIES_PROJECTION,
+                batch_size=DEFAULT_BATCH_SIZE):
+    cursor = db[constants.COL_SERIES].find(query, projection)
+    return cursor.sort("key", 1).batch_size(batch_size)
+
+def get_periods(db, query, batch_size=DEFAULT_BATCH_SIZE):
+    """Return the sorted list of all periods of the selected series"""
+    projection = {"_id": False, "values.period": True}
+    periods = set()
+    for doc in iter_series(db, query, projection, batch_size=batch_size):
+        periods.update(obs["period"] for obs in doc["values"])
+    return sorted(periods)
+
+def long_header(dimension_keys):
+    return ["key", "frequency"] + list(dimension_keys) + ["period", "value", "status"]
+
+def iter_long_rows(cursor, dimension_keys):
+    for doc in cursor:
+        dimensions = doc.get("dimensions") or {}
+        first = [doc["key"], doc["frequency"]]
+        first.extend([dimensions.get(k, "") for k in dimension_keys])
+        for obs in doc["values"]:
+            yield first + [obs["period"], format_value(obs), obs.get("status") or ""]
+
+def iter_row_batches(rows, size=DEFAULT_ROWS_PER_BATCH):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def _export_csv_long(fp, cursor, dimension_keys):
+    writer = csv.writer(fp)
+    writer.writerow(long_header(dimension_keys))
+    count = 0
+    for row in iter_long_rows(cursor, dimension_keys):
+        writer.writerow(row)
+        count += 1
+    return count
+
+def _export_csv_wide(fp, cursor, dimension_keys, periods):
+    writer = csv.writer(fp)
+    writer.writerow(["key", "name", "frequency"] + list(dimension_keys) + periods)
+    positions = {period: i for i, period in enumerate(periods)}
+    count = 0
+    for doc in cursor:
+        dimensions = doc.get("dimensions") or {}
+        row = [doc["key"], doc.get("name"), doc["frequency"]]
+        row.extend([dimensions.get(k, "") for k in dimension_keys])
+        values = [""] * len(periods)
+        for obs in doc["values"]:
+            position = positions.get(obs["period"])
+            if position is not None:
+                values[position] = format_value(obs)
+        writer.writerow(row + values)
+        count += 1
+    return count
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+        return pyarrow
+    except ImportError:
+        raise ImportError("pyarrow library is required for parquet and arrow export.")
+
+def _export_arrow(filepath, cursor, dimension_keys, export_format,
+                  rows_per_batch=DEFAULT_ROWS_PER_BATCH):
+    pa = _import_pyarrow()
+
+    header = long_header(dimension_keys)
+    schema = pa.schema([(name, pa.string()) for name in header])
+
+    if export_format == EXPORT_PARQUET:
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(filepath, schema)
+        write = writer.write_table
+        to_write = lambda batch: pa.Table.from_batches([batch])
+    else:
+        import pyarrow.ipc
+        writer = pa.ipc.new_file(filepath, schema)
+        write = writer.write_batch
+        to_write = lambda batch: batch
+
+    count = 0
+    try:
+        for rows in iter_row_batches(iter_long_rows(cursor, dimension_keys),
+                                     size=rows_per_batch):
+            columns = [pa.array([row[i] for row in rows], type=pa.string())
+                       for i in range(len(header))]
+            batch = pa.RecordBatch.from_arrays(columns, schema=schema)
+            write(to_write(batch))
+            count += len(rows)
+    finally:
+        writer.close()
+
+    return count
+
+@timeit("export.export_dataset")
+def export_dataset(db, provider_name, dataset_code, filepath,
+                   export_format=EXPORT_CSV_LONG,
+                   dimensions=None,
+                   frequency=None,
+                   batch_size=DEFAULT_BATCH_SIZE):
+    """Export the series of one dataset to filepath
+
+    Return the number of rows written
+
+    :param pymongo.database.Database db: MongoDB Database instance
+    :param str provider_name: Provider name
+    :param str dataset_code: Dataset code
+    :param str filepath: Export filepath
+    :param str export_format: One of EXPORT_FORMATS
+    :param dict dimensions: Dimension filters
+    :param str frequency: Frequency filter
+    :param int batch_size: Cursor batch size
+    """
+    if not export_format in EXPORT_FORMATS:
+        raise ValueError("unknown export format [%s]" % export_format)
+
+    start = time.time()
+
+    dimension_keys = get_dimension_keys(db, provider_name, dataset_code)
+    query = series_query(provider_name, dataset_code=dataset_code,
+                         dimensions=dimensions, frequency=frequency)
+
+    if export_format == EXPORT_CSV_WIDE:
+        periods = get_periods(db, query, batch_size=batch_size)
+        cursor = iter_series(db, query, batch_size=batch_size)
+        with open(filepath, "w", newline="", encoding="utf-8") as fp:
+            count = _export_csv_wide(fp, cursor, dimension_keys, periods)
+
+    elif export_format == EXPORT_CSV_LONG:
+        projection = dict(SERIES_PROJECTION)
+        projection.pop("name")
+        cursor = iter_series(db, query, projection, batch_size=batch_size)
+        with open(filepath, "w", newline="", encoding="utf-8") as fp:
+            count = _export_csv_long(fp, cursor, dimension_keys)
+
+    else:
+        projection = dict(SERIES_PROJECTION)
+        projection.pop("name")
+        cursor = iter_series(db, query, projection, batch_size=batch_size)
+        count = _export_arrow(filepath, cursor, dimension_keys, export_format)
+
+    end = time.time() - start
+    msg = "export END: provider[%s] - dataset[%s] - format[%s] - rows[%s] - time[%.3f seconds]"
+    logger.info(msg % (provider_name, dataset_code, export_format, count, end))
+
+    return count
+
+def export_filename(provider_name, dataset_code, export_format):
+    name = "%s-%s.%s" % (provider_name, dataset_code,
+                         EXPORT_EXTENSIONS[export_format])
+    return name.replace(os.sep, "_")
+
+def export_datasets(db, provider_name, dataset_codes=None, output_dir=".",
+                    export_format=EXPORT_CSV_LONG, max_workers=1, **kwargs):
+    """Export one file per dataset in output_dir
+
+    Return dict of dataset_code: (filepath, rows or exception)
+
+    :param list dataset_codes: Datasets to export - all datasets if None
+    :param int max_workers: Number of datasets exported in parallel
+    """
+    if not dataset_codes:
+        query = {"provider_name": provider_name}
+        dataset_codes = sorted(db[constants.COL_DATASETS].distinct("dataset_code",
+                                                                   query))
+
+    os.makedirs(output_dir, exist_ok=True)
+
+    results = {}
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        tasks = {}
+        for dataset_code in dataset_codes:
+            filename = export_filename(provider_name, dataset_code, export_format)
+            filepath = os.path.abspath(os.path.join(output_dir, filename))
+            future = executor.submit(export_dataset, db, provider_name,
+                                     dataset_code, filepath,
+                                     export_format=export_format, **kwargs)
+            tasks[future] = (dataset_code, filepath)
+
+        for future in concurrent.futures.as_completed(tasks):
+            dataset_code, filepath = tasks[future]
+            try:
+                results[dataset_code] = (filepath, future.result())
+            except Exception as err:
+                logger.error("export error for dataset[%s]: %s" % (dataset_code,
+                                                                  last_error()))
+                results[dataset_code] = (filepath, err)
+
+    return results
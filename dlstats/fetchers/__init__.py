@@ -1,82 +1,162 @@
 # -*- coding: utf-8 -*-
 
-__all__ = ['FETCHERS']
-
-FETCHERS = {}
-
-try:
-    from dlstats.fetchers.bis import BIS
-    FETCHERS['BIS'] = BIS
-    __all__.append('BIS')
-except ImportError:
-    pass
-
-try:
-    from dlstats.fetchers.oecd import OECD
-    FETCHERS['OECD'] = OECD
-    __all__.append('OECD')
-except ImportError:
-    pass
-
-try:
-    from dlstats.fetchers.eurostat import Eurostat
-    FETCHERS['EUROSTAT'] = Eurostat
-    __all__.append('Eurostat')
-except ImportError:
-    pass
-
-try:
-    from dlstats.fetchers.world_bank import WorldBankAPI
-    FETCHERS['WORLDBANK'] = WorldBankAPI
-    __all__.append('WorldBankAPI')
-except ImportError:
-    pass
-
-try:
-    from dlstats.fetchers.imf import IMF
-    FETCHERS['IMF'] = IMF
-    __all__.append('IMF')
-except ImportError:
-    pass
-
-try:
-    from dlstats.fetchers.bea import BEA
-    FETCHERS['BEA'] = BEA
-    __all__.append('BEA')
-except ImportError:
-    pass
-
-try:
-    from dlstats.fetchers.ecb import ECB
-    FETCHERS['ECB'] = ECB
-    __all__.append('ECB')
-except ImportError:
-    pass
-
-try:
-    from dlstats.fetchers.esri import Esri
-    FETCHERS['ESRI'] = Esri
-    __all__.append('Esri')
-except ImportError:
-    pass
-
-try:
-    from dlstats.fetchers.insee import INSEE
-    FETCHERS['INSEE'] = INSEE
-    __all__.append('INSEE')
-except ImportError:
-    pass
-
-#try:
-#    from dlstats.fetchers.destatis import DESTATIS
-#    FETCHERS['DESTATIS'] = DESTATIS
-#    __all__.append('DESTATIS')
-#except ImportError:
-#    pass
-
-try:
-    from dlstats.fetchers.fed import FED
-    FETCHERS['FED'] = FED
-    __all__.append('FED')
-except ImportError:
-    pass
+"""Registry of the fetchers
+
+FETCHERS maps the provider names to the fetcher classes but a fetcher
+module (and its dependencies: lxml, xlrd, pandas...) is imported only when
+its class is requested::
+
+    FETCHERS.keys()         # no fetcher imported
+    FETCHERS["BIS"](db=db)  # import dlstats.fetchers.bis
+    FETCHERS.available()    # names of the fetchers which can be imported
+
+The names include the fetchers with missing dependencies (ImportError on
+access): the loops over all fetchers use available().
+
+The fetchers of other packages are declared with the entry point group
+"dlstats.fetchers"::
+
+    entry_points={
+        'dlstats.fetchers': [
+            'MYPROVIDER = mypackage.fetcher:MyFetcher',
+        ],
+    }
+"""
+
+from collections import OrderedDict
+from collections.abc import Mapping
+import importlib
+import logging
+
+__all__ = ['FETCHERS', 'FETCHERS_PATHS', 'FetcherRegistry']
+
+logger = logging.getLogger(__name__)
+
+ENTRY_POINTS_GROUP = "dlstats.fetchers"
+
+FETCHERS_PATHS = OrderedDict([
+    ('BIS', 'dlstats.fetchers.bis:BIS'),
+    ('OECD', 'dlstats.fetchers.oecd:OECD'),
+    ('EUROSTAT', 'dlstats.fetchers.eurostat:Eurostat'),
+    ('WORLDBANK', 'dlstats.fetchers.world_bank:WorldBankAPI'),
+    ('IMF', 'dlstats.fetchers.imf:IMF'),
+    ('BEA', 'dlstats.fetchers.bea:BEA'),
+    ('ECB', 'dlstats.fetchers.ecb:ECB'),
+    ('ESRI', 'dlstats.fetchers.esri:Esri'),
+    ('INSEE', 'dlstats.fetchers.insee:INSEE'),
+    #('DESTATIS', 'dlstats.fetchers.destatis:DESTATIS'),
+    ('FED', 'dlstats.fetchers.fed:FED'),
+])
+
+def iter_entry_points(group=ENTRY_POINTS_GROUP):
+    """Yield (name, "module:attr") of the installed entry points of group"""
+    try:
+        from importlib import metadata
+    except ImportError:
+        metadata = None
+
+    if metadata:
+        entry_points = metadata.entry_points()
+        if hasattr(entry_points, "select"):
+            entry_points = entry_points.select(group=group)
+        else:
+            entry_points = entry_points.get(group, [])
+        for entry_point in entry_points:
+            yield entry_point.name, entry_point.value
+        return
+
+    try:
+        import pkg_resources
+    except ImportError:
+        return
+    for entry_point in pkg_resources.iter_entry_points(group):
+        yield entry_point.name, "%s:%s" % (entry_point.module_name,
+                                           ".".join(entry_point.attrs))
+
+def load_path(path):
+    """Return the object of a "module:attr" path"""
+    module_name, attr = path.split(":", 1)
+    obj = importlib.import_module(module_name)
+    for name in attr.split("."):
+        obj = getattr(obj, name)
+    return obj
+
+class FetcherRegistry(Mapping):
+    """Lazy {provider_name: Fetcher class}
+
+    The entry points are read on the first access to the names and a
+    fetcher module is imported on the first access to its class.
+    """
+
+    def __init__(self, paths=None, group=ENTRY_POINTS_GROUP):
+        """
+        :param dict paths: {provider_name: "module:Class"}
+        :param str group: Entry points group - None for disable the discovery
+        """
+        self._paths = OrderedDict(paths or {})
+        self._group = group
+        self._discovered = group is None
+        self._klasses = {}
+
+    def _discover(self):
+        if self._discovered:
+            return
+        self._discovered = True
+        try:
+            for name, path in iter_entry_points(self._group):
+                if name in self._paths:
+                    logger.warning("fetcher entry point [%s] ignored - already registered" % name)
+                    continue
+                self._paths[name] = path
+        except Exception as err:
+            logger.error("fetchers entry points error : %s" % str(err))
+
+    @property
+    def paths(self):
+        self._discover()
+        return self._paths
+
+    def register(self, provider_name, path_or_klass):
+        """Add a fetcher ("module:Class" or class)"""
+        if isinstance(path_or_klass, str):
+            self._paths[provider_name] = path_or_klass
+            self._klasses.pop(provider_name, None)
+        else:
+            self._paths[provider_name] = "%s:%s" % (path_or_klass.__module__,
+                                                    path_or_klass.__name__)
+            self._klasses[provider_name] = path_or_klass
+
+    def is_loaded(self, provider_name):
+        return provider_name in self._klasses
+
+    def is_available(self, provider_name):
+        """Return True if the fetcher class can be imported"""
+        try:
+            self[provider_name]
+        except ImportError as err:
+            logger.warning("fetcher [%s] not available : %s" % (provider_name, str(err)))
+            return False
+        return True
+
+    def available(self):
+        """Return the names of the fetchers which can be imported"""
+        return [name for name in self.paths if self.is_available(name)]
+
+    def __getitem__(self, provider_name):
+        if provider_name in self._klasses:
+            return self._klasses[provider_name]
+        path = self.paths[provider_name]
+        klass = load_path(path)
+        self._klasses[provider_name] = klass
+        return klass
+
+    def __contains__(self, provider_name):
+        return provider_name in self.paths
+
+    def __iter__(self):
+        return iter(self.paths)
+
+    def __len__(self):
+        return len(self.paths)
+
+FETCHERS = FetcherRegistry(FETCHERS_PATHS)
@@ -8,6 +8,7 @@ from datetime import datetime, timedelta
 import logging
 import pprint
 from collections import OrderedDict, deque
+from contextlib import contextmanager
 from itertools import groupby
 import hashlib
 import json
@@ -15,15 +16,17 @@ import json
 import pymongo
 from pymongo import ReturnDocument
 from bson.json_util import dumps as json_dumps
-import pandas
 
-from widukind_common.utils import get_mongo_db, load_klass, series_archives_store
+from widukind_common.utils import get_mongo_db, load_klass
 from widukind_common import errors
 from widukind_common.tags import generate_tags_series
 from widukind_common.debug import timeit, TRACE_ENABLE
 
 from dlstats import constants
 from dlstats.fetchers import schemas
+from dlstats.archives import series_archives_delta_store, is_snapshot_version
+from dlstats import stats
+from dlstats.values import normalize_values
 from dlstats.utils import (last_error, 
                            clean_datetime, 
                            remove_file_and_dir, 
@@ -37,6 +40,9 @@ logger = logging.getLogger(__name__)
 
 IS_SCHEMAS_VALIDATION_DISABLE = constants.SCHEMAS_VALIDATION_DISABLE == "true"
 
+# transient field - codes of the series collected by series_clean_field
+SERIES_CODES_FIELD = "_codes"
+
 class Fetcher(object):
     """Abstract base class for all fetchers"""
     
@@ -55,11 +61,21 @@ class Fetcher(object):
                  async_mode=None,
                  bulk_size=500,
                  pool_size=20,
+                 initial_load=None,
+                 defer_indexes=False,
                  **kwargs):
         """
         :param str provider_name: Provider Name
         :param pymongo.database.Database db: MongoDB Database instance        
         :param bool is_indexes: Bypass create_or_update_indexes() if False 
+        :param bool initial_load: Load all the datasets (upsert_all_datasets) 
+                                  - the series are inserted without search 
+                                  the old series only for the datasets 
+                                  without series - False: never
+        :param bool defer_indexes: Drop the secondary indexes of the series 
+                                   during the initial load of a provider 
+                                   without datasets (upsert_all_datasets) 
+                                   and rebuild them at the end
 
         :raises ValueError: if provider_name is None
         """        
@@ -81,6 +97,10 @@ class Fetcher(object):
         self.bulk_size = bulk_size
         self.pool_size = pool_size
         
+        self.initial_load = initial_load
+        self.defer_indexes = defer_indexes
+        self._deferred_indexes = False
+        
         if self.async_mode:
             logger.info("ASYNC MODE [%s]" % self.async_mode)
         else:
@@ -195,6 +215,19 @@ class Fetcher(object):
 
         self.provider_verified = True
             
+    def is_provider_in_db(self):
+        """Return True if provider is stored in DB - cached after first query"""
+        
+        if self.provider_verified or (self.provider and self.provider.from_db):
+            return True
+        
+        query = {"name": self.provider_name}
+        if self.db[constants.COL_PROVIDERS].find_one(query, {"_id": True}):
+            self.provider_verified = True
+            return True
+        
+        return False
+            
     def load_provider_from_db(self):
         """Load and set provider fields from DB
         """
@@ -215,10 +248,14 @@ class Fetcher(object):
         try:
             query = {"provider_name": self.provider_name}
             
-            if self.db[constants.COL_DATASETS].count(query) == 0:
+            count = self.db[constants.COL_DATASETS].count(query)
+            if count == 0 or self.initial_load:
                 msg_op = "load"
                 msg = "fetcher load START: provider[%s] - bulk-size[%s]"
                 logger.info(msg % (self.provider_name, self.bulk_size))
+                if count == 0:
+                    with self.series_indexes_deferred():
+                        return self.load_datasets_first()
                 return self.load_datasets_first()
             else:
                 msg = "fetcher update START: provider[%s] - bulk-size[%s]"
@@ -280,6 +317,36 @@ class Fetcher(object):
                 except Exception:
                     logger.warning("not remove filepath[%s]" % filepath)
     
+    @contextmanager
+    def series_indexes_deferred(self):
+        """Drop the secondary indexes of the series and rebuild them at exit
+        
+        Only if defer_indexes is True - the _id and unique indexes are kept.
+        
+        The series collection is shared by all providers: the indexes are 
+        not dropped if it contains the series of another provider (the 
+        queries of the other fetchers and of the readers would scan the 
+        collection until the rebuild).
+        """
+        if not self.defer_indexes or self._deferred_indexes:
+            yield
+            return
+        
+        query = {"provider_name": {"$ne": self.provider_name}}
+        if self.db[constants.COL_SERIES].find_one(query, {"_id": True}):
+            msg = "indexes not deferred for provider[%s] - series of other providers in DB"
+            logger.warning(msg % self.provider_name)
+            yield
+            return
+        
+        self._deferred_indexes = True
+        indexes = drop_secondary_indexes(self.db[constants.COL_SERIES])
+        try:
+            yield
+        finally:
+            self._deferred_indexes = False
+            restore_indexes(self.db[constants.COL_SERIES], indexes)
+
     def hook_before_dataset(self, dataset):
         pass
 
@@ -337,6 +404,40 @@ class Fetcher(object):
         raise NotImplementedError("This method from the Fetcher class must"
                                   "be implemented.")
         
+def drop_secondary_indexes(collection):
+    """Drop the not unique indexes of collection - return their definitions"""
+    indexes = {}
+    for name, index in collection.index_information().items():
+        if name == "_id_" or index.get("unique"):
+            continue
+        collection.drop_index(name)
+        indexes[name] = index
+    if indexes:
+        logger.info("indexes dropped for [%s]: %s" % (collection.name, 
+                                                      ", ".join(sorted(indexes))))
+    return indexes
+
+def create_vintages_indexes(db):
+    """Create the indexes of the series_vintages collection
+    
+    Not created by widukind_common.utils.create_or_update_indexes
+    """
+    collection = db[constants.COL_SERIES_VINTAGES]
+    collection.create_index([("slug", pymongo.ASCENDING), 
+                             ("period", pymongo.ASCENDING)], 
+                            name="slug_period_idx")
+    collection.create_index([("provider_name", pymongo.ASCENDING), 
+                             ("dataset_code", pymongo.ASCENDING)], 
+                            name="provider_dataset_idx")
+
+@timeit("commons.restore_indexes")
+def restore_indexes(collection, indexes):
+    """Create the indexes returned by :func:`drop_secondary_indexes`"""
+    for name, index in indexes.items():
+        options = {k: v for k, v in index.items() if not k in ["key", "v", "ns"]}
+        collection.create_index(index["key"], name=name, **options)
+        logger.info("index rebuilt for [%s]: %s" % (collection.name, name))
+
 class DlstatsCollection(object):
     """Abstract base class for objects that are stored and indexed by dlstats
     """
@@ -576,6 +677,27 @@ class Categories(DlstatsCollection):
         return self.update_mongo_collection(constants.COL_CATEGORIES, 
                                             ['slug'],
                                             self.bson)
+# small fields of the previous version read by Datasets.__init__
+PREVIOUS_VERSION_PROJECTION = {
+    "_id": False,
+    "dimension_keys": True,
+    "attribute_keys": True,
+    "doc_href": True,
+    "last_update": True,
+    "download_last": True,
+    "download_first": True,
+    "notes": True,
+    "enable": True,
+    "lock": True,
+    "tags": True,
+}
+
+# read on first access
+PREVIOUS_VERSION_LAZY_FIELDS = ["codelists", "concepts", "metadata"]
+
+def get_codes_sets(codelists):
+    return {key: set(values.keys()) for key, values in (codelists or {}).items()}
+
 class Datasets(DlstatsCollection):
     """Abstract base class for datasets
     
@@ -606,6 +728,14 @@ class Datasets(DlstatsCollection):
         :param bool is_load_previous_version: Bypass load previous version if False        
         """        
         super().__init__(fetcher=fetcher)
+        # fields of the previous version not read yet (see load_previous_version)
+        self._lazy_fields = set()
+        self._previous_codes = None
+        self._previous_codes_pending = False
+        self._codelists_is_previous = False
+        self._dimension_list = None
+        self._attribute_list = None
+        
         self.provider_name = provider_name
         self.dataset_code = dataset_code
         self.name = name
@@ -613,13 +743,12 @@ class Datasets(DlstatsCollection):
         self.last_update = last_update
         self.metadata = metadata or {}
         self.bulk_size = self.fetcher.bulk_size
-        self.dimension_list = CodeDict()
-        self.attribute_list = CodeDict()
         
         self.dimension_keys = []
         self.attribute_keys = []
         self.codelists = {}
         self.concepts = {}
+        self.codelist_resolver = CodelistResolver(dataset=self)
 
         self.enable = False        
         self.lock = False
@@ -645,6 +774,8 @@ class Datasets(DlstatsCollection):
         if self.fetcher.async_mode:
             if self.fetcher.async_mode == "future":
                 self.series_klass = "dlstats.async._concurrent_futures.AsyncSeries"
+            elif self.fetcher.async_mode == "mp":
+                self.series_klass = "dlstats.async._multiprocessing.MPSeries"
         
         series_klass = load_klass(self.series_klass)
         self.series = series_klass(dataset=self,
@@ -681,17 +812,31 @@ class Datasets(DlstatsCollection):
                 "lock": self.lock,
                 "tags": self.tags}
 
+    def _query(self):
+        return {'provider_name': self.provider_name,
+                'dataset_code': self.dataset_code}
+
     def load_previous_version(self, provider_name, dataset_code):
-        dataset = self.fetcher.db[constants.COL_DATASETS].find_one(
-                                            {'provider_name': provider_name,
-                                             'dataset_code': dataset_code})
+        """Load the small fields of the stored dataset
+        
+        The codelists, concepts and metadata are read on first access and 
+        the dimension_list / attribute_list are built on first access.
+        """
+        collection = self.fetcher.db[constants.COL_DATASETS]
+        query = {'provider_name': provider_name,
+                 'dataset_code': dataset_code}
+        
+        # the empty codelists are excluded by the query (no read of codelists)
+        dataset = collection.find_one(dict(query, codelists={"$nin": [{}, None]}),
+                                      PREVIOUS_VERSION_PROJECTION)
+        
+        if not dataset and collection.find_one(query, {"_id": True}):
+            msg = "load previous version fail. provider[%s] - dataset[%s]"
+            raise Exception(msg % (self.provider_name, self.dataset_code))
+        
         if dataset:
-            # convert to dict of dict
             self.dimension_keys = dataset.get("dimension_keys", [])
             self.attribute_keys = dataset.get("attribute_keys", [])
-            self.codelists = dataset.get("codelists", {})
-            self.concepts = dataset.get("concepts", {})
-            self.metadata = dataset.get('metadata', {}) or {}
             self.doc_href = dataset.get('doc_href')
             self.last_update = dataset.get('last_update')
             self.download_last = dataset.get('download_last')
@@ -701,21 +846,10 @@ class Datasets(DlstatsCollection):
             self.lock = dataset.get('lock')
             self.tags = dataset.get('tags')
             
-            dimension_list = {}
-            attribute_list = {}
-            
-            if not self.codelists:
-                msg = "load previous version fail. provider[%s] - dataset[%s]"
-                raise Exception(msg % (self.provider_name, self.dataset_code))
-
-            for key in self.dimension_keys:
-                dimension_list[key] = OrderedDict([(k, v) for k, v in self.codelists.get(key).items() if key in self.codelists])
-
-            for key in self.attribute_keys:
-                attribute_list[key] = OrderedDict([(k, v) for k, v in self.codelists.get(key).items() if key in self.codelists])
-            
-            self.dimension_list.set_dict(dimension_list)
-            self.attribute_list.set_dict(attribute_list)
+            self._lazy_fields.update(PREVIOUS_VERSION_LAZY_FIELDS)
+            self._previous_codes_pending = True
+            self._dimension_list = None
+            self._attribute_list = None
             
             self.from_db = True
             
@@ -723,6 +857,111 @@ class Datasets(DlstatsCollection):
             msg = "dataset not found for previous loading. provider[%s] - dataset[%s]"
             logger.warning(msg % (provider_name, dataset_code))
 
+    def _load_lazy_field(self, field):
+        self._lazy_fields.discard(field)
+        doc = self.fetcher.db[constants.COL_DATASETS].find_one(self._query(), 
+                                                               {field: True}) or {}
+        value = doc.get(field) or {}
+        setattr(self, "_" + field, value)
+        
+        if field == "codelists":
+            self._codelists_is_previous = True
+            if self._previous_codes_pending:
+                self._previous_codes_pending = False
+                self._previous_codes = get_codes_sets(value)
+
+    def _get_lazy(self, field):
+        if field in self._lazy_fields:
+            self._load_lazy_field(field)
+        return getattr(self, "_" + field)
+
+    def _set_lazy(self, field, value):
+        self._lazy_fields.discard(field)
+        if field == "codelists":
+            self._codelists_is_previous = False
+        setattr(self, "_" + field, value)
+
+    @property
+    def codelists(self):
+        return self._get_lazy("codelists")
+
+    @codelists.setter
+    def codelists(self, value):
+        self._set_lazy("codelists", value)
+
+    @property
+    def concepts(self):
+        return self._get_lazy("concepts")
+
+    @concepts.setter
+    def concepts(self, value):
+        self._set_lazy("concepts", value)
+
+    @property
+    def metadata(self):
+        return self._get_lazy("metadata")
+
+    @metadata.setter
+    def metadata(self, value):
+        self._set_lazy("metadata", value)
+
+    def get_previous_codelists(self, keys=None):
+        """Codelists of the stored dataset (all or only these keys)"""
+        if not self.from_db:
+            return {}
+        if self._codelists_is_previous or "codelists" in self._lazy_fields:
+            codelists = self.codelists
+        else:
+            # codelists replaced by the fetcher - read the stored codelists
+            projection = {"codelists": True}
+            if keys is not None:
+                projection = dict(("codelists.%s" % key, True) for key in keys)
+                projection["_id"] = False
+            doc = self.fetcher.db[constants.COL_DATASETS].find_one(self._query(), projection)
+            codelists = (doc or {}).get("codelists") or {}
+        if keys is None:
+            return codelists
+        return dict((key, codelists[key]) for key in keys if key in codelists)
+
+    @property
+    def previous_codes(self):
+        """Codes of the codelists stored in DB - {key: set(codes)}"""
+        if self._previous_codes_pending:
+            self._previous_codes_pending = False
+            self._previous_codes = get_codes_sets(self.get_previous_codelists())
+        return self._previous_codes
+
+    @previous_codes.setter
+    def previous_codes(self, value):
+        self._previous_codes_pending = False
+        self._previous_codes = value
+
+    def _build_code_dict(self, keys):
+        code_dict = CodeDict()
+        codelists = self.get_previous_codelists(keys)
+        code_dict.set_dict(dict((key, OrderedDict(codelists.get(key) or {})) for key in keys))
+        return code_dict
+
+    @property
+    def dimension_list(self):
+        if self._dimension_list is None:
+            self._dimension_list = self._build_code_dict(self.dimension_keys if self.from_db else [])
+        return self._dimension_list
+
+    @dimension_list.setter
+    def dimension_list(self, value):
+        self._dimension_list = value
+
+    @property
+    def attribute_list(self):
+        if self._attribute_list is None:
+            self._attribute_list = self._build_code_dict(self.attribute_keys if self.from_db else [])
+        return self._attribute_list
+
+    @attribute_list.setter
+    def attribute_list(self, value):
+        self._attribute_list = value
+
     def set_dimension_frequency(self, dimension_name):
         '''Identify frequency field in dataset dimensions'''
         if not dimension_name:
@@ -750,6 +989,20 @@ class Datasets(DlstatsCollection):
         if not frequency in self.metadata["frequencies"]:
             self.metadata["frequencies"].append(frequency)
     
+    def is_series_exist(self):
+        """Return True if one series of this dataset is stored in DB
+        
+        Use the counters of the current run before query the DB (the 
+        counters are incremented after the write of the series).
+        """
+        series = self.series
+        if series.count_inserts + series.count_updates + series.count_unchanged > 0:
+            return True
+        
+        query = {"provider_name": self.provider_name,
+                 "dataset_code": self.dataset_code}
+        return self.fetcher.db[constants.COL_SERIES].find_one(query, {"_id": True}) is not None
+        
     def is_recordable(self):
         
         msg = None
@@ -759,7 +1012,7 @@ class Datasets(DlstatsCollection):
             #    msg = "fetcher max errors exceeded [%s]" % self.fetcher.errors
             #    return False
             
-            if self.fetcher.db[constants.COL_PROVIDERS].count({"name": self.provider_name}) == 0:
+            if not self.fetcher.is_provider_in_db():
                 msg = "provider[%s] not found in DB" % self.provider_name
                 logger.critical(msg)
                 return False
@@ -769,9 +1022,7 @@ class Datasets(DlstatsCollection):
                 logger.critical(msg)                
                 return False
             
-            query = {"provider_name": self.provider_name,
-                     "dataset_code": self.dataset_code}
-            if self.fetcher.db[constants.COL_SERIES].count(query) == 0:
+            if not self.is_series_exist():
                 msg = "not series for this dataset"
                 return False
     
@@ -780,6 +1031,20 @@ class Datasets(DlstatsCollection):
             if msg:
                 self.metadata["disable_reason"] = msg
             
+    def update_stats(self):
+        """Apply the series changes of this run to the dataset stats"""
+        if not self.series.stats:
+            return
+        try:
+            db = self.fetcher.db
+            if self.from_db and not stats.is_stats_exist(db, self.provider_name, self.dataset_code):
+                stats.reconcile_datasets_stats(db, self.provider_name, self.dataset_code)
+            else:
+                stats.update_dataset_stats(db, self.provider_name, self.dataset_code, 
+                                           self.series.stats)
+        except Exception as err:
+            logger.error("update stats for dataset[%s] : %s" % (self.dataset_code, str(err)))
+            
     @timeit("commons.Datasets.update_database")
     def update_database(self, save_only=False):
 
@@ -806,7 +1071,9 @@ class Datasets(DlstatsCollection):
 
             self.download_last = now
             
-            if not self.is_recordable():
+            self.update_stats()
+            
+            if self.series.bulk_error or not self.is_recordable():
                 self.enable = False
                 msg = "disable dataset[%s] for provider[%s]"
                 logger.warning(msg % (self.dataset_code, 
@@ -911,11 +1178,26 @@ class SeriesIterator:
         self.fetcher = self.dataset.fetcher
         self.dataset_code = self.dataset.dataset_code
         self.provider_name = self.fetcher.provider_name
-        self.dimension_list = dataset.dimension_list
-        self.attribute_list = dataset.attribute_list
-        
         self.rows = None
         
+    @property
+    def dimension_list(self):
+        """dimension_list of the dataset (built on first access)"""
+        return self.dataset.dimension_list
+
+    @dimension_list.setter
+    def dimension_list(self, value):
+        self.dataset.dimension_list = value
+
+    @property
+    def attribute_list(self):
+        """attribute_list of the dataset (built on first access)"""
+        return self.dataset.attribute_list
+
+    @attribute_list.setter
+    def attribute_list(self, value):
+        self.dataset.attribute_list = value
+
     def get_store_path(self):
         return make_store_path(base_path=self.fetcher.store_path,
                                dataset_code=self.dataset_code)
@@ -951,37 +1233,56 @@ class SeriesIterator:
         return True
     
     def clean_field(self, bson):
-        return series_clean_field(bson)
+        return series_clean_field(bson, slug=self.dataset.codelist_resolver.slug)
 
     def build_series(self, bson):
         raise NotImplementedError()
 
 @timeit("commons.series_clean_field", stats_only=True)
-def series_clean_field(bson):
+def series_clean_field(bson, slug=None):
+    """Slugify dimensions and attributes of the series
+    
+    The codes of dimensions, attributes and observations attributes are 
+    collected in the same pass and stored in the transient field 
+    SERIES_CODES_FIELD (removed by :func:`series_set_codelists`).
+    
+    :param callable slug: Memoized slugify - :meth:`CodelistResolver.slug`
+    """
+    if not slug:
+        slug = lambda value: slugify(value, save_order=True)
     
     if not "start_ts" in bson or not bson.get("start_ts"):
         if bson["frequency"] in ["A", "M", "D", "Q", "S"]:
             bson["start_ts"] = get_datetime_from_period(bson["values"][0]["period"], freq=bson["frequency"])
         else:
-            bson["start_ts"] = clean_datetime(pandas.Period(ordinal=bson["start_date"], freq=bson["frequency"]).start_time.to_datetime())
+            from pandas import Period
+            bson["start_ts"] = clean_datetime(Period(ordinal=bson["start_date"], freq=bson["frequency"]).start_time.to_datetime())
 
     if not "end_ts" in bson or not bson.get("end_ts"):
         if bson["frequency"] in ["A", "M", "D", "Q", "S"]:
             bson["end_ts"] = get_datetime_from_period(bson["values"][-1]["period"], freq=bson["frequency"])
         else:
-            bson["end_ts"] = clean_datetime(pandas.Period(ordinal=bson["end_date"], freq=bson["frequency"]).end_time.to_datetime())
+            from pandas import Period
+            bson["end_ts"] = clean_datetime(Period(ordinal=bson["end_date"], freq=bson["frequency"]).end_time.to_datetime())
     
     dimensions = bson.pop("dimensions")
     attributes = bson.pop("attributes", {})
     new_dimensions = {}
     new_attributes = {}
+    codes = {}
     
     for key, value in dimensions.items():
-        new_dimensions[slugify(key, save_order=True)] = slugify(value, save_order=True)
+        key, value = slug(key), slug(value)
+        new_dimensions[key] = value
+        codes[key] = {value}
 
     if attributes:
         for key, value in attributes.items():
-            new_attributes[slugify(key, save_order=True)] = slugify(value, save_order=True)
+            key, value = slug(key), slug(value)
+            new_attributes[key] = value
+            if not key in codes:
+                codes[key] = set()
+            codes[key].add(value)
         
     bson["dimensions"] = new_dimensions
 
@@ -1000,9 +1301,15 @@ def series_clean_field(bson):
             continue
         attributes_obs = {}
         for k, v in value.get("attributes").items():
-            attributes_obs[slugify(k, save_order=True)] = slugify(v, save_order=True)
+            k, v = slug(k), slug(v)
+            attributes_obs[k] = v
+            if not k in codes:
+                codes[k] = set()
+            codes[k].add(v)
         value["attributes"] = attributes_obs
     
+    bson[SERIES_CODES_FIELD] = codes
+    
     return bson
 
 
@@ -1030,6 +1337,12 @@ def series_is_changed(new_bson, old_bson):
         if old_values != new_values:
             return True
 
+        '''Status of the not numeric values change(s)'''
+        old_status = [v.get('status') for v in old_bson['values']]
+        new_status = [v.get('status') for v in new_bson['values']]
+        if old_status != new_status:
+            return True
+
     '''values.$.attributes change(s)'''
     old_obs_attrs = [v['attributes'] for v in old_bson['values']]
     new_obs_attrs = [v['attributes'] for v in new_bson['values']]
@@ -1111,50 +1424,219 @@ def series_get_last_update_dataset(new_bson, last_update=None):
     new_bson.pop('last_update', None)
     return _last_update
 
+def series_codes(bson):
+    """Return the codes of dimensions, attributes and observations attributes
+    
+    Return dict of set - {key: {code1, code2}}
+    """
+    codes = {}
+    
+    def add(key, value):
+        if value is None:
+            return
+        if not key in codes:
+            codes[key] = set()
+        codes[key].add(value)
+    
+    for k, v in (bson.get("dimensions") or {}).items():
+        add(k, v)
+
+    for k, v in (bson.get("attributes") or {}).items():
+        add(k, v)
+
+    for value in bson["values"]:
+        if value.get("attributes"):
+            for k, v in value.get("attributes").items():
+                add(k, v)
+    
+    return codes
+
 @timeit("commons.series_set_codelists", stats_only=True)
-def series_set_codelists(bson, codelists):
-    """set/update codelists field in series"""
+def series_set_codelists(bson, codelists, codes=None):
+    """set/update codelists field in series
     
-    search_codelists = {}
+    Return dict of the slugged codes used by the series - {key: {code1, code2}}
+    
+    :param codelists: :class:`CodelistResolver` or dict of codelists
+    :param dict codes: Codes of the series - default: codes collected by 
+                       :func:`series_clean_field` or :func:`series_codes`
+    """
+    if not isinstance(codelists, CodelistResolver):
+        codelists = CodelistResolver(codelists=codelists)
+    
+    if codes is None:
+        codes = bson.pop(SERIES_CODES_FIELD, None)
+        if codes is None:
+            codes = series_codes(bson)
     
     if not "codelists" in bson:
         bson["codelists"] = {}
+    
+    used_codes = {}
+        
+    for key, values in codes.items():
+        key_slug = codelists.slug(key)
+        if not key_slug in used_codes:
+            used_codes[key_slug] = set()
+        for code in values:
+            code_slug = codelists.slug(code)
+            used_codes[key_slug].add(code_slug)
+            label = codelists.get(key_slug, code_slug)
+            if label:
+                if not key in bson["codelists"]:
+                    bson["codelists"][key] = {}
+                bson["codelists"][key][code] = label
+    
+    return used_codes
+
+def series_revisions(new_bson, old_bson):
+    """Return the revised observations (value changed for the same period)"""
+    old_values = {obs["period"]: obs["value"] for obs in old_bson["values"]}
+    revisions = []
+    for obs in new_bson["values"]:
+        period = obs["period"]
+        if period in old_values and old_values[period] != obs["value"]:
+            revisions.append({"period": period,
+                              "old_value": old_values[period],
+                              "new_value": obs["value"]})
+    return revisions
+
+@timeit("commons.series_update_operation", stats_only=True)
+def series_update_operation(new_bson, old_bson):
+    """Return targeted update operation and revised observations
+    
+    Return None if the full document must be replaced (removed observations,
+    first period change or removed fields).
+    """
+    
+    old_values = old_bson["values"]
+    new_values = new_bson["values"]
+    count_old = len(old_values)
+    
+    if len(new_values) < count_old or count_old == 0:
+        return None
+    
+    if new_values[0]["period"] != old_values[0]["period"]:
+        return None
+    
+    for key in old_bson.keys():
+        if key != "_id" and not key in new_bson:
+            return None
+    
+    fields = {}
+    for key, value in new_bson.items():
+        if key in ["_id", "values"]:
+            continue
+        if not key in old_bson or old_bson[key] != value:
+            fields[key] = value
+    
+    is_changed_values = False
+    for i, old_obs in enumerate(old_values):
+        new_obs = new_values[i]
+        if old_obs != new_obs:
+            is_changed_values = True
+            fields["values.%s" % i] = new_obs
+    
+    added = new_values[count_old:]
+    
+    update = {}
+    if added and is_changed_values:
+        # $push and $set on values.N in the same update is a conflict
+        for i, obs in enumerate(added, count_old):
+            fields["values.%s" % i] = obs
+    elif added:
+        update["$push"] = {"values": {"$each": added}}
+    
+    if fields:
+        update["$set"] = fields
         
-    for k, v in bson.get("dimensions", {}).items():
-        if not k in search_codelists:
-            search_codelists[k] = []
-        if not v in search_codelists[k]:
-            search_codelists[k].append(v)
+    return update, series_revisions(new_bson, old_bson)
+
+UNIT_INSERT = "insert"
+UNIT_UPDATE = "update"
+UNIT_UNCHANGED = "unchanged"
+
+@timeit("commons.series_update_unit", stats_only=True)
+def series_update_unit(bson, old_bson, provider_name=None, dataset_code=None,
+                       last_update=None, bytes_sample_rate=1):
+    """CPU part of :meth:`Series.update_series_list` for one series
+    
+    No DB access: can run in another process. The codelists of bson must 
+    be already set (:func:`series_set_codelists`) and old_bson is the stored 
+    series without _id and tags (or None).
     
-    if bson.get("attributes"):
-        for k, v in bson.get("attributes").items():
-            if not k in search_codelists:
-                search_codelists[k] = []
-            if not v in search_codelists[k]:
-                search_codelists[k].append(v)
+    Return tuple (action, bson, archive, operation, counts):
+    
+    - action: UNIT_INSERT, UNIT_UPDATE or UNIT_UNCHANGED
+    - archive: series_archives document (update only)
+    - operation: (query_update, revisions) - query_update is None for 
+      replace the document
+    - counts: (series, observations, bytes) added for the dataset stats 
+      (bytes estimated with bytes_sample_rate - see :func:`stats.insert_counts`)
+    """
+    key = bson['key']
 
-    for value in bson["values"]:
-        if value.get("attributes"):
-            for k, v in value.get("attributes").items():
-                if not k in search_codelists:
-                    search_codelists[k] = []
-                if not v in search_codelists[k]:
-                    search_codelists[k].append(v)
-
-    for k, items in search_codelists.items():
-        if k in codelists:
-            for i in items:
-                value = codelists[k].get(i)
-                if value:
-                    if not k in bson["codelists"]:
-                        bson["codelists"][k] = {}
-                    bson["codelists"][k][i] = value
+    if not "version" in bson:
+        bson["version"] = 0
+
+    if not bson.get("slug", None):
+        txt = "-".join([provider_name, dataset_code, key])
+        bson['slug'] = slugify(txt, word_boundary=False, save_order=True)
+    
+    last_update_ds = series_get_last_update_dataset(bson, 
+                                                    last_update=last_update)
+    
+    clean_values(bson)
+    
+    if not old_bson:
+        series_verify(bson)
+        bson["last_update_ds"] = last_update_ds 
+        bson["last_update_widu"] = clean_datetime()
+        if not IS_SCHEMAS_VALIDATION_DISABLE:
+            schemas.series_schema(bson)
+        return (UNIT_INSERT, bson, None, None, 
+                stats.insert_counts(bson, sample_rate=bytes_sample_rate))
+
+    series_verify(bson, old_bson=old_bson)
+    clean_values(old_bson)
+    
+    if not series_is_changed(bson, old_bson):
+        return UNIT_UNCHANGED, bson, None, None, None
+    
+    if not "version" in old_bson:
+        old_bson["version"] = 0
+    old_version = old_bson["version"]
+    
+    bson["last_update_ds"] = last_update_ds 
+    bson["last_update_widu"] = clean_datetime()
+    bson["version"] = old_version + 1
     
+    if not IS_SCHEMAS_VALIDATION_DISABLE:
+        schemas.series_schema(bson)
+    
+    archive = series_archives_delta_store(old_bson, bson, 
+                                          snapshot=is_snapshot_version(old_version))
+    
+    operation = series_update_operation(bson, old_bson)
+    if operation is None:
+        operation = (None, series_revisions(bson, old_bson))
+    
+    return (UNIT_UPDATE, bson, archive, operation, 
+            stats.update_counts(bson, old_bson, sample_rate=bytes_sample_rate))
+
+def series_update_batch(batch, **kwargs):
+    """Run :func:`series_update_unit` for each (bson, old_bson) of batch
+    
+    Return the list of results in the order of batch.
+    """
+    return [series_update_unit(bson, old_bson, **kwargs) for bson, old_bson in batch]
+
 def clean_values(bson):
     for value in bson["values"]:
         value.pop('ordinal', None)
         value.pop('release_date', None)
         value.pop('revisions', None)
+    normalize_values(bson["values"])
     
 class Series:
     """Time Series class
@@ -1207,6 +1689,22 @@ class Series:
         self.count_inserts = 0
         self.count_updates = 0
         self.count_errors = 0
+        self.count_unchanged = 0
+        
+        self.stats = stats.DatasetStatsCounter()
+        
+        # a write of the series failed in this run
+        self.bulk_error = False
+        
+        # codes used by the series inserted or updated in this run
+        self.used_codes = {}
+        
+        self._tags_documents = None
+        
+        # None: not yet known - see is_initial_load()
+        self.initial_load = None
+        # keys inserted in initial load mode
+        self.loaded_keys = set()
         
     def reset_counters(self):
         self.count_accepts = 0
@@ -1214,6 +1712,9 @@ class Series:
         self.count_inserts = 0
         self.count_updates = 0
         self.count_errors = 0
+        self.count_unchanged = 0
+        self.stats = stats.DatasetStatsCounter()
+        self.bulk_error = False
             
     def __repr__(self):
         return pprint.pformat([('provider_name', self.provider_name),
@@ -1280,6 +1781,7 @@ class Series:
             if not self.fatal_error and len(self.series_list) > 0:
                 self.update_series_list()
             self.update_dataset_lists_finalize()
+            self.consolidate_codelists()
             """
             consolidate.consolidate_dataset(db=self.fetcher.db, {"provider_name": self.provider_name,
                                                     "dataset_code": self.dataset_code})
@@ -1294,27 +1796,24 @@ class Series:
     @timeit("commons.Series.update_dataset_lists_finalize")
     def update_dataset_lists_finalize(self):
         
+        resolver = self.dataset.codelist_resolver
+        slug = resolver.slug
+        
         concepts = {}
-        codelists = {}
         dimension_keys = []
         attribute_keys = []
         
         for key, value in self.dataset.concepts.items():
-            key_slug = slugify(key, save_order=True)
-            concepts[key_slug] = value
+            concepts[slug(key)] = value
             
-        for key, value in self.dataset.codelists.items():
-            new_value = {}
-            for k, v in value.items():
-                new_value[slugify(k, save_order=True)] = v
-            codelists[slugify(key, save_order=True)] = new_value
+        codelists = resolver.slugged_codelists()
             
         for key in self.dataset.dimension_keys:
-            dimension_keys.append(slugify(key, save_order=True))
+            dimension_keys.append(slug(key))
 
         if self.dataset.attribute_keys:
             for key in self.dataset.attribute_keys:
-                attribute_keys.append(slugify(key, save_order=True))
+                attribute_keys.append(slug(key))
             
         self.dataset.concepts = concepts
         self.dataset.codelists = codelists
@@ -1323,11 +1822,122 @@ class Series:
         if self.dataset.attribute_keys:
             self.dataset.attribute_keys = attribute_keys
     
+    def add_used_codes(self, codes):
+        """Accumulate the codes returned by :func:`series_set_codelists`"""
+        for key, values in codes.items():
+            if not key in self.used_codes:
+                self.used_codes[key] = set()
+            self.used_codes[key].update(values)
+
+    @timeit("commons.Series.consolidate_codelists")
+    def consolidate_codelists(self):
+        """Keep only the used codes in the dataset codelists
+        
+        The used codes are the codes of the previous version of the dataset 
+        and the codes of the series inserted or updated in this run. 
+        The unchanged series are not read again.
+        
+        Also run without changes: the codelists set by the fetcher (all the 
+        codes of the DSD) are restricted to the codes of the previous version.
+        
+        The codes that are no longer used and the concepts are consolidated 
+        only by the consolidate command (full scan of the series).
+        """
+        used_codes = {}
+        for key, values in (self.dataset.previous_codes or {}).items():
+            used_codes[key] = set(values)
+        for key, values in self.used_codes.items():
+            if not key in used_codes:
+                used_codes[key] = set()
+            used_codes[key].update(values)
+        
+        keys = set(self.dataset.dimension_keys) | set(self.dataset.attribute_keys or [])
+        
+        codelists = {}
+        for key, values in self.dataset.codelists.items():
+            codes = used_codes.get(key, ())
+            new_values = {k: v for k, v in values.items() if k in codes}
+            if new_values or key in keys:
+                codelists[key] = new_values
+        
+        self.dataset.codelists = codelists
+
+    def get_tags_documents(self):
+        """Return provider and dataset documents used for tags
+        
+        Built once by dataset. The codelists of the dataset document are
+        replaced by the codelists of each series.
+        """
+        if self._tags_documents is None:
+            if self.fetcher.provider:
+                provider_doc = self.fetcher.provider.bson
+            else:
+                provider_doc = {"name": self.provider_name}
+            
+            slug = self.dataset.codelist_resolver.slug
+            concepts = {}
+            for key, value in self.dataset.concepts.items():
+                concepts[slug(key)] = value
+            
+            dataset_doc = {"provider_name": self.provider_name,
+                           "dataset_code": self.dataset_code,
+                           "name": self.dataset.name,
+                           "concepts": concepts,
+                           "codelists": {}}
+            self._tags_documents = (provider_doc, dataset_doc)
+            
+        return self._tags_documents
+    
+    @timeit("commons.Series.generate_tags", stats_only=True)
+    def generate_tags(self, bson):
+        """Return tags of one inserted or changed series"""
+        provider_doc, dataset_doc = self.get_tags_documents()
+        dataset_doc = dict(dataset_doc, codelists=bson.get("codelists") or {})
+        return generate_tags_series(self.get_db(), bson, 
+                                    provider_doc=provider_doc, 
+                                    dataset_doc=dataset_doc)
+
     def get_db(self):
         return self.fetcher.db
         #TODO: settings for new connection
         #return get_mongo_db()
 
+    def get_unit_kwargs(self):
+        """Arguments of :func:`series_update_unit` for this dataset"""
+        return {"provider_name": self.provider_name,
+                "dataset_code": self.dataset_code,
+                "last_update": self.dataset.last_update,
+                "bytes_sample_rate": stats.get_sample_rate(self.count_accepts)}
+
+    def process_series_batch(self, batch):
+        """Run :func:`series_update_unit` for each (bson, old_bson)
+        
+        Return the results in the order of batch. Overridden by the async 
+        modes (dlstats.async) to run the CPU part in a pool.
+        """
+        return series_update_batch(batch, **self.get_unit_kwargs())
+
+    def is_initial_load(self):
+        """True if the old series are not searched
+        
+        Detected once: the dataset has no series in the database. 
+        Disabled by Fetcher.initial_load=False. Fetcher.initial_load=True 
+        does not skip the detection: the insert of the series of a not 
+        empty dataset would fail on the duplicate keys.
+        """
+        if self.initial_load is None:
+            if self.fetcher.initial_load is False:
+                self.initial_load = False
+            else:
+                query = {"provider_name": self.provider_name,
+                         "dataset_code": self.dataset_code}
+                doc = self.get_db()[constants.COL_SERIES].find_one(query, {"_id": True})
+                self.initial_load = doc is None
+            if self.initial_load:
+                msg = "initial load for provider[%s] - dataset[%s]"
+                logger.info(msg % (self.provider_name, self.dataset_code))
+        return self.initial_load
+
     @timeit("commons.Series.update_series_list", stats_only=True)
     def update_series_list(self):
 
@@ -1336,82 +1946,117 @@ class Series:
         
         keys = [s['key'] for s in self.series_list]
 
-        query = {
-            'provider_name': self.provider_name,
-            'dataset_code': self.dataset_code,
-            'key': {'$in': keys}
-        }
+        initial_load = self.is_initial_load()
+        if initial_load:
+            # only the keys already inserted by this run
+            keys = [key for key in keys if key in self.loaded_keys]
 
         db = self.get_db()
-        cursor = db[constants.COL_SERIES].find(query)
 
-        old_series = {s['key']:s for s in cursor}
+        old_series = {}
+        if keys:
+            query = {
+                'provider_name': self.provider_name,
+                'dataset_code': self.dataset_code,
+                'key': {'$in': keys}
+            }
+            cursor = db[constants.COL_SERIES].find(query)
+            old_series = {s['key']:s for s in cursor}
+
+        batch = []
+        batch_codes = []
+        old_ids = {}
+        for bson in self.series_list:
+            codes = bson.pop(SERIES_CODES_FIELD, None)
+            batch_codes.append(series_set_codelists(bson, self.dataset.codelist_resolver, 
+                                                    codes=codes))
+            old_bson = old_series.get(bson['key'])
+            if old_bson:
+                # not sent to the CPU part - tags are generated below
+                old_ids[bson['key']] = (old_bson.pop('_id'), old_bson.pop('tags', None))
+            batch.append((bson, old_bson))
+        
+        results = self.process_series_batch(batch)
 
         bulk_requests = db[constants.COL_SERIES].initialize_ordered_bulk_op()
+        inserts = []
         bulk_requests_archives = db[constants.COL_SERIES_ARCHIVES].initialize_ordered_bulk_op()
+        bulk_requests_vintages = db[constants.COL_SERIES_VINTAGES].initialize_unordered_bulk_op()
         is_operation = False
         is_operation_archives = False
+        is_operation_vintages = False
+
+        # applied to the counters after the write of the series
+        count_inserts = 0
+        count_updates = 0
+        changes = []
+        loaded_keys = []
         
-        for bson in self.series_list:
+        for (action, bson, archive, operation, counts), codes in zip(results, batch_codes):
             
             key = bson['key']
 
-            if not "version" in bson:
-                bson["version"] = 0
-
-            if not bson.get("slug", None):
-                txt = "-".join([self.provider_name, self.dataset_code, key])
-                bson['slug'] = slugify(txt, word_boundary=False, save_order=True)
+            if action == UNIT_UNCHANGED:
+                self.count_unchanged += 1
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug("series[%s] not changed" % bson["slug"])
+                continue
+            
+            changes.append((codes, counts, bson))
+            bson["tags"] = self.generate_tags(bson)
             
-            last_update_ds = series_get_last_update_dataset(bson, 
-                                                            last_update=self.dataset.last_update)
+            if action == UNIT_INSERT:
+                if initial_load:
+                    inserts.append(bson)
+                    loaded_keys.append(key)
+                else:
+                    bulk_requests.insert(bson)
+                    is_operation = True
+                count_inserts += 1
+                continue
             
-            clean_values(bson)
+            count_updates += 1
+            _id, tags = old_ids[key]
+            is_operation = True
+
+            bulk_requests_archives.insert(archive)
+            is_operation_archives = True
             
-            if not key in old_series:
-                series_verify(bson)
-                bson["last_update_ds"] = last_update_ds 
-                bson["last_update_widu"] = clean_datetime()
-                series_set_codelists(bson, self.dataset.codelists)
-                if not IS_SCHEMAS_VALIDATION_DISABLE:
-                    schemas.series_schema(bson)
-                bulk_requests.insert(bson)
-                is_operation = True
-                self.count_inserts += 1
+            query_update, revisions = operation
+            if query_update:
+                if tags != bson["tags"]:
+                    if not "$set" in query_update:
+                        query_update["$set"] = {}
+                    query_update["$set"]["tags"] = bson["tags"]
+                bulk_requests.find({"_id": _id}).update_one(query_update)
             else:
-                old_bson = old_series[key]
-                series_verify(bson, old_bson=old_bson)
-                clean_values(old_bson)
-                
-                _id = old_bson.pop('_id')
-                tags = old_bson.pop('tags', None)
-
-                if series_is_changed(bson, old_bson): 
-                    old_bson["tags"] = tags
-                    if not "version" in old_bson:
-                        old_bson["version"] = 0
-                    old_version = old_bson["version"]
-                    bulk_requests_archives.insert(series_archives_store(old_bson))
-                    is_operation = True
-                    is_operation_archives = True
-                    self.count_updates += 1
-                    bson["tags"] = tags
-                    bson["last_update_ds"] = last_update_ds 
-                    bson["last_update_widu"] = clean_datetime()
-                    bson["version"] = old_version + 1
-                    
-                    series_set_codelists(bson, self.dataset.codelists)
-                    
-                    if not IS_SCHEMAS_VALIDATION_DISABLE:
-                        schemas.series_schema(bson)
-                    
-                    bson["_id"] = _id
-                    bulk_requests.find({"_id": _id}).replace_one(bson)
-                else:
-                    if logger.isEnabledFor(logging.DEBUG):
-                        logger.debug("series[%s] not changed" % old_bson["slug"])                    
+                bson["_id"] = _id
+                bulk_requests.find({"_id": _id}).replace_one(bson)
+
+            for revision in revisions:
+                revision.update({"provider_name": self.provider_name,
+                                 "dataset_code": self.dataset_code,
+                                 "key": key,
+                                 "slug": bson["slug"],
+                                 "version": bson["version"],
+                                 "created": bson["last_update_widu"]})
+                bulk_requests_vintages.insert(revision)
+                is_operation_vintages = True
+
+        result = None
+        if inserts:
+            try:
+                @timeit("commons.Series.update_series_list.insert_many")
+                def _insert_many():
+                    db[constants.COL_SERIES].insert_many(inserts, ordered=False)
+                _insert_many()
+            except pymongo.errors.BulkWriteError as err:
+                self.bulk_error = True
+                self.dataset.enable = False
+                self.dataset.metadata["disable_reason"] = "critical bulk error"
+                logger.critical(str(err.details))
+                raise
 
-        result = None        
         if is_operation is True:
             try:
                 @timeit("commons.Series.update_series_list.execute")
@@ -1419,11 +2064,19 @@ class Series:
                     bulk_requests.execute()
                 _execute()
             except pymongo.errors.BulkWriteError as err:
+                self.bulk_error = True
                 self.dataset.enable = False
                 self.dataset.metadata["disable_reason"] = "critical bulk error"
                 logger.critical(str(err.details))
                 raise
 
+        self.count_inserts += count_inserts
+        self.count_updates += count_updates
+        self.loaded_keys.update(loaded_keys)
+        for codes, counts, bson in changes:
+            self.add_used_codes(codes)
+            self.stats.add(*counts, bson=bson)
+
         if is_operation_archives is True:
             try:
                 @timeit("commons.Series.update_series_list.execute_archives")
@@ -1435,22 +2088,123 @@ class Series:
                 #self.dataset.metadata["disable_reason"] = "critical bulk error"
                 logger.critical(str(err.details))
                 raise
+
+        if is_operation_vintages is True:
+            try:
+                @timeit("commons.Series.update_series_list.execute_vintages")
+                def _execute_vintages():
+                    bulk_requests_vintages.execute()
+                _execute_vintages()
+            except pymongo.errors.BulkWriteError as err:
+                logger.critical(str(err.details))
+                raise
                  
         self.series_list = deque()
         return result
 
 
+class CodelistResolver(object):
+    """Slugged index of the dataset codelists
+    
+    Built once by dataset: keys and codes are slugged only once (memoized 
+    slugify) and the labels are found with dict lookups. 
+    
+    The fetchers can replace or complete dataset.codelists during the 
+    iteration. The index is refreshed when a code is not found: only the 
+    codelists added or changed (size) since the last refresh are indexed.
+    """
+    
+    def __init__(self, dataset=None, codelists=None):
+        """
+        :param Datasets dataset: Use the codelists of this dataset
+        :param dict codelists: Codelists if not dataset
+        """
+        self.dataset = dataset
+        self._codelists = codelists
+        self._slugs = {}
+        self._source = None
+        self._index = {}
+        self._sizes = {}
+    
+    @property
+    def codelists(self):
+        if self.dataset is not None:
+            return self.dataset.codelists
+        return self._codelists
+    
+    def slug(self, value):
+        try:
+            return self._slugs[value]
+        except KeyError:
+            value_slug = slugify(value, save_order=True)
+            self._slugs[value] = value_slug
+            return value_slug
+    
+    def refresh(self):
+        """Index the codelists added or changed - return True if changed"""
+        codelists = self.codelists or {}
+        if not codelists is self._source:
+            self._source = codelists
+            self._index = {}
+            self._sizes = {}
+        
+        changed = False
+        for key, values in codelists.items():
+            size = (id(values), len(values))
+            if self._sizes.get(key) == size:
+                continue
+            key_slug = self.slug(key)
+            if not key_slug in self._index:
+                self._index[key_slug] = {}
+            index = self._index[key_slug]
+            for code, label in values.items():
+                index[self.slug(code)] = label
+            self._sizes[key] = size
+            changed = True
+        
+        return changed
+    
+    def get(self, key, code):
+        """Return the label of code or None - key and code are slugged"""
+        if not self.codelists is self._source:
+            self.refresh()
+        
+        values = self._index.get(key)
+        if values and code in values:
+            return values[code]
+        
+        if self.refresh():
+            values = self._index.get(key)
+            if values:
+                return values.get(code)
+        
+    def slugged_codelists(self):
+        """Return a copy of the codelists with slugged keys and codes"""
+        codelists = {}
+        for key, values in (self.codelists or {}).items():
+            new_values = {}
+            for code, label in values.items():
+                new_values[self.slug(code)] = label
+            codelists[self.slug(key)] = new_values
+        return codelists
+
 class CodeDict():
     """Class for handling code lists
     
     >>> code_list = {'Country': {'FR': 'France'}}
     >>> print(code_list)
     {'Country': {'FR': 'France'}}
+    
+    A reverse index (long id to short id) by dimension is kept up to date
+    by update_entry. It is rebuilt if the code lists are replaced or if 
+    their size is changed outside of update_entry.
     """    
     
     def __init__(self):
         # code_dict is a dict of OrderedDict
         self.code_dict = {}
+        # reverse index - {dim_name: ((id, len), {long_id: short_id})}
+        self._reverse = {}
         if not IS_SCHEMAS_VALIDATION_DISABLE:
             schemas.codedict_schema(self.code_dict)
         
@@ -1458,26 +2212,48 @@ class CodeDict():
         if not IS_SCHEMAS_VALIDATION_DISABLE:
             schemas.codedict_schema(arg.code_dict)
         self.code_dict.update(arg.code_dict)
+        self._reverse = {}
+        
+    def _get_reverse(self, dim_name):
+        codes = self.code_dict[dim_name]
+        state = (id(codes), len(codes))
+        if dim_name in self._reverse:
+            _state, reverse = self._reverse[dim_name]
+            if _state == state:
+                return reverse
+        reverse = {}
+        for k, v in codes.items():
+            if not v in reverse:
+                reverse[v] = k
+        self._reverse[dim_name] = (state, reverse)
+        return reverse
         
     def update_entry(self, dim_name, dim_short_id, dim_long_id):
 
         if not dim_name in self.code_dict:
             self.code_dict[dim_name] = OrderedDict()
-            
-        for k, v in self.code_dict[dim_name].items():
-            if v == dim_long_id:
-                return k
+        
+        codes = self.code_dict[dim_name]
+        reverse = self._get_reverse(dim_name)
+        
+        if dim_long_id in reverse:
+            return reverse[dim_long_id]
             
         if not dim_short_id:
-            if dim_name in self.code_dict:
-                dim_short_id = str(len(self.code_dict[dim_name]))
-            else:
-                dim_short_id = '0' # numerical short id starts with 0
+            dim_short_id = str(len(codes))
 
         if not dim_long_id:
             dim_short_id = 'None'
+        
+        if dim_short_id in codes:
+            # replace the long id of an existing code
+            codes[dim_short_id] = dim_long_id
+            self._reverse.pop(dim_name, None)
+            return dim_short_id
 
-        self.code_dict[dim_name].update({dim_short_id: dim_long_id})
+        codes[dim_short_id] = dim_long_id
+        reverse[dim_long_id] = dim_short_id
+        self._reverse[dim_name] = ((id(codes), len(codes)), reverse)
         
         return dim_short_id
 
@@ -1486,11 +2262,19 @@ class CodeDict():
 
     def get_list(self):
         return {d1: list(d2.items()) for d1,d2 in self.code_dict.items()}
+    
+    def get_codelists(self, keys=None):
+        """Return the code lists in the format of dataset codelists
+        
+        :param list keys: Only this dimensions - all if None
+        """
+        return {d1: dict(d2) for d1, d2 in self.code_dict.items() 
+                if keys is None or d1 in keys}
 
     def set_dict(self, arg):
         self.code_dict = arg
+        self._reverse = {}
         
     def set_from_list(self, **kwargs):
         self.code_dict = {d1: OrderedDict(d2) for d1, d2 in kwargs.items()}
-    
-
+        self._reverse = {}
@@ -12,12 +12,12 @@ import zipfile
 import logging
 
 import xlrd
-import pandas
 
 from widukind_common import errors
 
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, SeriesIterator
 from dlstats.utils import Downloader, clean_datetime
+from dlstats.wide_table import WidePeriods, iter_array_rows
 from dlstats import constants
 
 VERSION = 2
@@ -500,6 +500,9 @@ class BeaData(SeriesIterator):
 
         self.row_ranges = list(iter(range(row_start, sheet.nrows)))
 
+        # concept, name and key columns then the periods from the first year
+        self.periods = WidePeriods.from_range(self.years[0], sheet.ncols - 3, self.frequency)
+
         row_notes = self.sheet.row_values(1)
         if row_notes and len(row_notes[0].strip()) > 0:
             self.dataset.notes = row_notes[0].strip()
@@ -511,12 +514,11 @@ class BeaData(SeriesIterator):
 
     def _get_datas(self):
         try:
-            for i, row_num in enumerate(self.row_ranges):
-
-                row = self.sheet.row_values(row_num)
+            rows = iter_array_rows((self.sheet.row_values(row_num) for row_num in self.row_ranges), 3)
+            for i, row in enumerate(rows):
 
-                key = row[2]
-                name = row[1]
+                key = row.fields[2]
+                name = row.fields[1]
 
                 count_space = sum( 1 for _ in itertools.takewhile(str.isspace, name) )
                 if i == 0 or count_space == 0:
@@ -550,12 +552,16 @@ class BeaData(SeriesIterator):
         dimensions = {}
 
         series = {}
-        series_values = []
 
-        series_key = "%s-%s" % (row[2], self.frequency)
+        if not row.values:
+            msg = {"provider_name": self.provider_name,
+                   "dataset_code": self.dataset_code}
+            raise errors.RejectEmptySeries(**msg)
+
+        series_key = "%s-%s" % (row.fields[2], self.frequency)
         series_name = "%s - %s" % (self.name, constants.FREQUENCIES_DICT[self.frequency])
 
-        dimensions['concept'] = row[2]
+        dimensions['concept'] = row.fields[2]
         dimensions['frequency'] = self.frequency
 
         if not dimensions["frequency"] in self.dataset.codelists["frequency"]:
@@ -564,30 +570,19 @@ class BeaData(SeriesIterator):
         if not dimensions["concept"] in self.dataset.codelists["concept"]:
             self.dataset.codelists["concept"][dimensions["concept"]] = self.name
 
-        start_date = pandas.Period(self.years[0], freq=self.frequency)
-        end_date = pandas.Period(self.years[1], freq=self.frequency)
-
         series['provider_name'] = self.provider_name
         series['dataset_code'] = self.dataset_code
         series['name'] = series_name
         series['key'] = series_key
-        series['start_date'] = start_date.ordinal
-        series['end_date'] = end_date.ordinal
+        series['start_date'] = self.periods.start_date(row)
+        series['end_date'] = self.periods.end_date(row)
         series['last_update'] = self.release_date
         series['dimensions'] = dimensions
         series['frequency'] = self.frequency
         series['attributes'] = {}
 
-        for v in row[3:]:
-            value = {
-                'attributes': None,
-                'period': str(start_date),
-                'value': str(v)
-            }
-            series_values.append(value)
-            start_date += 1
-
-        series['values'] = series_values
+        series['values'] = [{'attributes': None, 'period': period, 'value': str(v)}
+                            for period, v in self.periods.iter_values(row)]
 
         self.dataset.add_frequency(self.frequency)
 
@@ -15,8 +15,9 @@ from lxml import etree
 from widukind_common import errors
 
 from dlstats import constants
-from dlstats.utils import Downloader, get_ordinal_from_period
+from dlstats.utils import Downloader
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, SeriesIterator
+from dlstats.wide_table import WidePeriods, read_wide_csv, iter_wide_rows
 
 VERSION = 4
 
@@ -408,8 +409,7 @@ class BIS_Data(SeriesIterator):
         self.release_date = None
         self.dimension_keys = None
         self.periods = None
-        self.start_date = None
-        self.end_date = None
+        self.wide_periods = None
         self._rows = None
         self._file = None
 
@@ -440,7 +440,12 @@ class BIS_Data(SeriesIterator):
         
         kwargs['date_format'] = "%a %b %d %H:%M:%S %Z %Y"
         kwargs['headers_line'] = DATASETS[self.dataset.dataset_code]['lines']['headers']
-        self._file, self._rows, self.headers, self.release_date, self.dimension_keys, self.periods = local_read_csv(**kwargs)
+        self._file, _rows, self.headers, self.release_date, self.dimension_keys, self.periods = local_read_csv(**kwargs)
+
+        # the file is read by chunks from the first data line
+        self._rows = iter_wide_rows(read_wide_csv(self._file, header=None, names=self.headers),
+                                    self.periods,
+                                    self.dimension_keys + ["KEY"])
         
         self.dataset.dimension_keys = self.dimension_keys
         
@@ -449,8 +454,7 @@ class BIS_Data(SeriesIterator):
         
         self.dataset.last_update = self.release_date
         
-        self.start_date = get_ordinal_from_period(self.periods[0], freq=self.frequency)
-        self.end_date = get_ordinal_from_period(self.periods[-1], freq=self.frequency)
+        self.wide_periods = WidePeriods(self.periods, freq=self.frequency)
 
     def is_updated(self):
 
@@ -468,7 +472,7 @@ class BIS_Data(SeriesIterator):
     def _process(self):
         try:
             for row in self._rows:
-                yield csv_dict(self.headers, row), None
+                yield row, None
         finally:
             if self._file and not self._file.closed:
                 self._file.close()
@@ -481,9 +485,15 @@ class BIS_Data(SeriesIterator):
         #for k, attributes in self.attribute_list.get_dict().items():
         #    self.dataset.codelists[k] = attributes
 
-    def build_series(self, row):
+    def build_series(self, wide_row):
+        row = wide_row.fields
         series_key = row['KEY']
 
+        if not wide_row.values:
+            msg = {"provider_name": self.provider_name,
+                   "dataset_code": self.dataset_code}
+            raise errors.RejectEmptySeries(**msg)
+
         dimensions = OrderedDict()
         
         for d in self.dimension_keys:
@@ -497,15 +507,8 @@ class BIS_Data(SeriesIterator):
 
         series_name = " - ".join([row[d].split(":")[1] for d in self.dimension_keys])
 
-        values = []
-        
-        for period in self.periods:
-            value = {
-                'attributes': None,
-                'period': period,
-                'value': row[period]
-            }
-            values.append(value)
+        values = [{'attributes': None, 'period': period, 'value': value}
+                  for period, value in self.wide_periods.iter_values(wide_row)]
         
         bson = {'provider_name': self.dataset.provider_name,
                 'dataset_code': self.dataset.dataset_code,
@@ -515,8 +518,8 @@ class BIS_Data(SeriesIterator):
                 'attributes': None,
                 'dimensions': dimensions,
                 'last_update': self.release_date,
-                'start_date': self.start_date,
-                'end_date': self.end_date,
+                'start_date': self.wide_periods.start_date(wide_row),
+                'end_date': self.wide_periods.end_date(wide_row),
                 'frequency': self.frequency}
 
         return bson
@@ -1,14 +1,67 @@
 # -*- coding: utf-8 -*-
 
+"""DUMMY provider: sample dataset and synthetic datasets for load tests
+
+Without settings, the fetcher loads one sample dataset (ds1 - one series).
+
+With a list of :class:`SyntheticDataset`, the datasets are generated with
+N series of M observations, a mix of frequencies, the cardinalities of the
+dimensions, a rate of revised series by release and a density of the
+observation attributes. Each series is generated from the seed, the
+dataset code and its position only, so:
+
+- the same settings give the same series on each run
+- the series are generated on demand (no memory used for 10M series)
+- the release N changes the last values of about revision_rate * N series
+
+The series are served as in-memory iterators or as CSV / SDMX-ML files by a
+local HTTP server (:class:`SyntheticServer`) read with the Downloader:
+
+>>> ds = SyntheticDataset("ds2", series_count=100000, obs_count=40,
+...                       frequencies={"A": 1, "Q": 2, "M": 1})
+>>> fetcher = DUMMY(db=db, datasets=[ds])
+>>> fetcher.upsert_dataset("ds2")
+"""
+
+import io
+import csv
+import copy
+import math
+import random
+import bisect
+import logging
+import threading
+from itertools import groupby
+from collections import OrderedDict
+from xml.sax.saxutils import quoteattr
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from socketserver import ThreadingMixIn
+from urllib.parse import urlparse, parse_qs
+
 from dlstats import constants
 from dlstats.utils import Downloader, clean_datetime
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, SeriesIterator
 
 VERSION = 1
 
+logger = logging.getLogger(__name__)
+
+FREQUENCY_PERIODS = OrderedDict([("A", 1), ("Q", 4), ("M", 12)])
+
+OBS_STATUS = OrderedDict([("E", "Estimated"), 
+                          ("P", "Provisional"), 
+                          ("B", "Break")])
+
+FORMAT_CSV = "csv"
+FORMAT_SDMX = "xml"
+
 class DUMMY(Fetcher):
     
-    def __init__(self, **kwargs):
+    def __init__(self, datasets=None, base_url=None, **kwargs):
+        """
+        :param list datasets: SyntheticDataset instances - sample dataset ds1 if None
+        :param str base_url: URL of a SyntheticServer (csv files) - in memory series if None
+        """
         super().__init__(provider_name='DUMMY', version=VERSION, **kwargs)
         
         self.provider = Providers(name=self.provider_name,
@@ -18,8 +71,14 @@ class DUMMY(Fetcher):
                                   website='http://www.example.org', 
                                   fetcher=self)
         
+        self.synthetic_datasets = OrderedDict((ds.dataset_code, ds) for ds in datasets or [])
+        self.base_url = base_url
+        
     def upsert_dataset(self, dataset_code):
         
+        if dataset_code in self.synthetic_datasets:
+            return self.upsert_synthetic_dataset(self.synthetic_datasets[dataset_code])
+        
         dataset = Datasets(provider_name=self.provider_name, 
                            dataset_code=dataset_code, 
                            name="My Dataset Name",
@@ -33,11 +92,41 @@ class DUMMY(Fetcher):
         dataset.series.data_iterator = fetcher_data
 
         return dataset.update_database()
+
+    def upsert_synthetic_dataset(self, synthetic):
+
+        dataset = Datasets(provider_name=self.provider_name, 
+                           dataset_code=synthetic.dataset_code, 
+                           name=synthetic.name,
+                           last_update=clean_datetime(), 
+                           fetcher=self)
+        dataset.dimension_keys = synthetic.dimension_keys
+        dataset.attribute_keys = ["OBS_STATUS"]
+        dataset.concepts = dict((key, key.title()) for key in dataset.dimension_keys + dataset.attribute_keys)
+        dataset.codelists = dict((key, dict(codes)) for key, codes in synthetic.codelists().items())
+        dataset.series.data_iterator = DUMMY_SyntheticData(dataset, synthetic, 
+                                                           base_url=self.base_url)
+
+        return dataset.update_database()
             
     def build_data_tree(self):
         
         categories = []
 
+        if self.synthetic_datasets:
+            categories.append({
+                "category_code": "synthetic",
+                "name": "Synthetic datasets",
+                "doc_href": None,
+                "datasets": [{
+                    "name": ds.name,
+                    "dataset_code": ds.dataset_code,
+                    "last_update": None, 
+                    "metadata": None
+                } for ds in self.synthetic_datasets.values()]
+            })
+            return categories
+
         categories.append({
             "category_code": "c1",
             "name": "category 1",
@@ -94,4 +183,357 @@ class DUMMY_Data(SeriesIterator):
         bson["last_update"] = self.dataset.last_update
         return bson
         
-    
\ No newline at end of file
+    
+class DUMMY_SyntheticData(SeriesIterator):
+
+    def __init__(self, dataset, synthetic, base_url=None):
+        """
+        :param SyntheticDataset synthetic: Settings of the dataset
+        :param str base_url: Read the csv file of a SyntheticServer if set
+        """
+        super().__init__(dataset)
+        self.synthetic = synthetic
+        self.base_url = base_url
+
+        self.rows = self._process()
+
+    def _get_series(self):
+        if not self.base_url:
+            return self.synthetic.iter_series()
+
+        url = "%s/%s.%s?release=%s" % (self.base_url.rstrip("/"), 
+                                       self.synthetic.dataset_code, FORMAT_CSV,
+                                       self.synthetic.release)
+        download = Downloader(url=url, 
+                              filename="%s-%s.csv" % (self.synthetic.dataset_code,
+                                                      self.synthetic.release),
+                              store_filepath=self.get_store_path(),
+                              use_existing_file=self.fetcher.use_existing_file,
+                              use_artifacts=False)
+        filepath = download.get_filepath()
+        self.fetcher.for_delete.append(filepath)
+        return self.synthetic.iter_csv_series(filepath)
+
+    def _process(self):
+        for bson in self._get_series():
+            yield bson, None
+
+    def build_series(self, bson):
+        bson["last_update"] = self.dataset.last_update
+        return bson
+
+def get_period(frequency, ordinal):
+    """Period of the ordinal (1970 = 0): 2000, 2000-Q1 or 2000-01"""
+    year, position = divmod(ordinal, FREQUENCY_PERIODS[frequency])
+    year += 1970
+    if frequency == "A":
+        return str(year)
+    if frequency == "Q":
+        return "%s-Q%s" % (year, position + 1)
+    return "%s-%02d" % (year, position + 1)
+
+class SyntheticDataset(object):
+    """Settings and generator of one synthetic dataset"""
+
+    def __init__(self, dataset_code, 
+                 series_count=100, 
+                 obs_count=20,
+                 frequencies=None, 
+                 dimensions=None,
+                 revision_rate=0.1, 
+                 attribute_density=0.1,
+                 seed=0, 
+                 release=0, 
+                 end_year=2015,
+                 name=None):
+        """
+        :param str dataset_code: Dataset code
+        :param int series_count: Number of series
+        :param int obs_count: Number of observations by series
+        :param dict frequencies: Weight by frequency - {"A": 1, "Q": 2, "M": 1}
+        :param list dimensions: [(dimension key, cardinality)] - the product of 
+                                the cardinalities must be >= series_count
+        :param float revision_rate: Rate of the series revised by release
+        :param float attribute_density: Rate of the observations with an OBS_STATUS
+        :param seed: Seed of the generator
+        :param int release: Release of the dataset (0: first release)
+        :param int end_year: Year of the last observation
+
+        :raises ValueError: if a frequency is not valid or not enough dimension codes
+        """
+        self.dataset_code = dataset_code
+        self.name = name or "Synthetic dataset %s" % dataset_code
+        self.series_count = series_count
+        self.obs_count = obs_count
+        self.frequencies = OrderedDict(sorted((frequencies or {"A": 1}).items()))
+        self.revision_rate = revision_rate
+        self.attribute_density = attribute_density
+        self.seed = seed
+        self.release = release
+        self.end_year = end_year
+
+        if dimensions is None:
+            countries = max(1, min(series_count, 50))
+            dimensions = [("COUNTRY", countries), 
+                          ("INDICATOR", int(math.ceil(series_count / countries)))]
+        self.dimensions = OrderedDict(dimensions)
+
+        for frequency in self.frequencies.keys():
+            if not frequency in FREQUENCY_PERIODS:
+                raise ValueError("not implemented frequency [%s]" % frequency)
+
+        capacity = 1
+        for cardinality in self.dimensions.values():
+            capacity *= cardinality
+        if capacity < series_count:
+            msg = "not enough dimension codes for %s series - max %s"
+            raise ValueError(msg % (series_count, capacity))
+
+        self._codelists = None
+        self._weights = []
+        total = 0
+        for weight in self.frequencies.values():
+            total += weight
+            self._weights.append(total)
+
+    @property
+    def dimension_keys(self):
+        return ["FREQ"] + list(self.dimensions.keys())
+
+    def with_release(self, release):
+        """Copy of the settings for another release"""
+        synthetic = copy.copy(self)
+        synthetic.release = release
+        return synthetic
+
+    def get_code(self, key, position):
+        return "%s%s" % (key[0], position)
+
+    def get_label(self, key, position):
+        return "%s %s" % (key.title(), position)
+
+    def codelists(self):
+        if self._codelists:
+            return self._codelists
+        codelists = OrderedDict()
+        codelists["FREQ"] = dict((f, constants.FREQUENCIES_DICT.get(f, f)) 
+                                 for f in self.frequencies.keys())
+        for key, cardinality in self.dimensions.items():
+            codelists[key] = dict((self.get_code(key, i), self.get_label(key, i)) 
+                                  for i in range(cardinality))
+        codelists["OBS_STATUS"] = dict(OBS_STATUS)
+        self._codelists = codelists
+        return codelists
+
+    def get_positions(self, index):
+        """Position of the code of each dimension (the last one changes first)"""
+        positions = []
+        for cardinality in reversed(list(self.dimensions.values())):
+            index, position = divmod(index, cardinality)
+            positions.append(position)
+        return list(reversed(positions))
+
+    def _random(self, *args):
+        return random.Random("-".join(str(arg) for arg in (self.seed, self.dataset_code) + args))
+
+    def build_series(self, index):
+        """bson of the series at this position"""
+        rng = self._random(index)
+
+        frequency = list(self.frequencies.keys())[
+            bisect.bisect_right(self._weights, rng.random() * self._weights[-1])]
+
+        dimensions = OrderedDict([("FREQ", frequency)])
+        for key, position in zip(self.dimensions.keys(), self.get_positions(index)):
+            dimensions[key] = self.get_code(key, position)
+
+        periods = FREQUENCY_PERIODS[frequency]
+        end_date = (self.end_year - 1970 + 1) * periods - 1
+        start_date = end_date - self.obs_count + 1
+
+        level = rng.uniform(10, 1000)
+        values = []
+        for ordinal in range(start_date, end_date + 1):
+            level *= 1 + rng.gauss(0, 0.02)
+            attributes = None
+            if self.attribute_density and rng.random() < self.attribute_density:
+                attributes = {"OBS_STATUS": rng.choice(list(OBS_STATUS.keys()))}
+            values.append({"period": get_period(frequency, ordinal),
+                           "value": "%.3f" % level,
+                           "attributes": attributes})
+
+        for release in range(1, self.release + 1):
+            rng = self._random(index, "r%s" % release)
+            if rng.random() >= self.revision_rate:
+                continue
+            for obs in values[-rng.randint(1, min(4, len(values))):]:
+                obs["value"] = "%.3f" % (float(obs["value"]) * (1 + rng.gauss(0, 0.01)))
+
+        return self.make_bson(dimensions, values)
+
+    def make_bson(self, dimensions, values):
+        """bson of the series - the last observation is in end_year"""
+        codelists = self.codelists()
+        frequency = dimensions["FREQ"]
+        periods = FREQUENCY_PERIODS[frequency]
+        end_date = (self.end_year - 1970 + 1) * periods - 1
+        return {'provider_name': "DUMMY",
+                'dataset_code': self.dataset_code,
+                'name': " - ".join(codelists[key][code] for key, code in dimensions.items()),
+                'key': ".".join(dimensions.values()),
+                'values': values,
+                'attributes': None,
+                'dimensions': dimensions,
+                'start_date': end_date - len(values) + 1,
+                'end_date': end_date,
+                'frequency': frequency}
+
+    def iter_series(self, start=0, stop=None):
+        """Yield the bson of the series from start to stop (excluded)"""
+        stop = self.series_count if stop is None else min(stop, self.series_count)
+        for index in range(start, stop):
+            yield self.build_series(index)
+
+    @property
+    def csv_headers(self):
+        return ["KEY"] + self.dimension_keys + ["PERIOD", "VALUE", "OBS_STATUS"]
+
+    def write_csv(self, fp):
+        """Write the series in long format (one row by observation)"""
+        writer = csv.writer(fp)
+        writer.writerow(self.csv_headers)
+        for bson in self.iter_series():
+            dimensions = list(bson["dimensions"].values())
+            for obs in bson["values"]:
+                attributes = obs["attributes"] or {}
+                writer.writerow([bson["key"]] + dimensions + 
+                                [obs["period"], obs["value"], attributes.get("OBS_STATUS", "")])
+
+    def iter_csv_series(self, filepath):
+        """Yield the bson of the series of a csv file (see :meth:`write_csv`)"""
+        with open(filepath, newline="", encoding="utf-8") as fp:
+            reader = csv.DictReader(fp)
+            for series_key, rows in groupby(reader, key=lambda row: row["KEY"]):
+                rows = list(rows)
+                dimensions = OrderedDict((key, rows[0][key]) for key in self.dimension_keys)
+                values = [{"period": row["PERIOD"],
+                           "value": row["VALUE"],
+                           "attributes": row["OBS_STATUS"] and {"OBS_STATUS": row["OBS_STATUS"]} or None} 
+                          for row in rows]
+                yield self.make_bson(dimensions, values)
+
+    def write_sdmx(self, fp):
+        """Write the series in SDMX-ML 2.1 GenericData"""
+        fp.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                 '<message:GenericData xmlns:message="http://www.sdmx.org/resources/sdmxml/schemas/v2_1/message" '
+                 'xmlns:generic="http://www.sdmx.org/resources/sdmxml/schemas/v2_1/data/generic" '
+                 'xmlns:common="http://www.sdmx.org/resources/sdmxml/schemas/v2_1/common">\n'
+                 '<message:Header><message:ID>%s</message:ID><message:Test>true</message:Test>'
+                 '<message:Prepared>%s-01-01T00:00:00</message:Prepared><message:Sender id="DUMMY"/>'
+                 '<message:Structure structureID="DUMMY_%s" dimensionAtObservation="TIME_PERIOD">'
+                 '<common:Structure><Ref agencyID="DUMMY" id="%s"/></common:Structure>'
+                 '</message:Structure></message:Header>\n'
+                 '<message:DataSet structureRef="DUMMY_%s">\n' % ((self.dataset_code, self.end_year + 1) + 
+                                                                  (self.dataset_code,) * 3))
+        for bson in self.iter_series():
+            fp.write('<generic:Series><generic:SeriesKey>')
+            for key, value in bson["dimensions"].items():
+                fp.write('<generic:Value id=%s value=%s/>' % (quoteattr(key), quoteattr(value)))
+            fp.write('</generic:SeriesKey>\n')
+            for obs in bson["values"]:
+                fp.write('<generic:Obs><generic:ObsDimension value="%s"/><generic:ObsValue value="%s"/>' % (
+                         obs["period"], obs["value"]))
+                if obs["attributes"]:
+                    fp.write('<generic:Attributes><generic:Value id="OBS_STATUS" value="%s"/></generic:Attributes>' % (
+                             obs["attributes"]["OBS_STATUS"]))
+                fp.write('</generic:Obs>\n')
+            fp.write('</generic:Series>\n')
+        fp.write('</message:DataSet>\n</message:GenericData>\n')
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+class SyntheticServer(object):
+    """Local HTTP server of synthetic datasets (stand-in of a provider)
+
+    GET /<dataset_code>.csv or /<dataset_code>.xml - ?release=N
+
+    The files are generated during the response (not stored).
+
+    >>> with SyntheticServer([ds]) as server:
+    ...     fetcher = DUMMY(db=db, datasets=[ds], base_url=server.url)
+    """
+
+    def __init__(self, datasets, host="127.0.0.1", port=0):
+        """
+        :param list datasets: SyntheticDataset instances
+        :param int port: Port of the server - 0 for a free port
+        """
+        self.datasets = OrderedDict((ds.dataset_code, ds) for ds in datasets)
+        self.host = host
+        self.port = port
+        self.server = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return "http://%s:%s" % (host, port)
+
+    def get_handler(self):
+        datasets = self.datasets
+
+        class Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                dataset_code, _, data_format = url.path.strip("/").rpartition(".")
+                if not dataset_code in datasets or not data_format in [FORMAT_CSV, FORMAT_SDMX]:
+                    self.send_error(404)
+                    return
+
+                release = int(parse_qs(url.query).get("release", ["0"])[0])
+                synthetic = datasets[dataset_code].with_release(release)
+
+                self.send_response(200)
+                if data_format == FORMAT_CSV:
+                    self.send_header("Content-Type", "text/csv; charset=utf-8")
+                else:
+                    self.send_header("Content-Type", "application/xml; charset=utf-8")
+                self.end_headers()
+
+                fp = io.TextIOWrapper(self.wfile, encoding="utf-8", newline="",
+                                      write_through=False)
+                try:
+                    if data_format == FORMAT_CSV:
+                        synthetic.write_csv(fp)
+                    else:
+                        synthetic.write_sdmx(fp)
+                    fp.flush()
+                finally:
+                    fp.detach()
+
+            def log_message(self, format, *args):
+                logger.debug("synthetic server: " + format % args)
+
+        return Handler
+
+    def start(self):
+        self.server = _ThreadingHTTPServer((self.host, self.port), self.get_handler())
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        logger.info("synthetic server started on %s" % self.url)
+        return self
+
+    def stop(self):
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+            self.thread.join()
+            self.server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
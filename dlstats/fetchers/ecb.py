@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import os
+from collections import deque
 from datetime import datetime
 import logging
 import re
@@ -14,8 +15,9 @@ from dlstats.utils import Downloader
 from dlstats.xml_utils import (XMLStructure_2_1 as XMLStructure, 
                                XMLSpecificData_2_1_ECB as XMLData,
                                dataset_converter,
-                               select_dimension,
-                               get_key_for_dimension,
+                               SlicePlanner,
+                               get_key_for_slice,
+                               get_filename_for_key,
                                get_dimensions_from_dsd)
 
 HTTP_ERROR_NOT_MODIFIED = 304
@@ -23,6 +25,7 @@ HTTP_ERROR_LONG_RESPONSE = 413
 HTTP_ERROR_NO_RESULT = 404
 HTTP_ERROR_BAD_REQUEST = 400
 HTTP_ERROR_SERVER_ERROR = 500
+HTTP_ERROR_GATEWAY_TIMEOUT = 504
 
 VERSION = 5
 
@@ -305,13 +308,15 @@ class ECB_Data(SeriesIterator):
         
         dimension_keys, dimensions = self._get_dimensions_from_dsd()
         
-        position, _key, dimension_values = select_dimension(dimension_keys, dimensions)
+        planner = SlicePlanner(dimension_keys, dimensions,
+                               stats=self.dataset.metadata.get("slices"))
+        slices = deque(planner.slices())
         
-        count_dimensions = len(dimension_keys)
+        logger.info("filterkey[%s] - slices[%s] - provider[%s] - dataset[%s]" % (planner.dimension_key, len(slices), self.provider_name, self.dataset_code))
         
-        for dimension_value in dimension_values:
-            
-            key = get_key_for_dimension(count_dimensions, position, dimension_value)
+        while slices:
+            _slice = slices.popleft()
+            key = get_key_for_slice(dimension_keys, _slice)
 
             #http://sdw-wsrest.ecb.int/service/data/IEAQ/A............
             url = "http://sdw-wsrest.ecb.int/service/data/%s/%s" % (self.dataset_code, key)
@@ -321,7 +326,7 @@ class ECB_Data(SeriesIterator):
             
             headers = SDMX_DATA_HEADERS
             
-            filename = "data-%s-%s.xml" % (self.dataset_code, key.replace(".", "_"))               
+            filename = get_filename_for_key(self.dataset_code, key)               
             download = Downloader(url=url, 
                                   filename=filename,
                                   store_filepath=self.store_path,
@@ -329,23 +334,46 @@ class ECB_Data(SeriesIterator):
                                   use_existing_file=self.fetcher.use_existing_file,
                                   #client=self.fetcher.requests_client
                                   )
-            filepath, response = download.get_filepath_and_response()
+            try:
+                filepath, response = download.get_filepath_and_response()
+            except requests.exceptions.Timeout:
+                filepath, response = None, None
+                status_code = HTTP_ERROR_GATEWAY_TIMEOUT
+            else:
+                status_code = response.status_code if response is not None else None
+
+            if response:
+                self._add_url_cache(url, response.status_code)
+
+            if status_code in [HTTP_ERROR_LONG_RESPONSE, HTTP_ERROR_GATEWAY_TIMEOUT]:
+                sub_slices = planner.split(_slice)
+                if sub_slices:
+                    logger.warning("split url[%s] - status_code[%s] - slices[%s]" % (url, status_code, len(sub_slices)))
+                    slices.extendleft(reversed(sub_slices))
+                else:
+                    logger.error("not split url[%s] - status_code[%s]" % (url, status_code))
+                    planner.add_error(_slice)
+                continue
+            elif status_code == HTTP_ERROR_NO_RESULT:
+                planner.add_empty(_slice)
+                continue
+            elif status_code and status_code >= 300:
+                planner.add_error(_slice)
+                continue
 
             if filepath and os.path.exists(filepath):
                 self.fetcher.for_delete.append(filepath)
             elif not filepath or not os.path.exists(filepath):
+                planner.add_error(_slice)
                 continue
-
-            if response:
-                self._add_url_cache(url, response.status_code)
-            elif response and response.status_code == HTTP_ERROR_NO_RESULT:
-                continue
-            elif response and response.status_code >= 400:
-                raise response.raise_for_status()
     
             for row, err in self.xml_data.process(filepath):
+                if row and not err:
+                    planner.add_series(row)
                 yield row, err
 
+        self.dataset.metadata["slices"] = planner.get_stats()
+
         yield None, None
                         
     def _set_dataset(self):
@@ -1,10 +1,10 @@
 # -*- coding: utf-8 -*-
 
 import os
-import csv
 from datetime import datetime
 from re import match
 import logging
+from collections import deque
 from urllib.parse import urljoin
 
 import requests
@@ -12,15 +12,23 @@ from lxml import etree
 
 from widukind_common import errors
 
-from dlstats.utils import Downloader, get_ordinal_from_period, clean_datetime, clean_key, clean_dict
+from dlstats.utils import Downloader, clean_datetime, clean_key, clean_dict, get_requests_session
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, SeriesIterator
 from dlstats import constants
+from dlstats.wide_table import WidePeriods, read_wide_header, read_wide_csv, iter_wide_rows
 from dlstats.xml_utils import (XMLStructure_2_0 as XMLStructure,
                                XMLCompactData_2_0_IMF as XMLData,
                                dataset_converter,
-                               select_dimension,
+                               SlicePlanner,
+                               get_key_for_slice,
+                               get_filename_for_key,
                                get_dimensions_from_dsd)
 
+HTTP_ERROR_LONG_RESPONSE = 413
+HTTP_ERROR_NO_RESULT = 404
+
+IMF_MAX_SERIES = 2999 #series by response
+
 VERSION = 3
 
 logger = logging.getLogger(__name__)
@@ -684,7 +692,7 @@ class IMF(Fetcher):
                                   terms_of_use='http://www.imf.org/external/terms.htm',
                                   fetcher=self)
 
-        self.requests_client = requests.Session()
+        self.requests_client = get_requests_session()
 
     def build_data_tree(self):
 
@@ -773,25 +781,20 @@ class IMF_XML_Data(SeriesIterator):
 
         dimension_keys, dimensions = self._get_dimensions_from_dsd()
 
-        position, _key, dimension_values = select_dimension(dimension_keys, dimensions, choice="max")
-
-        count_dimensions = len(dimension_keys)
+        planner = SlicePlanner(dimension_keys, dimensions,
+                               stats=self.dataset.metadata.get("slices"),
+                               choice="max",
+                               max_series=IMF_MAX_SERIES)
+        slices = deque(planner.slices())
 
-        for dimension_value in dimension_values:
+        while slices:
             '''Pour chaque valeur de la dimension, generer une key d'url'''
 
-            local_count = 0
-
-            sdmx_key = []
-            for i in range(count_dimensions):
-                if i == position:
-                    sdmx_key.append(dimension_value)
-                else:
-                    sdmx_key.append(".")
-            key = "".join(sdmx_key)
+            _slice = slices.popleft()
+            key = get_key_for_slice(dimension_keys, _slice)
 
             url = "%s/%s" % (self._get_url_data(), key)
-            filename = "data-%s-%s.xml" % (self.dataset_code, key.replace(".", "_"))
+            filename = get_filename_for_key(self.dataset_code, key)
             download = Downloader(url=url,
                                   filename=filename,
                                   store_filepath=self.store_path,
@@ -801,20 +804,45 @@ class IMF_XML_Data(SeriesIterator):
             if filepath:
                 self.fetcher.for_delete.append(filepath)
 
-            if response.status_code >= 400 and response.status_code < 500:
+            if response.status_code == HTTP_ERROR_LONG_RESPONSE:
+                sub_slices = planner.split(_slice)
+                if sub_slices:
+                    logger.warning("split url[%s] - slices[%s]" % (url, len(sub_slices)))
+                    slices.extendleft(reversed(sub_slices))
+                else:
+                    planner.add_error(_slice)
+                continue
+            elif response.status_code == HTTP_ERROR_NO_RESULT:
+                planner.add_empty(_slice)
+                continue
+            elif response.status_code >= 400 and response.status_code < 500:
+                planner.add_error(_slice)
                 continue
             elif response.status_code >= 500:
                 raise response.raise_for_status()
 
-            for row, err in self.xml_data.process(filepath):
+            rows = list(self.xml_data.process(filepath))
+            local_count = len(rows)
+
+            if local_count >= IMF_MAX_SERIES:
+                # the response is truncated at IMF_MAX_SERIES without error
+                sub_slices = planner.split(_slice)
+                if sub_slices:
+                    logger.warning("truncated response - split url[%s] - series[%s] - slices[%s]" % (url, local_count, len(sub_slices)))
+                    slices.extendleft(reversed(sub_slices))
+                    continue
+                logger.error("truncated response - not split url[%s] - series[%s]" % (url, local_count))
+                planner.add_error(_slice)
+
+            for row, err in rows:
+                if row and not err:
+                    planner.add_series(row)
                 yield row, err
-                local_count += 1
-
-            if local_count >= 2999:
-                logger.warning("TODO: VRFY - series > 2999 for provider[IMF] - dataset[%s] - key[%s]" % (self.dataset_code, key))
 
             #self.dataset.update_database(save_only=True)
 
+        self.dataset.metadata["slices"] = planner.get_stats()
+
         yield None, None
 
     def build_series(self, bson):
@@ -822,6 +850,14 @@ class IMF_XML_Data(SeriesIterator):
         self.dataset.add_frequency(bson["frequency"])
         return bson
 
+WEO_CSV_SETTINGS = {"sep": "\t", "encoding": "latin-1"}
+
+WEO_NA_VALUES = ("", "n/a", "--")
+
+def weo_clean_values(frame):
+    """Remove the thousands separator: 1,234.5 -> 1234.5"""
+    return frame.replace(",", "", regex=True)
+
 class WeoData(SeriesIterator):
 
     def __init__(self, dataset):
@@ -912,19 +948,18 @@ class WeoData(SeriesIterator):
             data_filepath = download.get_filepath()
             self.fetcher.for_delete.append(data_filepath)
 
-            with open(data_filepath, encoding='latin-1') as fp:
+            columns = read_wide_header(data_filepath, **WEO_CSV_SETTINGS)
+            self.years = WidePeriods(columns[9:-1], freq=self.frequency)
 
-                self.sheet = csv.DictReader(fp, dialect=csv.excel_tab)
-                self.years = self.sheet.fieldnames[9:-1]
-                self.start_date = get_ordinal_from_period(self.years[0],
-                                                          freq=self.frequency)
-                self.end_date = get_ordinal_from_period(self.years[-1],
-                                                        freq=self.frequency)
-
-                for row in self.sheet:
-                    if not row or not row.get('Country'):
-                        break
-                    yield row, None
+            rows = iter_wide_rows(read_wide_csv(data_filepath, **WEO_CSV_SETTINGS),
+                                  self.years.labels,
+                                  columns[:9] + columns[-1:],
+                                  na_values=WEO_NA_VALUES,
+                                  clean=weo_clean_values)
+            for row in rows:
+                if not row.fields.get('Country'):
+                    break
+                yield row, None
 
         yield None, None
 
@@ -938,11 +973,17 @@ class WeoData(SeriesIterator):
 
         return False
 
-    def build_series(self, row):
+    def build_series(self, wide_row):
 
+        row = wide_row.fields
         dimensions = {}
         attributes = {}
 
+        if not wide_row.values:
+            msg = {"provider_name": self.provider_name,
+                   "dataset_code": self.dataset_code}
+            raise errors.RejectEmptySeries(**msg)
+
         #'WEO Subject Code': (BCA, Current account balance)
         weo_subject_code = row['WEO Subject Code']
 
@@ -1002,11 +1043,11 @@ class WeoData(SeriesIterator):
         if row['Estimates Start After']:
             estimation_start = int(row['Estimates Start After'])
 
-        for period in self.years:
+        for period, value in self.years.iter_values(wide_row):
             value = {
                 'attributes': None,
                 'period': period,
-                'value': row[period].replace(',' ,'')
+                'value': value
             }
             if estimation_start:
                 if int(period) >= estimation_start:
@@ -1023,8 +1064,8 @@ class WeoData(SeriesIterator):
             'attributes': attributes,
             'dimensions': dimensions,
             'last_update': self.release_date,
-            'start_date': self.start_date,
-            'end_date': self.end_date,
+            'start_date': self.years.start_date(wide_row),
+            'end_date': self.years.end_date(wide_row),
             'frequency': self.frequency
         }
 
@@ -1131,19 +1172,18 @@ class WeoGroupsData(SeriesIterator):
             data_filepath = download.get_filepath()
             self.fetcher.for_delete.append(data_filepath)
 
-            with open(data_filepath, encoding='latin-1') as fp:
+            columns = read_wide_header(data_filepath, **WEO_CSV_SETTINGS)
+            self.years = WidePeriods(columns[8:-1], freq=self.frequency)
 
-                self.sheet = csv.DictReader(fp, dialect=csv.excel_tab)
-                self.years = self.sheet.fieldnames[8:-1]
-                self.start_date = get_ordinal_from_period(self.years[0],
-                                                          freq=self.frequency)
-                self.end_date = get_ordinal_from_period(self.years[-1],
-                                                        freq=self.frequency)
-
-                for row in self.sheet:
-                    if not row or not row.get('Country Group Name'):
-                        break
-                    yield row, None
+            rows = iter_wide_rows(read_wide_csv(data_filepath, **WEO_CSV_SETTINGS),
+                                  self.years.labels,
+                                  columns[:8] + columns[-1:],
+                                  na_values=WEO_NA_VALUES,
+                                  clean=weo_clean_values)
+            for row in rows:
+                if not row.fields.get('Country Group Name'):
+                    break
+                yield row, None
 
         yield None, None
 
@@ -1157,11 +1197,17 @@ class WeoGroupsData(SeriesIterator):
 
         return False
 
-    def build_series(self, row):
+    def build_series(self, wide_row):
 
+        row = wide_row.fields
         dimensions = {}
         attributes = {}
 
+        if not wide_row.values:
+            msg = {"provider_name": self.provider_name,
+                   "dataset_code": self.dataset_code}
+            raise errors.RejectEmptySeries(**msg)
+
         #'WEO Subject Code': (BCA, Current account balance)
         weo_subject_code = row['WEO Subject Code']
         country = row['Country Group Name']
@@ -1208,11 +1254,11 @@ class WeoGroupsData(SeriesIterator):
         if row['Estimates Start After']:
             estimation_start = int(row['Estimates Start After'])
 
-        for period in self.years:
+        for period, value in self.years.iter_values(wide_row):
             value = {
                 'attributes': None,
                 'period': period,
-                'value': row[period].replace(',' ,'') if row[period] else ''
+                'value': value
             }
             if estimation_start:
                 if int(period) >= estimation_start:
@@ -1229,8 +1275,8 @@ class WeoGroupsData(SeriesIterator):
             'attributes': attributes,
             'dimensions': dimensions,
             'last_update': self.release_date,
-            'start_date': self.start_date,
-            'end_date': self.end_date,
+            'start_date': self.years.start_date(wide_row),
+            'end_date': self.years.end_date(wide_row),
             'frequency': self.frequency
         }
 
@@ -6,7 +6,7 @@ import os
 import logging
 import re
 from datetime import datetime
-from collections import OrderedDict
+from collections import OrderedDict, deque
 
 from pyquery import PyQuery as pq
 import requests
@@ -15,19 +15,21 @@ from widukind_common import errors
 
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, SeriesIterator
 from dlstats import constants
-from dlstats.utils import Downloader, clean_datetime
+from dlstats.utils import Downloader, clean_datetime, get_requests_session
 from dlstats.xml_utils import (XMLSDMX_2_1 as XMLSDMX,
                                XMLStructure_2_1 as XMLStructure,
                                XMLSpecificData_2_1_INSEE as XMLData,
                                dataset_converter,
-                               select_dimension,
-                               get_key_for_dimension,
+                               SlicePlanner,
+                               get_key_for_slice,
+                               get_filename_for_key,
                                get_dimensions_from_dsd)
 
 HTTP_ERROR_LONG_RESPONSE = 413
 HTTP_ERROR_NO_RESULT = 404
 HTTP_ERROR_BAD_REQUEST = 400
 HTTP_ERROR_SERVER_ERROR = 500
+HTTP_ERROR_GATEWAY_TIMEOUT = 504
 
 VERSION = 5
 
@@ -91,7 +93,7 @@ class INSEE(Fetcher):
         self._concepts = None
         self._codelists = OrderedDict()
 
-        self.requests_client = requests.Session()
+        self.requests_client = get_requests_session()
 
     def _load_structure_dataflows(self, force=False):
 
@@ -424,51 +426,73 @@ class INSEE_Data(SeriesIterator):
         if self.dataset_code in ["IPC-2015-COICOP"]:
             choice = "max"
 
-        position, _key, dimension_values = select_dimension(dimension_keys,
-                                                            dimensions,
-                                                            choice=choice)
+        planner = SlicePlanner(dimension_keys, dimensions,
+                               stats=self.dataset.metadata.get("slices"),
+                               choice=choice)
+        slices = deque(planner.slices())
 
-        count_dimensions = len(dimension_keys)
+        logger.info("choice[%s] - filterkey[%s] - slices[%s] - provider[%s] - dataset[%s]" % (choice, planner.dimension_key, len(slices), self.provider_name, self.dataset_code))
 
-        logger.info("choice[%s] - filterkey[%s] - count[%s] - provider[%s] - dataset[%s]" % (choice, _key, len(dimension_values), self.provider_name, self.dataset_code))
+        while slices:
+            '''Pour chaque slice, generer une key d'url'''
 
-        for dimension_value in dimension_values:
-            '''Pour chaque valeur de la dimension, generer une key d'url'''
-
-            key = get_key_for_dimension(count_dimensions, position, dimension_value)
+            _slice = slices.popleft()
+            key = get_key_for_slice(dimension_keys, _slice)
 
             url = "http://www.bdm.insee.fr/series/sdmx/data/%s/%s" % (self.dataset_code, key)
             if self._is_good_url(url) is False:
                 logger.warning("bypass not good url[%s]" % url)
                 continue
 
-            filename = "data-%s-%s.xml" % (self.dataset_code, key.replace(".", "_"))
+            filename = get_filename_for_key(self.dataset_code, key)
             download = Downloader(url=url,
                                   filename=filename,
                                   store_filepath=self.store_path,
                                   use_existing_file=self.fetcher.use_existing_file,
                                   #NOT USE FOR INSEE client=self.fetcher.requests_client
                                   )
-            filepath, response = download.get_filepath_and_response()
+            try:
+                filepath, response = download.get_filepath_and_response()
+            except requests.exceptions.Timeout:
+                filepath, response = None, None
+                status_code = HTTP_ERROR_GATEWAY_TIMEOUT
+            else:
+                status_code = response.status_code if response is not None else None
 
             if not response is None:
                 self._add_url_cache(url, response.status_code)
 
+            if status_code in [HTTP_ERROR_LONG_RESPONSE, HTTP_ERROR_GATEWAY_TIMEOUT]:
+                sub_slices = planner.split(_slice)
+                if sub_slices:
+                    logger.warning("split url[%s] - status_code[%s] - slices[%s]" % (url, status_code, len(sub_slices)))
+                    slices.extendleft(reversed(sub_slices))
+                else:
+                    logger.error("not split url[%s] - status_code[%s]" % (url, status_code))
+                    planner.add_error(_slice)
+                continue
+            elif status_code == HTTP_ERROR_NO_RESULT:
+                planner.add_empty(_slice)
+                continue
+            elif status_code and status_code >= 400:
+                planner.add_error(_slice)
+                continue
+
             if filepath and os.path.exists(filepath):
                 self.fetcher.for_delete.append(filepath)
             elif not filepath or not os.path.exists(filepath):
+                planner.add_error(_slice)
                 continue
 
-            if response and response.status_code == HTTP_ERROR_NO_RESULT:
-                continue
-            elif response and response.status_code >= 400:
-                raise response.raise_for_status()
-
             for row, err in self.xml_data.process(filepath):
+                if row and not err:
+                    planner.add_series(row)
                 yield row, err
 
             #self.dataset.update_database(save_only=True)
 
+        self.dataset.metadata["slices"] = planner.get_stats()
+
         yield None, None
 
     def _is_updated(self, bson):
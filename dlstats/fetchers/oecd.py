@@ -1,15 +1,17 @@
 # -*- coding: utf-8 -*-
 
 import logging
+from collections import deque
 
-import requests
 
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, SeriesIterator
-from dlstats.utils import Downloader, clean_datetime
+from dlstats.utils import Downloader, clean_datetime, get_requests_session
 from dlstats.xml_utils import (XMLStructure_2_0 as XMLStructure,
                                XMLGenericData_2_0_OECD as XMLData,
                                dataset_converter,
-                               select_dimension,
+                               SlicePlanner,
+                               get_key_for_slice,
+                               get_filename_for_key,
                                get_dimensions_from_dsd)
 
 """
@@ -17,6 +19,9 @@ FIXME: Attention à EO dont le dataset NAME change à chaque publication !
 - use hook dataset mais attention à series qui use eo
 """
 
+HTTP_ERROR_LONG_RESPONSE = 413
+HTTP_ERROR_NO_RESULT = 404
+
 VERSION = 2
 
 logger = logging.getLogger(__name__)
@@ -50,7 +55,7 @@ class OECD(Fetcher):
                                   terms_of_use='http://www.oecd.org/termsandconditions/',
                                   fetcher=self)
 
-        self.requests_client = requests.Session()
+        self.requests_client = get_requests_session()
 
     def build_data_tree(self):
 
@@ -167,22 +172,18 @@ class OECD_Data(SeriesIterator):
 
         dimension_keys, dimensions = self._get_dimensions_from_dsd()
 
-        position, _key, dimension_values = select_dimension(dimension_keys, dimensions, choice="max")
-
-        count_dimensions = len(dimension_keys)
+        planner = SlicePlanner(dimension_keys, dimensions,
+                               stats=self.dataset.metadata.get("slices"),
+                               choice="max")
+        slices = deque(planner.slices())
 
-        for dimension_value in dimension_values:
+        while slices:
 
-            sdmx_key = []
-            for i in range(count_dimensions):
-                if i == position:
-                    sdmx_key.append(dimension_value)
-                else:
-                    sdmx_key.append(".")
-            key = "".join(sdmx_key)
+            _slice = slices.popleft()
+            key = get_key_for_slice(dimension_keys, _slice)
 
             url = "%s/%s" % (self._get_url_data(), key)
-            filename = "data-%s-%s.xml" % (self.dataset_code, key.replace(".", "_"))
+            filename = get_filename_for_key(self.dataset_code, key)
             download = Downloader(url=url,
                                   filename=filename,
                                   store_filepath=self.store_path,
@@ -193,16 +194,32 @@ class OECD_Data(SeriesIterator):
             if filepath:
                 self.fetcher.for_delete.append(filepath)
 
-            if response.status_code >= 400 and response.status_code < 500:
+            if response.status_code == HTTP_ERROR_LONG_RESPONSE:
+                sub_slices = planner.split(_slice)
+                if sub_slices:
+                    logger.warning("split url[%s] - slices[%s]" % (url, len(sub_slices)))
+                    slices.extendleft(reversed(sub_slices))
+                else:
+                    planner.add_error(_slice)
+                continue
+            elif response.status_code == HTTP_ERROR_NO_RESULT:
+                planner.add_empty(_slice)
+                continue
+            elif response.status_code >= 400 and response.status_code < 500:
+                planner.add_error(_slice)
                 continue
             elif response.status_code >= 500:
                 raise response.raise_for_status()
 
             for row, err in self.xml_data.process(filepath):
+                if row and not err:
+                    planner.add_series(row)
                 yield row, err
 
             #self.dataset.update_database(save_only=True)
 
+        self.dataset.metadata["slices"] = planner.get_stats()
+
         yield None, None
 
     def build_series(self, bson):
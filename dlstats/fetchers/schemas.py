@@ -84,7 +84,8 @@ dataset_schema = Schema({
     },required=True)
 
 series_value_schema = Schema({
-    'value': str,
+    'value': Any(None, float),
+    Optional('status'): All(str, Length(min=1)),
     'period': All(str, Length(min=1)),
     'attributes': Any(None, dict),
 }, required=True)
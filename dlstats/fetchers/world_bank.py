@@ -9,17 +9,22 @@ import json
 import hashlib
 import zipfile
 
-import requests
 from slugify import slugify
 
 import pandas
 import xlrd
 
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
 from widukind_common import errors
 
 from dlstats.fetchers._commons import Fetcher, Datasets, Providers, SeriesIterator
 from dlstats.utils import clean_datetime, get_ordinal_from_period, get_year
-from dlstats.utils import Downloader, make_store_path
+from dlstats.utils import Downloader, make_store_path, get_requests_session
 from dlstats import constants
 
 logger = logging.getLogger(__name__)
@@ -30,6 +35,16 @@ HTTP_ERROR_SERVICE_CURRENTLY_UNAVAILABLE = 503 #Service currently unavailable
 
 HTTP_ERROR_ENDPOINT_NOTFOUND = 400 #Endpoint “XXX” not found
 
+PER_PAGE = 1000
+
+MIN_PER_PAGE = 100
+
+MAX_PER_PAGE = 20000
+
+MAX_PAGE_SECONDS = 60
+
+COUNTRIES_BY_REQUEST = 40
+
 #TODO: use for limit search: http://api.worldbank.org/v2/countries/wld/indicators/CHICKEN
 ONLY_WORLD_COUNTRY = [
     "GMC",
@@ -64,6 +79,38 @@ def retry(tries=1, sleep_time=2):
         return f
     return try_it
 
+def iter_json_page(fp):
+    """Yield ("meta", dict) then ("item", dict) for each record of a page
+
+    A page of the API is [{"page": 1, "pages": 1, ...}, [{record}, ...]]. With
+    ijson, the records are parsed from the stream one by one.
+    """
+    if not ijson:
+        page = json.loads(fp.read().decode("utf-8"))
+        if isinstance(page, list):
+            yield "meta", page[0]
+            for item in page[1] or []:
+                yield "item", item
+        else:
+            yield "meta", page
+        return
+
+    builder = None
+    builder_prefix = None
+    for prefix, event, value in ijson.parse(fp, use_float=True):
+        if builder is None:
+            if event == "start_map" and prefix in ("", "item", "item.item"):
+                builder = ObjectBuilder()
+                builder_prefix = prefix
+            else:
+                continue
+
+        builder.event(event, value)
+
+        if event == "end_map" and prefix == builder_prefix:
+            yield ("item" if prefix == "item.item" else "meta"), builder.value
+            builder = None
+
 class WorldBankAPI(Fetcher):
 
     def __init__(self, **kwargs):
@@ -79,7 +126,7 @@ class WorldBankAPI(Fetcher):
 
         self.api_url = 'http://api.worldbank.org/v2/'
 
-        self.requests_client = requests.Session()
+        self.requests_client = get_requests_session()
 
         self.blacklist = [
             '13', # Enterprise Surveys
@@ -106,6 +153,10 @@ class WorldBankAPI(Fetcher):
         self._available_countries = None
         self._available_countries_by_name = None
 
+        self.per_page = PER_PAGE
+        self.max_per_page = MAX_PER_PAGE
+        self.page_totals = {}
+
     @retry(tries=5, sleep_time=2)
     def download_or_raise(self, url, params={}):
 
@@ -133,6 +184,65 @@ class WorldBankAPI(Fetcher):
         with open(filepath) as f: #, mode='rb'
             return json.load(f)
 
+    @retry(tries=5, sleep_time=2)
+    def open_stream(self, url, params={}):
+        response = self.requests_client.get(url, params=params, stream=True)
+
+        logger.info("stream url[%s]" % response.url)
+
+        response.raise_for_status()
+        response.raw.decode_content = True
+        return response
+
+    def get_per_page(self, kind):
+        """Page size for one request of this kind
+
+        The total of the last request of the same kind is used for load all
+        the records in one page.
+        """
+        total = self.page_totals.get(kind)
+        if not total:
+            return min(self.per_page, self.max_per_page)
+        return min(self.max_per_page, max(MIN_PER_PAGE, int(total * 1.1) + 1))
+
+    def iter_records(self, url, parameters={}, kind=None):
+        """Yield (meta, record) for all the pages of url
+
+        The records are read from the response stream. A page slower than
+        MAX_PAGE_SECONDS reduce the max page size of the next requests.
+        """
+        kind = kind or url
+        per_page = self.get_per_page(kind)
+        page = 1
+        number_of_pages = 1
+
+        while page <= number_of_pages:
+            payload = {'format': 'json', 'per_page': per_page}
+            payload.update(parameters)
+            if page != 1:
+                payload['page'] = page
+
+            start = time.time()
+            response = self.open_stream(self.api_url + url, params=payload)
+            try:
+                meta = None
+                for item_type, value in iter_json_page(response.raw):
+                    if item_type == "meta":
+                        meta = value
+                        number_of_pages = int(meta.get('pages') or 0)
+                        if page == 1:
+                            self.page_totals[kind] = int(meta.get('total') or 0)
+                    else:
+                        yield meta, value
+            finally:
+                response.close()
+
+            if time.time() - start > MAX_PAGE_SECONDS and per_page > MIN_PER_PAGE:
+                self.max_per_page = max(MIN_PER_PAGE, per_page // 2)
+                logger.warning("slow page for url[%s] - max per_page[%s]" % (url, self.max_per_page))
+
+            page += 1
+
     def download_json(self, url, parameters={}):
         #TODO: settings
         per_page = 1000
@@ -150,6 +260,7 @@ class WorldBankAPI(Fetcher):
         for page in range(1, number_of_pages + 1):
             if page != 1:
                 payload = {'format': 'json', 'per_page': per_page, 'page': page}
+                payload.update(parameters)
                 response_json = self.download_or_raise(self.api_url + url, params=payload)
             yield response_json#.json()
 
@@ -440,7 +551,9 @@ class WorldBankAPIData(SeriesIterator):
             self.dataset.metadata["indicators"] = {}
 
         self.countries_to_process = list(self.available_countries.keys())
-        #self.countries_str = ";".join(list(self.available_countries.keys()))
+
+        self.countries_by_iso2 = dict([(c.get("iso2Code"), k) for k, c in self.available_countries.items()
+                                       if c.get("iso2Code")])
 
         self.blacklist_indicator = [
             "IC.DCP.COST",
@@ -522,7 +635,7 @@ class WorldBankAPIData(SeriesIterator):
                 output.append(source)
         return output
 
-    def _download_values(self, country_code, indicator_code):
+    def _download_values(self, country_codes, indicator_code):
         """
 
         # définition d'un indicator :
@@ -559,6 +672,9 @@ class WorldBankAPIData(SeriesIterator):
                 "decimal": ​1
             },
         ]
+
+        Plusieurs pays par requete:
+        http://api.worldbank.org/v2/countries/FRA;DEU/indicators/NY.GDP.PCAP.CD?format=json
         """
         """
         Pas de données: http://api.worldbank.org/v2/countries/all/indicators/DPANUSIFS?format=json&per_page=100
@@ -574,27 +690,46 @@ class WorldBankAPIData(SeriesIterator):
         ]
         """
 
-        datas = []
+        """Yield (country_code, release_date, datas) for the countries with values
+        
+        The records are grouped by country in the order of the response.
+        """
         release_date = None
+        datas = OrderedDict()
 
         try:
-            for page in self.fetcher.download_json('/'.join(['countries',
-                                                     country_code,
-                                                     'indicators',
-                                                     indicator_code])):
-
+            for meta, record in self.fetcher.iter_records('/'.join(['countries',
+                                                                    ";".join(country_codes),
+                                                                    'indicators',
+                                                                    indicator_code]),
+                                                          kind="values-%s" % len(country_codes)):
                 if not release_date:
-                    release_date = page[0]['lastupdated']
+                    release_date = meta['lastupdated']
 
-                datas.extend(page[1])
+                country_code = self._get_country_code(record)
+                if not country_code in datas:
+                    datas[country_code] = []
+                datas[country_code].append(record)
 
         except Exception as err:
             logger.critical("dataset[%s] - country[%s] - indicator[%s] - error[%s]" % (self.dataset_code,
-                                                                                       country_code,
+                                                                                       ";".join(country_codes),
                                                                                        indicator_code,
                                                                                        str(err)))
+            if len(country_codes) > 1:
+                for country_code in country_codes:
+                    yield from self._download_values([country_code], indicator_code)
+            return
+
+        for country_code, values in datas.items():
+            yield country_code, release_date, values
 
-        return release_date, datas
+    def _get_country_code(self, record):
+        iso3 = record.get("countryiso3code")
+        if iso3 and iso3 in self.available_countries:
+            return iso3
+        country_id = record["country"]["id"]
+        return self.countries_by_iso2.get(country_id, country_id)
 
     def _process(self):
 
@@ -614,42 +749,47 @@ class WorldBankAPIData(SeriesIterator):
 
             slug_indicator = slugify(self.current_indicator["id"], save_order=True)
 
-            for current_country in self.countries_to_process:
-                self.current_country = current_country
+            countries = self.countries_to_process
+            for i in range(0, len(countries), COUNTRIES_BY_REQUEST):
+                country_codes = countries[i:i + COUNTRIES_BY_REQUEST]
 
-                logger.info("Fetching dataset[%s] - indicator[%s] - country[%s]" % (self.dataset_code,
-                                                                                    self.current_indicator["id"],
-                                                                                    self.current_country))
+                logger.info("Fetching dataset[%s] - indicator[%s] - countries[%s]" % (self.dataset_code,
+                                                                                      self.current_indicator["id"],
+                                                                                      len(country_codes)))
 
-                release_date, datas = self._download_values(self.current_country,
-                                                            self.current_indicator["id"])
+                for current_country, release_date, datas in self._download_values(country_codes,
+                                                                                 self.current_indicator["id"]):
+                    self.current_country = current_country
 
-                if not datas:
-                    continue
+                    if not datas:
+                        continue
+
+                    self.release_date = clean_datetime(datetime.strptime(release_date, '%Y-%m-%d'))
 
-                self.release_date = clean_datetime(datetime.strptime(release_date, '%Y-%m-%d'))
+                    if is_release_controled is False:
 
-                if is_release_controled is False:
+                        is_release_controled = True
 
-                    is_release_controled = True
+                        if self.dataset.metadata["indicators"].get(slug_indicator):
 
-                    if self.dataset.metadata["indicators"].get(slug_indicator):
+                            if self.release_date >= self.dataset.metadata["indicators"][slug_indicator]:
+                                msg = "Reject series updated for provider[%s] - dataset[%s] - key[%s]"
+                                logger.info(msg % (self.provider_name,
+                                                   self.dataset_code,
+                                                   self.current_indicator["id"]))
 
-                        if self.release_date >= self.dataset.metadata["indicators"][slug_indicator]:
-                            msg = "Reject series updated for provider[%s] - dataset[%s] - key[%s]"
-                            logger.info(msg % (self.provider_name,
-                                               self.dataset_code,
-                                               self.current_indicator["id"]))
+                                is_rejected = True
+                                break
 
-                            is_rejected = True
-                            break
+                        self.dataset.metadata["indicators"][slug_indicator] = self.release_date
+                        self.dataset.last_update = clean_datetime()
 
-                    self.dataset.metadata["indicators"][slug_indicator] = self.release_date
-                    self.dataset.last_update = clean_datetime()
+                    count += 1
 
-                count += 1
+                    yield {"datas": datas}, None
 
-                yield {"datas": datas}, None
+                if is_rejected:
+                    break
 
             if not is_rejected:
                 logger.info("TOTAL - dataset[%s] - indicator[%s] - count[%s]" % (self.dataset_code,
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+
+"""Run several providers in one process
+
+The providers run in parallel (one thread by provider, max_providers at
+the same time) and share:
+
+- the MongoDB client (and its connection pool)
+- one HTTP session (requests.Session with a pool by host) used by the
+  Downloader instances and by the fetchers with a requests_client
+- a limit of concurrent requests by host (max_per_host)
+
+A new provider is started only if the memory used by the process is lower
+than max_memory. At the end, the counters of the runs (COL_STATS_RUN) are
+summed by provider and for all the providers.
+"""
+
+import os
+import time
+import logging
+import threading
+import contextlib
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import requests
+from widukind_common import errors
+
+from dlstats import cassettes
+from dlstats import constants
+from dlstats import utils
+from dlstats.utils import clean_datetime, last_error
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_PROVIDERS = 4
+
+DEFAULT_MAX_PER_HOST = 4
+
+DEFAULT_POOL_SIZE = 20
+
+MEMORY_CHECK_INTERVAL = 5
+
+RUN_OK = "ok"
+RUN_ERROR = "error"
+RUN_LOCKED = "locked"
+
+COUNTERS = ["count_accepts", "count_rejects", "count_inserts",
+            "count_updates", "count_errors"]
+
+def get_memory_usage():
+    """Resident memory of the process (bytes)"""
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (IOError, OSError, ValueError):
+        import resource
+        # peak memory (kilobytes on linux) if /proc is not available
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class HostLimiter(object):
+    """Max concurrent requests by host"""
+
+    def __init__(self, max_per_host=DEFAULT_MAX_PER_HOST):
+        self.max_per_host = max_per_host
+        self._semaphores = {}
+        self._lock = threading.Lock()
+
+    def get_semaphore(self, host):
+        with self._lock:
+            if not host in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    @contextlib.contextmanager
+    def acquire(self, url):
+        semaphore = self.get_semaphore(urlparse(url).netloc)
+        with semaphore:
+            yield
+
+class SharedSession(requests.Session):
+    """requests.Session shared by the fetchers
+
+    The host limit applies to the request (until the headers are
+    received), not to the read of a streamed body.
+    """
+
+    def __init__(self, limiter=None, pool_size=DEFAULT_POOL_SIZE):
+        super().__init__()
+        adapter = cassettes.get_adapter(pool_connections=pool_size,
+                                        pool_maxsize=pool_size)
+        self.mount("http://", adapter)
+        self.mount("https://", adapter)
+        self.limiter = limiter
+
+    def request(self, method, url, *args, **kwargs):
+        if not self.limiter or not self.limiter.max_per_host:
+            return super().request(method, url, *args, **kwargs)
+        with self.limiter.acquire(url):
+            return super().request(method, url, *args, **kwargs)
+
+def get_run_counters(db, provider_name, since):
+    """Sum of the counters of the dataset runs of provider since this date"""
+    counters = dict((name, 0) for name in COUNTERS)
+    datasets = set()
+    query = {"provider_name": provider_name, "created": {"$gte": since}}
+    for doc in db[constants.COL_STATS_RUN].find(query):
+        datasets.add(doc.get("dataset_code"))
+        for name in COUNTERS:
+            counters[name] += doc.get(name) or 0
+    counters["datasets"] = len(datasets)
+    return counters
+
+class Orchestrator(object):
+
+    def __init__(self, db, providers,
+                 fetchers=None,
+                 max_providers=DEFAULT_MAX_PROVIDERS,
+                 max_per_host=DEFAULT_MAX_PER_HOST,
+                 pool_size=DEFAULT_POOL_SIZE,
+                 max_memory=None,
+                 lock=None,
+                 fetcher_kwargs=None):
+        """
+        :param pymongo.database.Database db: MongoDB Database instance
+        :param list providers: Providers to run
+        :param dict fetchers: {provider_name: Fetcher class}
+        :param int max_providers: Providers running at the same time
+        :param int max_per_host: Max concurrent HTTP requests by host - 0 for unlimited
+        :param int pool_size: HTTP connections by host
+        :param int max_memory: No new provider started above this memory (bytes)
+        :param callable lock: lock(key) context manager around each run
+        :param dict fetcher_kwargs: Arguments for the fetchers
+        """
+        if fetchers is None:
+            from dlstats.fetchers import FETCHERS
+            fetchers = FETCHERS
+
+        self.db = db
+        self.providers = list(providers)
+        self.fetchers = fetchers
+        self.max_providers = max(1, max_providers)
+        self.max_memory = max_memory
+        self.lock = lock
+        self.fetcher_kwargs = fetcher_kwargs or {}
+        self.limiter = HostLimiter(max_per_host=max_per_host)
+        self.session = SharedSession(limiter=self.limiter, pool_size=pool_size)
+
+    def create_fetcher(self, provider_name):
+        fetcher = self.fetchers[provider_name](db=self.db, **self.fetcher_kwargs)
+        if hasattr(fetcher, "requests_client"):
+            fetcher.requests_client = self.session
+        return fetcher
+
+    def run_provider(self, provider_name):
+        """Run all datasets of one provider - return the result dict"""
+        result = {"provider_name": provider_name,
+                  "status": RUN_OK,
+                  "error": None}
+        since = clean_datetime()
+        start = time.time()
+        logger.info("orchestrator START: provider[%s]" % provider_name)
+        try:
+            fetcher = self.create_fetcher(provider_name)
+            if self.lock:
+                with self.lock("run-%s" % provider_name):
+                    fetcher.upsert_all_datasets()
+            else:
+                fetcher.upsert_all_datasets()
+        except errors.Locked:
+            result["status"] = RUN_LOCKED
+        except Exception as err:
+            result["status"] = RUN_ERROR
+            result["error"] = str(err)
+            logger.error("orchestrator provider[%s] error : %s" % (provider_name,
+                                                                   last_error()))
+        result["duration"] = time.time() - start
+        result.update(get_run_counters(self.db, provider_name, since))
+        logger.info("orchestrator END: provider[%s] - status[%s] - time[%.3f seconds]" % (
+                    provider_name, result["status"], result["duration"]))
+        return result
+
+    def is_memory_available(self):
+        return not self.max_memory or get_memory_usage() < self.max_memory
+
+    def run(self):
+        """Run all providers - return (results, summary)"""
+        start = time.time()
+        results = []
+        previous_client = utils.default_client
+        utils.configure_requests_client(self.session)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_providers) as executor:
+                pending = list(self.providers)
+                running = set()
+                while pending or running:
+                    while pending and len(running) < self.max_providers:
+                        if running and not self.is_memory_available():
+                            logger.warning("orchestrator: memory budget reached - %s providers waiting" % len(pending))
+                            break
+                        running.add(executor.submit(self.run_provider, pending.pop(0)))
+                    done, running = wait(running, timeout=MEMORY_CHECK_INTERVAL,
+                                         return_when=FIRST_COMPLETED)
+                    running = set(running)
+                    for future in done:
+                        results.append(future.result())
+        finally:
+            utils.configure_requests_client(previous_client)
+            self.session.close()
+
+        return results, self.summary(results, time.time() - start)
+
+    def summary(self, results, duration):
+        """Totals of all providers and throughput (series by second)"""
+        summary = dict((name, sum(r.get(name, 0) for r in results)) for name in COUNTERS)
+        summary["datasets"] = sum(r.get("datasets", 0) for r in results)
+        summary["providers"] = len(results)
+        summary["errors"] = len([r for r in results if r["status"] != RUN_OK])
+        summary["duration"] = duration
+        summary["sum_durations"] = sum(r.get("duration", 0) for r in results)
+        written = summary["count_inserts"] + summary["count_updates"]
+        summary["series_by_second"] = written / duration if duration else 0
+        summary["accepts_by_second"] = summary["count_accepts"] / duration if duration else 0
+        return summary
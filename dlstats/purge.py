@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+
+"""Purge of the documents of a provider (or of some datasets) by batches
+
+Each collection is purged by ranges of _id (batch_size documents) so a
+delete never holds the primary for a long time:
+
+- max_rate: max documents deleted by second (sleep between the batches)
+- max_lag: wait while the replication lag of the secondaries (seconds) is
+  greater than max_lag
+- the last deleted _id and the counter of each collection are stored in
+  COL_PURGE_CHECKPOINTS: an interrupted purge is resumed at the next run
+
+The collections are purged in parallel (one thread by collection) and the
+datasets at the end.
+"""
+
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+import pymongo
+
+from dlstats import constants
+from dlstats.utils import clean_datetime
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 1000
+
+DEFAULT_LAG_SLEEP = 5
+
+PURGE_COLLECTIONS = [
+    constants.COL_SERIES,
+    constants.COL_SERIES_ARCHIVES,
+    constants.COL_SERIES_VINTAGES,
+    constants.COL_DATASETS_STATS,
+]
+
+def get_replication_lag(db):
+    """Max lag (seconds) of the secondaries - None if not a replica set"""
+    try:
+        status = db.client.admin.command("replSetGetStatus")
+    except Exception:
+        return None
+
+    members = status.get("members", [])
+    primary = [m for m in members if m.get("stateStr") == "PRIMARY"]
+    secondaries = [m for m in members if m.get("stateStr") == "SECONDARY"]
+    if not primary or not secondaries:
+        return 0
+
+    primary_date = primary[0]["optimeDate"]
+    return max((primary_date - m["optimeDate"]).total_seconds() for m in secondaries)
+
+class Purge(object):
+
+    def __init__(self, db, provider_name,
+                 dataset_codes=None,
+                 batch_size=DEFAULT_BATCH_SIZE,
+                 max_rate=None,
+                 max_lag=None,
+                 lag_sleep=DEFAULT_LAG_SLEEP,
+                 workers=len(PURGE_COLLECTIONS),
+                 resume=True,
+                 progress=None):
+        """
+        :param pymongo.database.Database db: MongoDB Database instance
+        :param str provider_name: Provider name
+        :param list dataset_codes: Datasets to purge - all if None
+        :param int batch_size: Documents deleted by batch
+        :param int max_rate: Max documents deleted by second and by collection -
+                             None for unlimited
+        :param int max_lag: Max replication lag (seconds) - None for disable
+        :param int lag_sleep: Seconds between two checks of the replication lag
+        :param int workers: Collections purged in parallel
+        :param bool resume: Use the checkpoints of a previous run
+        :param callable progress: progress(collection_name, deleted, total)
+                                  after each batch
+        """
+        self.db = db
+        self.provider_name = provider_name
+        self.dataset_codes = sorted(dataset_codes or [])
+        self.batch_size = batch_size
+        self.max_rate = max_rate
+        self.max_lag = max_lag
+        self.lag_sleep = lag_sleep
+        self.workers = max(1, workers)
+        self.resume = resume
+        self.progress = progress
+
+    @property
+    def col_checkpoints(self):
+        return self.db[constants.COL_PURGE_CHECKPOINTS]
+
+    def get_query(self):
+        query = {"provider_name": self.provider_name}
+        if self.dataset_codes:
+            query["dataset_code"] = {"$in": self.dataset_codes}
+        return query
+
+    def get_key(self, collection_name):
+        return "%s-%s-%s" % (self.provider_name,
+                             ".".join(self.dataset_codes) or "ALL",
+                             collection_name)
+
+    def load_checkpoint(self, collection_name):
+        if not self.resume:
+            self.col_checkpoints.delete_one({"key": self.get_key(collection_name)})
+            return None
+        return self.col_checkpoints.find_one({"key": self.get_key(collection_name)})
+
+    def save_checkpoint(self, collection_name, last_id, deleted):
+        self.col_checkpoints.update_one({"key": self.get_key(collection_name)},
+                                        {"$set": {"last_id": last_id,
+                                                  "deleted": deleted,
+                                                  "updated": clean_datetime()},
+                                         "$setOnInsert": {"provider_name": self.provider_name,
+                                                          "dataset_codes": self.dataset_codes,
+                                                          "collection": collection_name}},
+                                        upsert=True)
+
+    def wait_replication(self):
+        if not self.max_lag:
+            return
+        while True:
+            lag = get_replication_lag(self.db)
+            if not lag or lag <= self.max_lag:
+                return
+            msg = "purge [%s] - replication lag[%.1f] > max-lag[%s] - sleep[%s]"
+            logger.warning(msg % (self.provider_name, lag, self.max_lag, self.lag_sleep))
+            time.sleep(self.lag_sleep)
+
+    def throttle(self, deleted, start):
+        if not self.max_rate:
+            return
+        wait = deleted / float(self.max_rate) - (time.time() - start)
+        if wait > 0:
+            time.sleep(wait)
+
+    def purge_collection(self, collection_name):
+        """Delete the documents of the query by batches - return the count deleted"""
+        collection = self.db[collection_name]
+        query = self.get_query()
+
+        checkpoint = self.load_checkpoint(collection_name)
+        last_id = checkpoint and checkpoint.get("last_id")
+        total_deleted = checkpoint and checkpoint.get("deleted") or 0
+        if last_id:
+            msg = "purge [%s] resumed after _id[%s] - deleted[%s]"
+            logger.info(msg % (collection_name, last_id, total_deleted))
+
+        total = total_deleted + collection.count(query)
+        deleted = 0
+        start = time.time()
+
+        while True:
+            batch_query = dict(query)
+            if last_id:
+                batch_query["_id"] = {"$gt": last_id}
+            ids = [doc["_id"] for doc in collection.find(batch_query, {"_id": True})
+                                                   .sort("_id", pymongo.ASCENDING)
+                                                   .limit(self.batch_size)]
+            if not ids:
+                break
+
+            delete_query = dict(query)
+            delete_query["_id"] = {"$gte": ids[0], "$lte": ids[-1]}
+            result = collection.delete_many(delete_query)
+
+            last_id = ids[-1]
+            deleted += result.deleted_count
+            total_deleted += result.deleted_count
+            self.save_checkpoint(collection_name, last_id, total_deleted)
+
+            if self.progress:
+                self.progress(collection_name, total_deleted, total)
+
+            self.throttle(deleted, start)
+            self.wait_replication()
+
+        self.col_checkpoints.delete_one({"key": self.get_key(collection_name)})
+        return total_deleted
+
+    def run(self):
+        """Purge all collections - return {collection_name: deleted}"""
+        results = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {name: executor.submit(self.purge_collection, name)
+                       for name in PURGE_COLLECTIONS}
+            for name, future in futures.items():
+                results[name] = future.result()
+
+        # the datasets at the end: an interrupted purge can be run again
+        results[constants.COL_DATASETS] = self.purge_collection(constants.COL_DATASETS)
+        return results
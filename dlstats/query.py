@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+
+"""Read API: series from MongoDB to pandas (or Arrow)
+
+The series are selected by provider, dataset, keys or dimensions and read
+in two steps:
+
+- the versions (small projection) for find the series already in the cache
+- the values of the other series (values.value only): the periods are
+  computed from start_date and frequency with one pandas.period_range. The
+  periods of the series with missing periods are read in one query by batch
+
+The values are converted in bulk with pandas.to_numeric ("NaN", "", "n/a"...
+become NaN). The last series read are kept in a LRU cache by slug and
+version: a new version in MongoDB is read again.
+
+>>> reader = SeriesReader(db)
+>>> frame = reader.dataframe("ECB", dataset_code="EXR", dimensions={"FREQ": ["M"]})
+"""
+
+import logging
+from collections import OrderedDict
+import threading
+
+import numpy
+import pandas
+
+from widukind_common.debug import timeit
+
+from dlstats import constants
+from dlstats.export import series_query, DEFAULT_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_SIZE = 1000
+
+VERSION_PROJECTION = {
+    "_id": False,
+    "slug": True,
+    "version": True,
+}
+
+SERIES_PROJECTION = {
+    "_id": False,
+    "provider_name": True,
+    "dataset_code": True,
+    "key": True,
+    "slug": True,
+    "name": True,
+    "version": True,
+    "frequency": True,
+    "start_date": True,
+    "end_date": True,
+    "dimensions": True,
+    "values.value": True,
+}
+
+def build_query(provider_name, dataset_code=None, keys=None, dimensions=None,
+                frequency=None):
+    """MongoDB query of the series - see :func:`dlstats.export.series_query`
+
+    :param list keys: Series keys
+    """
+    query = series_query(provider_name, dataset_code=dataset_code,
+                         dimensions=dimensions, frequency=frequency)
+    if keys:
+        query["key"] = {"$in": list(keys)}
+    return query
+
+def values_to_array(values):
+    """Convert the values (str) to a numpy array of float (NaN if not a number)"""
+    return pandas.to_numeric(numpy.asarray(values, dtype=object),
+                             errors="coerce").astype("float64")
+
+def is_contiguous(doc):
+    """Return True if the series has one value by period from start_date"""
+    return doc["end_date"] - doc["start_date"] + 1 == len(doc["values"])
+
+def get_period_index(start_date, count, frequency):
+    """PeriodIndex of count periods from the ordinal start_date"""
+    start = pandas.Period(ordinal=start_date, freq=frequency)
+    return pandas.period_range(start=start, periods=count, freq=frequency)
+
+class ReadSeries(object):
+    """One series read - metadata and pandas.Series of float"""
+
+    __slots__ = ["slug", "key", "name", "version", "frequency",
+                 "provider_name", "dataset_code", "dimensions", "data"]
+
+    def __init__(self, doc, data):
+        self.slug = doc["slug"]
+        self.key = doc["key"]
+        self.name = doc.get("name")
+        self.version = doc.get("version")
+        self.frequency = doc["frequency"]
+        self.provider_name = doc["provider_name"]
+        self.dataset_code = doc["dataset_code"]
+        self.dimensions = doc.get("dimensions") or {}
+        self.data = data
+
+    def __repr__(self):
+        return "ReadSeries(%s, version=%s)" % (self.slug, self.version)
+
+class SeriesCache(object):
+    """LRU cache of ReadSeries by slug (thread safe)"""
+
+    def __init__(self, maxsize=DEFAULT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, slug, version):
+        """Return the series if in cache with this version"""
+        with self._lock:
+            series = self._entries.get(slug)
+            if series is None or series.version != version:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(slug)
+            self.hits += 1
+            return series
+
+    def put(self, series):
+        if not self.maxsize:
+            return
+        with self._lock:
+            self._entries[series.slug] = series
+            self._entries.move_to_end(series.slug)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+class SeriesReader(object):
+
+    def __init__(self, db, cache_size=DEFAULT_CACHE_SIZE,
+                 batch_size=DEFAULT_BATCH_SIZE):
+        """
+        :param pymongo.database.Database db: MongoDB Database instance
+        :param int cache_size: Max series in cache - 0 for disable the cache
+        :param int batch_size: Cursor batch size
+        """
+        self.db = db
+        self.batch_size = batch_size
+        self.cache = SeriesCache(maxsize=cache_size)
+
+    @property
+    def col_series(self):
+        return self.db[constants.COL_SERIES]
+
+    def read_periods(self, slugs):
+        """Return {slug: [periods]} of the series in one query"""
+        query = {"slug": {"$in": list(slugs)}}
+        projection = {"_id": False, "slug": True, "values.period": True}
+        return {doc["slug"]: [obs["period"] for obs in doc["values"]]
+                for doc in self.col_series.find(query, projection)}
+
+    def build_series(self, doc, periods=None):
+        """
+        :param list periods: Periods of the values if not contiguous - read 
+                             from MongoDB if None
+        """
+        values = [obs["value"] for obs in doc["values"]]
+        count = len(values)
+        if is_contiguous(doc):
+            index = get_period_index(doc["start_date"], count, doc["frequency"])
+        else:
+            if periods is None:
+                periods = self.read_periods([doc["slug"]])[doc["slug"]]
+            index = pandas.PeriodIndex(periods, freq=doc["frequency"])
+        data = pandas.Series(values_to_array(values), index=index, name=doc["key"])
+        return ReadSeries(doc, data)
+
+    def _read_slugs(self, slugs):
+        query = {"slug": {"$in": slugs}}
+        cursor = self.col_series.find(query, SERIES_PROJECTION).batch_size(self.batch_size)
+        docs = list(cursor)
+
+        # not contiguous values: the periods of the batch in one query
+        periods = {}
+        not_contiguous = [doc["slug"] for doc in docs if not is_contiguous(doc)]
+        if not_contiguous:
+            periods = self.read_periods(not_contiguous)
+
+        for doc in docs:
+            series = self.build_series(doc, periods=periods.get(doc["slug"]))
+            self.cache.put(series)
+            yield series
+
+    def iter_series(self, provider_name, dataset_code=None, keys=None,
+                    dimensions=None, frequency=None):
+        """Yield the ReadSeries of the query (sorted by slug)
+
+        :param str provider_name: Provider name
+        :param str dataset_code: Dataset code
+        :param list keys: Series keys
+        :param dict dimensions: Dimension filters - {"country": ["fra", "deu"]}
+        :param str frequency: Frequency filter
+        """
+        query = build_query(provider_name, dataset_code=dataset_code, keys=keys,
+                            dimensions=dimensions, frequency=frequency)
+        cursor = self.col_series.find(query, VERSION_PROJECTION)
+        cursor = cursor.sort("slug", 1).batch_size(self.batch_size)
+
+        batch = []
+        for doc in cursor:
+            batch.append(doc)
+            if len(batch) >= self.batch_size:
+                for series in self._iter_batch(batch):
+                    yield series
+                batch = []
+        for series in self._iter_batch(batch):
+            yield series
+
+    def _iter_batch(self, batch):
+        results = OrderedDict((doc["slug"], self.cache.get(doc["slug"], doc.get("version")))
+                              for doc in batch)
+        misses = [slug for slug, series in results.items() if series is None]
+        if misses:
+            for series in self._read_slugs(misses):
+                results[series.slug] = series
+        return [series for series in results.values() if series is not None]
+
+    @timeit("query.SeriesReader.dataframe")
+    def dataframe(self, provider_name, **kwargs):
+        """DataFrame of the series (one column by key, PeriodIndex)
+
+        All series must have the same frequency (use the frequency filter).
+        """
+        columns = OrderedDict()
+        frequencies = set()
+        for series in self.iter_series(provider_name, **kwargs):
+            frequencies.add(series.frequency)
+            columns[series.key] = series.data
+        if len(frequencies) > 1:
+            raise ValueError("series with several frequencies [%s] - use a frequency filter" % ", ".join(sorted(frequencies)))
+        if not columns:
+            return pandas.DataFrame()
+        return pandas.concat(columns, axis=1).sort_index()
+
+    def long_dataframe(self, provider_name, **kwargs):
+        """DataFrame with the columns key, frequency, period, value"""
+        frames = []
+        for series in self.iter_series(provider_name, **kwargs):
+            frames.append(pandas.DataFrame({"key": series.key,
+                                            "frequency": series.frequency,
+                                            "period": series.data.index.astype(str),
+                                            "value": series.data.values}))
+        if not frames:
+            return pandas.DataFrame(columns=["key", "frequency", "period", "value"])
+        return pandas.concat(frames, ignore_index=True)
+
+    def arrow_table(self, provider_name, **kwargs):
+        """pyarrow.Table of :meth:`long_dataframe` - pyarrow is required"""
+        try:
+            import pyarrow
+        except ImportError:
+            raise ImportError("pyarrow library is required for arrow tables.")
+        frame = self.long_dataframe(provider_name, **kwargs)
+        return pyarrow.Table.from_pandas(frame, preserve_index=False)
@@ -0,0 +1,293 @@
+# -*- coding: utf-8 -*-
+
+"""Ingestion scheduler driven by the release calendars
+
+The calendars written by :meth:`Fetcher.upsert_calendar` (COL_CALENDARS)
+are converted to jobs (COL_SCHEDULER_JOBS). A job runs the dataset (or all
+the datasets of the provider) a little after the announced release date:
+
+- done: the run inserted or updated series (stats of the run)
+- retried with back-off: the data is not there yet or the run failed
+- failed: max retries exceeded
+
+The providers without calendar have one sweep job (all datasets) every
+sweep_interval.
+
+The job states are stored in MongoDB, so several schedulers can share the
+jobs: a job is claimed with an atomic update before the run.
+"""
+
+import time
+import logging
+from datetime import timedelta
+
+import pymongo
+from pymongo import ReturnDocument
+
+from widukind_common import errors
+
+from dlstats import constants
+from dlstats.utils import clean_datetime, last_error
+
+logger = logging.getLogger(__name__)
+
+JOB_PENDING = "pending"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+JOB_STATUS = [JOB_PENDING, JOB_RUNNING, JOB_DONE, JOB_FAILED]
+
+CALENDAR_ACTIONS = ["update-dataset", "update-fetcher"]
+
+def is_release_loaded(db, provider_name, dataset_code, since):
+    """Return True if a run of the dataset after since wrote series"""
+    query = {"provider_name": provider_name,
+             "dataset_code": dataset_code,
+             "created": {"$gte": since}}
+    cursor = db[constants.COL_STATS_RUN].find(query).sort("created", -1).limit(1)
+    for doc in cursor:
+        return doc.get("count_inserts", 0) + doc.get("count_updates", 0) > 0
+    return False
+
+class Scheduler(object):
+
+    def __init__(self, db,
+                 fetchers=None,
+                 providers=None,
+                 delay=300,
+                 max_retries=6,
+                 backoff=600,
+                 backoff_factor=2,
+                 max_backoff=6 * 3600,
+                 sweep_interval=7 * 24 * 3600,
+                 horizon=3 * 24 * 3600,
+                 running_timeout=12 * 3600,
+                 lock=None,
+                 fetcher_kwargs=None):
+        """
+        :param pymongo.database.Database db: MongoDB Database instance
+        :param dict fetchers: {provider_name: Fetcher class}
+        :param list providers: Providers to schedule - all if None
+        :param int delay: Seconds between the release date and the first run
+        :param int max_retries: Max runs after the first one
+        :param int backoff: Seconds before the first retry
+        :param int backoff_factor: Multiplier of the delay for next retries
+        :param int sweep_interval: Seconds between two sweeps of a provider
+                                   without calendar
+        :param int horizon: Releases older than horizon seconds are ignored
+        :param int running_timeout: Running jobs older than this are pending again
+        :param callable lock: lock(key) context manager around each run
+        :param dict fetcher_kwargs: Arguments for the fetchers
+        """
+        if fetchers is None:
+            from dlstats.fetchers import FETCHERS
+            fetchers = FETCHERS
+
+        self.db = db
+        self.fetchers = fetchers
+        if not providers:
+            # the fetchers with missing dependencies are not scheduled
+            providers = sorted(fetchers.available() if hasattr(fetchers, "available") 
+                               else fetchers.keys())
+        self.providers = providers
+        self.delay = delay
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_factor = backoff_factor
+        self.max_backoff = max_backoff
+        self.sweep_interval = sweep_interval
+        self.horizon = horizon
+        self.running_timeout = running_timeout
+        self.lock = lock
+        self.fetcher_kwargs = fetcher_kwargs or {}
+
+    @property
+    def col_jobs(self):
+        return self.db[constants.COL_SCHEDULER_JOBS]
+
+    def create_indexes(self):
+        self.col_jobs.create_index([("key", pymongo.ASCENDING)], unique=True)
+        self.col_jobs.create_index([("status", pymongo.ASCENDING),
+                                    ("next_run", pymongo.ASCENDING)])
+
+    def next_backoff(self, attempts):
+        delay = self.backoff * (self.backoff_factor ** max(0, attempts - 1))
+        return min(delay, self.max_backoff)
+
+    def sync_calendars(self, now=None):
+        """Create the jobs of the new calendar entries - return count created"""
+        now = now or clean_datetime()
+        query = {"action": {"$in": CALENDAR_ACTIONS},
+                 "period_type": "date",
+                 "kwargs.provider_name": {"$in": self.providers},
+                 "period_kwargs.run_date": {"$gte": now - timedelta(seconds=self.horizon)}}
+
+        count = 0
+        for entry in self.db[constants.COL_CALENDARS].find(query):
+            kwargs = entry["kwargs"]
+            release_date = entry["period_kwargs"]["run_date"]
+            job = {"key": entry["key"],
+                   "provider_name": kwargs["provider_name"],
+                   "dataset_code": kwargs.get("dataset_code"),
+                   "release_date": release_date,
+                   "next_run": release_date + timedelta(seconds=self.delay),
+                   "attempts": 0,
+                   "status": JOB_PENDING,
+                   "sweep": False,
+                   "created": now}
+            result = self.col_jobs.update_one({"key": job["key"]},
+                                              {"$setOnInsert": job},
+                                              upsert=True)
+            if result.upserted_id:
+                count += 1
+        return count
+
+    def sync_sweeps(self, now=None):
+        """Create one sweep job by provider without calendar"""
+        now = now or clean_datetime()
+        query = {"kwargs.provider_name": {"$in": self.providers}}
+        with_calendar = self.db[constants.COL_CALENDARS].distinct("kwargs.provider_name",
+                                                                  query)
+        count = 0
+        for provider_name in self.providers:
+            if provider_name in with_calendar:
+                continue
+            job = {"key": "sweep-%s" % provider_name,
+                   "provider_name": provider_name,
+                   "dataset_code": None,
+                   "release_date": None,
+                   "next_run": now,
+                   "attempts": 0,
+                   "status": JOB_PENDING,
+                   "sweep": True,
+                   "created": now}
+            result = self.col_jobs.update_one({"key": job["key"]},
+                                              {"$setOnInsert": job},
+                                              upsert=True)
+            if result.upserted_id:
+                count += 1
+        return count
+
+    def requeue_stale(self, now=None):
+        """Running jobs of a stopped scheduler are pending again"""
+        now = now or clean_datetime()
+        query = {"status": JOB_RUNNING,
+                 "started": {"$lt": now - timedelta(seconds=self.running_timeout)}}
+        result = self.col_jobs.update_many(query, {"$set": {"status": JOB_PENDING,
+                                                            "next_run": now}})
+        return result.modified_count
+
+    def claim(self, now=None):
+        """Return the next due job marked as running or None"""
+        now = now or clean_datetime()
+        query = {"status": JOB_PENDING,
+                 "next_run": {"$lte": now},
+                 "provider_name": {"$in": self.providers}}
+        return self.col_jobs.find_one_and_update(query,
+                                                 {"$set": {"status": JOB_RUNNING,
+                                                           "started": now}},
+                                                 sort=[("next_run", pymongo.ASCENDING)],
+                                                 return_document=ReturnDocument.AFTER)
+
+    def run_fetcher(self, job):
+        """Run the job - return True if the release is loaded"""
+        provider_name = job["provider_name"]
+        dataset_code = job["dataset_code"]
+
+        fetcher = self.fetchers[provider_name](db=self.db, **self.fetcher_kwargs)
+
+        if dataset_code:
+            start = clean_datetime()
+            fetcher.wrap_upsert_dataset(dataset_code)
+            return is_release_loaded(self.db, provider_name, dataset_code, start)
+
+        fetcher.upsert_all_datasets()
+        return True
+
+    def run_job(self, job, now=None):
+        """Run one claimed job and store the new state - return the status"""
+        lock_key = "run-%s" % job["provider_name"]
+        if job["dataset_code"]:
+            lock_key = lock_key + "-" + job["dataset_code"]
+
+        msg = "scheduler job[%s] - provider[%s] - dataset[%s] - attempt[%s]"
+        logger.info(msg % (job["key"], job["provider_name"],
+                           job["dataset_code"], job["attempts"] + 1))
+
+        error = None
+        loaded = False
+        try:
+            if self.lock:
+                with self.lock(lock_key):
+                    loaded = self.run_fetcher(job)
+            else:
+                loaded = self.run_fetcher(job)
+        except errors.Locked:
+            # a run is in progress - not an attempt
+            now = now or clean_datetime()
+            self.col_jobs.update_one({"_id": job["_id"]},
+                                     {"$set": {"status": JOB_PENDING,
+                                               "next_run": now + timedelta(seconds=self.delay)}})
+            return JOB_PENDING
+        except Exception as err:
+            error = str(err)
+            logger.error("scheduler job[%s] error : %s" % (job["key"], last_error()))
+
+        now = now or clean_datetime()
+        attempts = job["attempts"] + 1
+        query_update = {"attempts": attempts,
+                        "last_run": now,
+                        "last_error": error}
+
+        if job.get("sweep"):
+            query_update["status"] = JOB_PENDING
+            query_update["attempts"] = 0
+            if error and attempts <= self.max_retries:
+                query_update["attempts"] = attempts
+                query_update["next_run"] = now + timedelta(seconds=self.next_backoff(attempts))
+            else:
+                query_update["next_run"] = now + timedelta(seconds=self.sweep_interval)
+        elif loaded and not error:
+            query_update["status"] = JOB_DONE
+        elif attempts > self.max_retries:
+            query_update["status"] = JOB_FAILED
+        else:
+            query_update["status"] = JOB_PENDING
+            query_update["next_run"] = now + timedelta(seconds=self.next_backoff(attempts))
+
+        self.col_jobs.update_one({"_id": job["_id"]}, {"$set": query_update})
+        return query_update["status"]
+
+    def run_pending(self, now=None, max_jobs=None):
+        """Sync the jobs and run all the due jobs - return [(key, status)]"""
+        self.sync_calendars(now=now)
+        self.sync_sweeps(now=now)
+        self.requeue_stale(now=now)
+
+        results = []
+        while max_jobs is None or len(results) < max_jobs:
+            job = self.claim(now=now)
+            if not job:
+                break
+            results.append((job["key"], self.run_job(job, now=now)))
+        return results
+
+    def run_forever(self, poll_interval=60, stop=None):
+        """Run the due jobs every poll_interval seconds
+
+        :param callable stop: stop() return True for exit
+        """
+        self.create_indexes()
+        while not (stop and stop()):
+            try:
+                self.run_pending()
+            except Exception:
+                logger.critical("scheduler error : %s" % last_error())
+            time.sleep(poll_interval)
+
+    def jobs(self, status=None):
+        query = {"provider_name": {"$in": self.providers}}
+        if status:
+            query["status"] = status
+        return self.col_jobs.find(query).sort("next_run", pymongo.ASCENDING)
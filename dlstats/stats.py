@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+
+"""Running counters by dataset (series, observations, periods, bytes)
+
+The counters are incremented by :meth:`Datasets.update_database` with the
+changes of each run and can be rebuilt from the series collection with
+:func:`reconcile_datasets_stats`.
+
+The bytes are estimated: after the BYTES_SAMPLE_MIN_SERIES first series of a
+dataset, only one series in BYTES_SAMPLE_RATE (selected by key) is encoded in
+BSON and its size is weighted by the rate. The small datasets are counted
+exactly. The exact size is set by :func:`reconcile_datasets_stats`.
+"""
+
+import zlib
+import logging
+
+import pymongo
+from bson import BSON
+
+from dlstats import constants
+from dlstats.utils import clean_datetime
+
+logger = logging.getLogger(__name__)
+
+# one series by BYTES_SAMPLE_RATE is encoded for the bytes - 1: all series
+BYTES_SAMPLE_RATE = 10
+
+# all series are encoded until this count of series by dataset
+BYTES_SAMPLE_MIN_SERIES = 1000
+
+def bson_size(bson):
+    return len(BSON.encode(bson))
+
+def get_sample_rate(series_count):
+    """Return the sample rate of the bytes after series_count series of a dataset"""
+    if series_count <= BYTES_SAMPLE_MIN_SERIES:
+        return 1
+    return BYTES_SAMPLE_RATE
+
+def is_sampled(bson, sample_rate=1):
+    """Return True if the size of the series is computed (same key, same result)"""
+    if sample_rate <= 1:
+        return True
+    return zlib.crc32(bson["key"].encode("utf-8")) % sample_rate == 0
+
+class DatasetStatsCounter(object):
+    """Changes of the series of one dataset during a run"""
+
+    def __init__(self):
+        self.series_count = 0
+        self.obs_count = 0
+        self.bytes = 0
+        self.start_ts = None
+        self.end_ts = None
+
+    def __bool__(self):
+        return self.series_count != 0 or self.obs_count != 0 or self.bytes != 0 \
+            or self.start_ts is not None or self.end_ts is not None
+
+    def _update_dates(self, bson):
+        start_ts = bson.get("start_ts")
+        end_ts = bson.get("end_ts")
+        if start_ts and (self.start_ts is None or start_ts < self.start_ts):
+            self.start_ts = start_ts
+        if end_ts and (self.end_ts is None or end_ts > self.end_ts):
+            self.end_ts = end_ts
+
+    def add(self, series_count=0, obs_count=0, bytes=0, bson=None):
+        """Add changes computed elsewhere (see :func:`insert_counts`)"""
+        self.series_count += series_count
+        self.obs_count += obs_count
+        self.bytes += bytes
+        if bson:
+            self._update_dates(bson)
+
+    def add_insert(self, bson, sample_rate=1):
+        self.add(*insert_counts(bson, sample_rate=sample_rate), bson=bson)
+
+    def add_update(self, bson, old_bson, sample_rate=1):
+        self.add(*update_counts(bson, old_bson, sample_rate=sample_rate), 
+                 bson=bson)
+
+def insert_counts(bson, sample_rate=1):
+    """Return (series, observations, bytes) added by an inserted series
+
+    :param int sample_rate: See :func:`get_sample_rate` - 1: exact bytes
+    """
+    size = 0
+    if is_sampled(bson, sample_rate):
+        size = bson_size(bson) * sample_rate
+    return 1, len(bson["values"]), size
+
+def update_counts(bson, old_bson, sample_rate=1):
+    """Return (series, observations, bytes) added by an updated series
+
+    :param int sample_rate: See :func:`get_sample_rate` - 1: exact bytes
+    """
+    size = 0
+    if is_sampled(bson, sample_rate):
+        size = (bson_size(bson) - bson_size(old_bson)) * sample_rate
+    return (0, 
+            len(bson["values"]) - len(old_bson["values"]), 
+            size)
+
+def stats_query(provider_name, dataset_code=None):
+    query = {"provider_name": provider_name}
+    if dataset_code:
+        query["dataset_code"] = dataset_code
+    return query
+
+def update_dataset_stats(db, provider_name, dataset_code, counter):
+    """Apply the counter of one run to the stats of the dataset
+
+    :param pymongo.database.Database db: MongoDB Database instance
+    :param DatasetStatsCounter counter: Changes of the run
+    """
+    query = stats_query(provider_name, dataset_code)
+    query_update = {
+        "$inc": {"series_count": counter.series_count,
+                 "obs_count": counter.obs_count,
+                 "bytes": counter.bytes},
+        "$set": {"updated": clean_datetime()},
+    }
+    if counter.start_ts:
+        query_update["$min"] = {"start_ts": counter.start_ts}
+    if counter.end_ts:
+        query_update["$max"] = {"end_ts": counter.end_ts}
+
+    return db[constants.COL_DATASETS_STATS].update_one(query, query_update,
+                                                       upsert=True)
+
+def is_stats_exist(db, provider_name, dataset_code):
+    query = stats_query(provider_name, dataset_code)
+    return db[constants.COL_DATASETS_STATS].find_one(query, {"_id": True}) is not None
+
+def get_datasets_stats(db, provider_name=None):
+    """Return dict of (provider_name, dataset_code): stats in one query"""
+    query = {}
+    if provider_name:
+        query["provider_name"] = provider_name
+    cursor = db[constants.COL_DATASETS_STATS].find(query, {"_id": False})
+    return {(doc["provider_name"], doc["dataset_code"]): doc for doc in cursor}
+
+def _aggregate_stats(db, query, with_bytes=True):
+    group = {
+        "_id": "$dataset_code",
+        "series_count": {"$sum": 1},
+        "obs_count": {"$sum": {"$size": "$values"}},
+        "start_ts": {"$min": "$start_ts"},
+        "end_ts": {"$max": "$end_ts"},
+    }
+    if with_bytes:
+        # require MongoDB >= 4.4
+        group["bytes"] = {"$sum": {"$bsonSize": "$$ROOT"}}
+    pipeline = [{"$match": query}, {"$group": group}]
+    return list(db[constants.COL_SERIES].aggregate(pipeline, allowDiskUse=True))
+
+def reconcile_datasets_stats(db, provider_name, dataset_code=None):
+    """Rebuild the stats of the datasets from the series collection
+
+    Return the number of datasets updated
+    """
+    query = stats_query(provider_name, dataset_code)
+    try:
+        results = _aggregate_stats(db, query)
+    except pymongo.errors.OperationFailure:
+        logger.warning("$bsonSize not available - bytes is not computed")
+        results = _aggregate_stats(db, query, with_bytes=False)
+
+    db[constants.COL_DATASETS_STATS].delete_many(query)
+
+    docs = []
+    now = clean_datetime()
+    for result in results:
+        docs.append({"provider_name": provider_name,
+                     "dataset_code": result["_id"],
+                     "series_count": result["series_count"],
+                     "obs_count": result["obs_count"],
+                     "bytes": result.get("bytes", 0),
+                     "start_ts": result["start_ts"],
+                     "end_ts": result["end_ts"],
+                     "updated": now})
+    if docs:
+        db[constants.COL_DATASETS_STATS].insert_many(docs)
+
+    return len(docs)
@@ -2,6 +2,7 @@
 
 from unittest import mock
 from click.testing import CliRunner
+from dlstats.fetchers import FetcherRegistry
 from dlstats.tests.base import BaseTestCase
 
 class FakeFetcher():
@@ -12,8 +13,17 @@ class FakeFetcher():
     def datasets_list(self):
         return [{"dataset_code": "dataset1", "name": "dataset 1"}]
     
+    @property
+    def provider(self):
+        return mock.Mock(**{"update_database.return_value": True})
+    
 FETCHERS = {"TEST": FakeFetcher}    
 
+REGISTRY = FetcherRegistry({
+    "TEST": "dlstats.tests.commands.test_commands_fetchers:FakeFetcher",
+    "NOT_INSTALLED": "dlstats.tests.commands.not_installed:Fetcher",
+}, group=None)
+
 class FetcherNoDBTestCase(BaseTestCase):
 
     # nosetests -s -v dlstats.tests.commands.test_commands_fetchers:FetcherNoDBTestCase
@@ -31,3 +41,13 @@ class FetcherNoDBTestCase(BaseTestCase):
         result = runner.invoke(cmd_fetchers.cmd_dataset_list, ['-f', 'TEST'])
         self.assertEqual(result.exit_code, 0)
         self.assertTrue("dataset1" in result.output)
+
+    @mock.patch("dlstats.client.Context.mongo_database")
+    @mock.patch("dlstats.commands.cmd_fetchers.FETCHERS", REGISTRY)
+    def test_providers_available(self, mongo_database):
+        runner = CliRunner()
+        from dlstats.commands import cmd_fetchers
+        result = runner.invoke(cmd_fetchers.cmd_providers, ['-S'])
+        self.assertEqual(result.exit_code, 0, result.output)
+        self.assertTrue("Provider [TEST] updated." in result.output)
+        self.assertFalse("NOT_INSTALLED" in result.output)
@@ -9,6 +9,7 @@ from slugify import slugify
 
 from dlstats import constants
 from dlstats.fetchers._commons import Categories
+from dlstats.values import parse_value
 from dlstats.tests.base import BaseDBTestCase
 
 #TODO: use tests.utils
@@ -311,7 +312,8 @@ class BaseFetcherTestCase(BaseDBTestCase):
         last_value = series_db["values"][-1]
         
         for source, target in [(first_value, first_sample), (last_value, last_sample)]:
-            self.assertEqual(source["value"], target["value"])
+            self.assertEqual(parse_value(source["value"], source.get("status")),
+                             parse_value(target["value"]))
             self.assertEqual(source["period"], target["period"])
             if source.get("attributes") and target.get("attributes"):
                 self.assertEqual(source["attributes"], slugify_dict_keys(**target["attributes"]))
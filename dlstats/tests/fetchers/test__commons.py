@@ -5,13 +5,13 @@ from datetime import datetime
 
 from bson import ObjectId
 from voluptuous import MultipleInvalid
-from pymongo.errors import DuplicateKeyError
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 
 from widukind_common import errors
-from widukind_common.utils import series_archives_load
 
 from dlstats import constants
 from dlstats.fetchers import schemas
+from dlstats.archives import series_archives_load_version
 from dlstats.fetchers._commons import (Fetcher, 
                                        CodeDict, 
                                        DlstatsCollection, 
@@ -20,9 +20,15 @@ from dlstats.fetchers._commons import (Fetcher,
                                        Datasets, 
                                        Series,
                                        series_is_changed,
+                                       series_update_operation,
+                                       series_revisions,
                                        series_get_last_update_dataset,
                                        series_verify,
-                                       SeriesIterator)
+                                       series_clean_field,
+                                       series_set_codelists,
+                                       CodelistResolver,
+                                       SeriesIterator,
+                                       create_vintages_indexes)
 from dlstats.utils import clean_datetime 
 
 from dlstats.fetchers.dummy import DUMMY, DUMMY_SAMPLE_SERIES
@@ -167,6 +173,75 @@ class CodeDictTestCase(BaseTestCase):
         self.assertEqual(dimension_list.get_list(),
                          {'concept': [('0', 'Concept 1')]})
 
+    def test_reverse_index(self):
+        
+        dimension_list = CodeDict()
+        dimension_list.set_from_list(country=[('FR', 'France')])
+        
+        self.assertEqual(dimension_list.update_entry('country', 'FRA', 'France'), 'FR')
+        self.assertEqual(dimension_list.update_entry('country', 'DE', 'Germany'), 'DE')
+        self.assertEqual(dimension_list.update_entry('country', 'DEU', 'Germany'), 'DE')
+
+        '''code list changed outside of update_entry'''
+        dimension_list.get_dict()['country']['IT'] = 'Italy'
+        self.assertEqual(dimension_list.update_entry('country', 'ITA', 'Italy'), 'IT')
+
+        '''replace long id of an existing code'''
+        self.assertEqual(dimension_list.update_entry('country', 'DE', 'Deutschland'), 'DE')
+        self.assertEqual(dimension_list.update_entry('country', None, 'Germany'), '3')
+        
+        self.assertEqual(dimension_list.get_codelists(), {
+            'country': {'FR': 'France', 'DE': 'Deutschland', 'IT': 'Italy', '3': 'Germany'}
+        })
+        self.assertEqual(dimension_list.get_codelists(keys=['unit']), {})
+
+class CodelistResolverTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.fetchers.test__commons:CodelistResolverTestCase
+    
+    def test_get(self):
+        
+        codelists = {"COUNTRY": {"FRA": "France"}}
+        resolver = CodelistResolver(codelists=codelists)
+        
+        self.assertEqual(resolver.slug("OBS_STATUS"), "obs-status")
+        self.assertEqual(resolver.get("country", "fra"), "France")
+        self.assertIsNone(resolver.get("country", "aus"))
+        self.assertIsNone(resolver.get("freq", "a"))
+
+        '''codelists completed during the iteration'''
+        codelists["COUNTRY"]["AUS"] = "Australia"
+        codelists["FREQ"] = {"A": "Annual"}
+        self.assertEqual(resolver.get("country", "aus"), "Australia")
+        self.assertEqual(resolver.get("freq", "a"), "Annual")
+        
+        self.assertEqual(resolver.slugged_codelists(), {
+            "country": {"fra": "France", "aus": "Australia"},
+            "freq": {"a": "Annual"}
+        })
+
+    def test_series_set_codelists(self):
+        
+        codelists = {
+            "Country": {"AFG": "Afg"},
+            "Scale": {"Billions": "Billions"},
+            "OBS_STATUS": {"a": "Normal"},
+        }
+        
+        bson = series_clean_field(deepcopy(SERIES1))
+        self.assertEqual(bson["_codes"], {"country": {"afg"},
+                                          "scale": {"billions"},
+                                          "obs-status": {"a"}})
+        
+        used_codes = series_set_codelists(bson, codelists)
+        self.assertFalse("_codes" in bson)
+        self.assertEqual(used_codes, {"country": {"afg"},
+                                      "scale": {"billions"},
+                                      "obs-status": {"a"}})
+        self.assertEqual(bson["codelists"], {"country": {"afg": "Afg"},
+                                             "scale": {"billions": "Billions"},
+                                             "obs-status": {"a": "Normal"}})
+
 class DlstatsCollectionTestCase(BaseTestCase):
 
     def test_constructor(self):
@@ -530,6 +605,45 @@ class SeriesTestCase(BaseTestCase):
         }
         self.assertTrue(series_is_changed(new_bson, old_bson))
 
+    def test_series_update_operation(self):
+
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:SeriesTestCase.test_series_update_operation
+
+        old_bson = deepcopy(SERIES1)
+        
+        '''Append one observation'''
+        new_bson = deepcopy(old_bson)
+        new_bson["version"] = 1
+        new_bson["end_date"] = 45
+        new_bson["values"].append({'period': '2015', 'value': '2.0', 'attributes': None})
+        update, revisions = series_update_operation(new_bson, old_bson)
+        self.assertEqual(update, {
+            "$set": {"version": 1, "end_date": 45},
+            "$push": {"values": {"$each": [{'period': '2015', 'value': '2.0', 'attributes': None}]}}
+        })
+        self.assertEqual(revisions, [])
+
+        '''Revise one observation and append one observation'''
+        new_bson["values"][1]["value"] = "1.6"
+        update, revisions = series_update_operation(new_bson, old_bson)
+        self.assertEqual(update, {
+            "$set": {"version": 1, "end_date": 45,
+                     "values.1": {'period': '2014', 'value': '1.6', 'attributes': None},
+                     "values.2": {'period': '2015', 'value': '2.0', 'attributes': None}},
+        })
+        self.assertEqual(revisions, [{"period": "2014", "old_value": "1.5", "new_value": "1.6"}])
+
+        '''Remove first observation'''
+        new_bson = deepcopy(old_bson)
+        new_bson["values"].pop(0)
+        self.assertIsNone(series_update_operation(new_bson, old_bson))
+
+        '''Remove first observation and revise one observation: replace path'''
+        new_bson["values"][0]["value"] = "1.6"
+        self.assertIsNone(series_update_operation(new_bson, old_bson))
+        self.assertEqual(series_revisions(new_bson, old_bson),
+                         [{"period": "2014", "old_value": "1.5", "new_value": "1.6"}])
+
     def test_series_schema(self):
 
         bson = {
@@ -551,14 +665,25 @@ class SeriesTestCase(BaseTestCase):
             'values': [
                 {
                     "period": "2000", 
-                    "value": "1",
+                    "value": 1.0,
+                    "attributes": None, 
+                 },
+                {
+                    "period": "2001", 
+                    "value": None,
+                    "status": "NA",
                     "attributes": None, 
                  }
             ],                
         }
         schemas.series_value_schema(bson["values"][0])
+        schemas.series_value_schema(bson["values"][1])
         schemas.series_schema(bson)
 
+        '''not normalized value'''
+        with self.assertRaises(MultipleInvalid):
+            schemas.series_value_schema({"period": "2000", "value": "1", "attributes": None})
+
     def test_series_get_last_update_dataset(self):
 
         # nosetests -s -v dlstats.tests.fetchers.test__commons:SeriesTestCase.test_series_get_last_update_dataset
@@ -682,6 +807,15 @@ class DB_IndexesTestCase(BaseDBTestCase):
     @unittest.skipIf(True, "TODO")    
     def test_indexes_series(self):
         pass
+
+    def test_indexes_vintages(self):
+
+        create_vintages_indexes(self.db)
+        indexes = self.db[constants.COL_SERIES_VINTAGES].index_information()
+        self.assertEqual(sorted(list(indexes.keys())),
+                         ['_id_', 'provider_dataset_idx', 'slug_period_idx'])
+        self.assertEqual([k[0] for k in indexes["slug_period_idx"]["key"]], 
+                         ["slug", "period"])
     
 class DB_FetcherTestCase(BaseDBTestCase):
 
@@ -986,13 +1120,115 @@ class DB_DatasetsTestCase(BaseDBTestCase):
             existing_dataset = dict(provider_name="p1", dataset_code="d1", slug=d.slug())
             self.db[constants.COL_DATASETS].insert(existing_dataset)
 
-    @unittest.skipIf(True, "TODO")
     def test_load_previous_version(self):
-        pass
 
-    @unittest.skipIf(True, "TODO")
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_DatasetsTestCase.test_load_previous_version
+
+        f = Fetcher(provider_name="p1", 
+                    db=self.db)
+
+        self.db[constants.COL_DATASETS].insert_one({
+            "provider_name": "p1",
+            "dataset_code": "d1",
+            "slug": "p1-d1",
+            "dimension_keys": ["country"],
+            "attribute_keys": ["obs-status"],
+            "codelists": {"country": {"fra": "France", "deu": "Germany"},
+                          "obs-status": {"e": "Estimated value"}},
+            "concepts": {"country": "Country", "obs-status": "Observation status"},
+            "metadata": {"indicators": list(range(1000))},
+            "last_update": datetime(2016, 1, 1),
+            "enable": True,
+            "lock": False,
+            "tags": ["france"]})
+
+        d = Datasets(provider_name="p1", dataset_code="d1", 
+                     last_update=datetime.now(), fetcher=f)
+
+        self.assertTrue(d.from_db)
+        self.assertEqual(d.last_update, datetime(2016, 1, 1))
+        self.assertEqual(d.dimension_keys, ["country"])
+        self.assertEqual(d.tags, ["france"])
+
+        '''codelists, concepts and metadata not read'''
+        self.assertEqual(d._lazy_fields, {"codelists", "concepts", "metadata"})
+        self.assertIsNone(d._dimension_list)
+
+        self.assertEqual(len(d.metadata["indicators"]), 1000)
+        self.assertEqual(d._lazy_fields, {"codelists", "concepts"})
+
+        '''codelists replaced before read - previous codes of the stored codelists'''
+        d.codelists = {"country": {"ita": "Italy"}}
+        self.assertEqual(d.previous_codes, {"country": {"fra", "deu"}, "obs-status": {"e"}})
+        self.assertEqual(d.dimension_list.get_dict(), {"country": {"fra": "France", "deu": "Germany"}})
+        self.assertEqual(d.attribute_list.get_dict(), {"obs-status": {"e": "Estimated value"}})
+        self.assertEqual(d.codelists, {"country": {"ita": "Italy"}})
+        self.assertEqual(d.concepts["country"], "Country")
+
+        '''previous codes before the changes of the fetcher'''
+        d = Datasets(provider_name="p1", dataset_code="d1", fetcher=f)
+        d.codelists["country"]["ita"] = "Italy"
+        self.assertEqual(d.previous_codes["country"], {"fra", "deu"})
+
+        '''empty codelists'''
+        self.db[constants.COL_DATASETS].update_one({"slug": "p1-d1"}, 
+                                                   {"$set": {"codelists": {}}})
+        with self.assertRaises(Exception) as err:
+            Datasets(provider_name="p1", dataset_code="d1", fetcher=f)
+        self.assertTrue(str(err.exception).startswith("load previous version fail"))
+
+        '''new dataset'''
+        d = Datasets(provider_name="p1", dataset_code="d2", fetcher=f,
+                     metadata={"a": 1})
+        self.assertFalse(d.from_db)
+        self.assertEqual(d.metadata, {"a": 1})
+        self.assertEqual(d.codelists, {})
+        self.assertIsNone(d.previous_codes)
+        self.assertEqual(d.dimension_list.get_dict(), {})
+
     def test_is_recordable(self):
-        pass
+
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_DatasetsTestCase.test_is_recordable
+
+        f = Fetcher(provider_name="p1",
+                    db=self.db)
+        f.provider = Providers(name="p1",
+                      long_name="Provider One",
+                      version=1,
+                      region="Dreamland",
+                      website="http://www.example.com",
+                      fetcher=f)
+
+        d = Datasets(provider_name="p1",
+                    dataset_code="d1",
+                    name="d1 Name",
+                    last_update=datetime.now(),
+                    fetcher=f,
+                    is_load_previous_version=False)
+        d.codelists = {"country": {"afg": "AFG"}}
+
+        '''provider not in DB'''
+        self.assertFalse(d.is_recordable())
+        self.assertEqual(d.metadata["disable_reason"], "provider[p1] not found in DB")
+
+        f.provider.update_database()
+        self.assertTrue(f.is_provider_in_db())
+
+        '''not series in DB and not inserted by this run'''
+        self.assertFalse(d.is_recordable())
+        self.assertEqual(d.metadata["disable_reason"], "not series for this dataset")
+
+        '''series inserted by this run'''
+        d.series.count_inserts = 1
+        self.assertTrue(d.is_series_exist())
+        self.assertTrue(d.is_recordable())
+
+        '''series from previous run'''
+        d.series.reset_counters()
+        self.db[constants.COL_SERIES].insert_one({"provider_name": "p1",
+                                                  "dataset_code": "d1",
+                                                  "key": "key1"})
+        self.assertTrue(d.is_series_exist())
 
     @unittest.skipIf(True, "TODO")
     def test_add_frequency(self):
@@ -1053,6 +1289,65 @@ class DB_DatasetsTestCase(BaseDBTestCase):
                                                      "dataset_code": d.dataset_code})
         self.assertEqual(count, 1)
 
+    def test_update_database_bulk_error(self):
+
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_DatasetsTestCase.test_update_database_bulk_error
+
+        f = Fetcher(provider_name="p1", 
+                    db=self.db,
+                    initial_load=True)
+
+        f.provider = Providers(name="p1",
+                      long_name="Provider One",
+                      version=1,
+                      region="Dreamland",
+                      website="http://www.example.com", 
+                      fetcher=f)
+        f.provider.update_database()
+
+        d = Datasets(provider_name="p1", 
+                    dataset_code="d1",
+                    name="d1 Name",
+                    last_update=datetime.now(),
+                    doc_href="http://www.example.com",
+                    fetcher=f, 
+                    is_load_previous_version=False)
+
+        d.concepts = SERIES1_dataset_concepts
+        d.codelists = SERIES1_dataset_codelists
+        d.series.bulk_size = 1
+
+        series_list = []
+        for i in range(2):
+            series = deepcopy(SERIES1)
+            series["key"] = "key%s" % i
+            series["slug"] = "p1-d1-key%s" % i
+            series_list.append(series)
+        d.series.data_iterator = FakeSeriesIterator(d, series_list)
+
+        '''the write of the second batch fails'''
+        collection_class = type(self.db[constants.COL_SERIES])
+        insert_many = collection_class.insert_many
+        calls = []
+        def _insert_many(collection, documents, *args, **kwargs):
+            if collection.name == constants.COL_SERIES:
+                calls.append(documents)
+                if len(calls) > 1:
+                    raise BulkWriteError({"writeErrors": []})
+            return insert_many(collection, documents, *args, **kwargs)
+
+        with mock.patch.object(collection_class, "insert_many", 
+                               side_effect=_insert_many, autospec=True):
+            d.update_database()
+
+        self.assertTrue(len(calls) >= 2)
+        self.assertEqual(d.series.count_inserts, 1)
+        self.assertEqual(d.series.stats.series_count, 1)
+        self.assertEqual(d.series.loaded_keys, {"key0"})
+        self.assertTrue(d.series.bulk_error)
+        self.assertFalse(d.enable)
+        self.assertEqual(d.metadata["disable_reason"], "critical bulk error")
+
     def test_not_recordable_dataset(self):
 
         # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_DatasetsTestCase.test_not_recordable_dataset
@@ -1222,10 +1517,92 @@ class DB_SeriesTestCase(BaseDBTestCase):
         
         self.assertEqual(series.count(), len(series_list))
 
-    @unittest.skipIf(True, "TODO")    
-    def test_update_series_list_async(self):
+    def test_update_series_list_initial_load(self):
         
-        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_update_series_list_async
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_update_series_list_initial_load
+
+        f = Fetcher(provider_name="p1", 
+                    db=self.db,
+                    defer_indexes=True)
+
+        f.provider = Providers(name="p1",
+                      long_name="Provider One",
+                      version=1,
+                      region="Dreamland",
+                      website="http://www.example.com", 
+                      fetcher=f)
+        f.provider.update_database()
+
+        d = Datasets(provider_name="p1", 
+                    dataset_code="d1",
+                    name="d1 name",
+                    last_update=datetime(2013,10,28),
+                    doc_href="http://www.example.com",
+                    fetcher=f, 
+                    is_load_previous_version=False)
+        
+        s = d.series
+        s.bulk_size = 3
+
+        '''key0 twice: the second one is an update of the first batch'''
+        series_list = []
+        for i in list(range(5)) + [0]:
+            series = deepcopy(SERIES1)
+            series["key"] = "key%s" % i
+            series["slug"] = "p1-d1-key%s" % i
+            series_list.append(series)
+        series_list[-1]["values"][-1]["value"] = "2.5"
+        s.data_iterator = FakeSeriesIterator(d, series_list)
+
+        self.db[constants.COL_SERIES].create_index([("name", 1)], name="test_name")
+
+        with f.series_indexes_deferred():
+            self.assertFalse("test_name" in self.db[constants.COL_SERIES].index_information())
+            d.update_database()
+
+        self.assertTrue("test_name" in self.db[constants.COL_SERIES].index_information())
+
+        self.assertTrue(s.initial_load)
+        self.assertEqual(s.count_inserts, 5)
+        self.assertEqual(s.count_updates, 1)
+        self.assertEqual(s.get_unit_kwargs()["bytes_sample_rate"], 1)
+        self.assertEqual(self.db[constants.COL_SERIES].count(), 5)
+        doc = self.db[constants.COL_SERIES].find_one({"key": "key0"})
+        self.assertEqual(doc["values"][-1]["value"], 2.5)
+
+        '''not empty dataset - old series are searched'''
+        s = Series(dataset=d, provider_name="p1", dataset_code="d1", fetcher=f)
+        self.assertFalse(s.is_initial_load())
+
+        '''forced initial load of a not empty dataset: the series are updated'''
+        f.initial_load = True
+        s = Series(dataset=d, provider_name="p1", dataset_code="d1", 
+                   bulk_size=3, fetcher=f)
+        series_list = []
+        for i in range(5):
+            series = deepcopy(SERIES1)
+            series["key"] = "key%s" % i
+            series["slug"] = "p1-d1-key%s" % i
+            series_list.append(series)
+        series_list[0]["values"][-1]["value"] = "3.5"
+        s.data_iterator = FakeSeriesIterator(d, series_list)
+        d.series = s
+        d.update_database()
+        self.assertFalse(s.initial_load)
+        self.assertEqual(s.count_inserts, 0)
+        self.assertEqual(s.count_updates, 1)
+        self.assertEqual(self.db[constants.COL_SERIES].count(), 5)
+        doc = self.db[constants.COL_SERIES].find_one({"key": "key0"})
+        self.assertEqual(doc["values"][-1]["value"], 3.5)
+        f.initial_load = None
+
+        '''series of another provider: the indexes are not dropped'''
+        f2 = Fetcher(provider_name="p2", db=self.db, defer_indexes=True)
+        with f2.series_indexes_deferred():
+            self.assertTrue("test_name" in self.db[constants.COL_SERIES].index_information())
+        self.assertTrue("test_name" in self.db[constants.COL_SERIES].index_information())
+
+    def _test_update_series_list_async(self, async_mode):
 
         provider_name = "p1"
         dataset_code = "d1"
@@ -1233,7 +1610,8 @@ class DB_SeriesTestCase(BaseDBTestCase):
     
         f = Fetcher(provider_name=provider_name, 
                     db=self.db,
-                    async_mode=True)
+                    pool_size=2,
+                    async_mode=async_mode)
 
         f.provider = Providers(name="p1",
                       long_name="Provider One",
@@ -1251,34 +1629,53 @@ class DB_SeriesTestCase(BaseDBTestCase):
                     fetcher=f, 
                     is_load_previous_version=False)
         
-        s = Series(dataset=d,
-                   provider_name=f.provider_name, 
-                   dataset_code=dataset_code, 
-                   bulk_size=1, 
-                   fetcher=f)
-
-        series_list = [SERIES1.copy()]
-        datas = FakeSeriesIterator(d, series_list)
-        s.data_iterator = datas
-        
-        d.series = s
+        s = d.series
+        self.assertEqual(s.__class__.__name__, 
+                         {"future": "AsyncSeries", "mp": "MPSeries"}[async_mode])
+        s.bulk_size = 5
+
+        series_list = []
+        for i in range(7):
+            series = deepcopy(SERIES1)
+            series["key"] = "key%s" % i
+            series["slug"] = "p1-d1-key%s" % i
+            series_list.append(series)
+        s.data_iterator = FakeSeriesIterator(d, series_list)
         d.update_database()        
         
-        '''Count All series'''
+        self.assertEqual(s.count_inserts, len(series_list))
         self.assertEqual(self.db[constants.COL_SERIES].count(), len(series_list))
+        keys = [doc["key"] for doc in self.db[constants.COL_SERIES].find().sort("_id", 1)]
+        self.assertEqual(keys, [series["key"] for series in series_list])
+
+        '''update - one changed series'''
+        series_list = [deepcopy(SERIES1) for i in range(3)]
+        for i, series in enumerate(series_list):
+            series["key"] = "key%s" % i
+            series["slug"] = "p1-d1-key%s" % i
+        series_list[1]["values"][-1]["value"] = "2.5"
+
+        s.reset_counters()
+        s.data_iterator = FakeSeriesIterator(d, series_list)
+        d.update_database()        
 
-        '''Count series for this provider and dataset'''
-        series = self.db[constants.COL_SERIES].find({'provider_name': f.provider_name, 
-                                                     "dataset_code": dataset_code})
-        self.assertEqual(series.count(), len(series_list))
+        self.assertEqual(s.count_updates, 1)
+        self.assertEqual(s.count_unchanged, 2)
+        doc = self.db[constants.COL_SERIES].find_one({"key": "key1"})
+        self.assertEqual(doc["version"], 1)
+        self.assertEqual(doc["values"][-1]["value"], 2.5)
 
-        '''Count series for this provider and dataset and in keys[]'''
-        keys = [s['key'] for s in series_list]
-        series = self.db[constants.COL_SERIES].find({'provider_name': f.provider_name, 
-                                                     "dataset_code": dataset_code,
-                                                     "key": {"$in": keys}})
+    def test_update_series_list_async(self):
         
-        self.assertEqual(series.count(), len(series_list))
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_update_series_list_async
+
+        self._test_update_series_list_async("future")
+
+    def test_update_series_list_mp(self):
+        
+        # nosetests -s -v dlstats.tests.fetchers.test__commons:DB_SeriesTestCase.test_update_series_list_mp
+
+        self._test_update_series_list_async("mp")
 
     def test_series_update_dataset_lists(self):
 
@@ -1380,12 +1777,9 @@ class DB_SeriesTestCase(BaseDBTestCase):
         })
         
         self.assertEqual(dataset.codelists, {
-            'collection': {'e': 'End of period', 's': 'Summed through period'},
-            'country': {'aus': 'Australia', 'fra': 'France'},
-            'decimals': {'15': 'Fifteen', '6': 'Six'},
-            'freq': {'m': 'Monthly', 'q': 'Quarterly'},
-            'obs-conf': {'c': 'Confidential statistical information', 'f': 'Free'},
-            'obs-status': {'e': 'Estimated value', 'u': 'Low reliability'}
+            'collection': {'s': 'Summed through period'},
+            'country': {'fra': 'France'},
+            'obs-status': {'e': 'Estimated value'}
         })
         
         self.assertEqual(dataset.dimension_keys, ["country"])
@@ -1428,14 +1822,75 @@ class DB_SeriesTestCase(BaseDBTestCase):
         })
         
         self.assertEqual(dataset.codelists, {
-            'collection': {'e': 'End of period', 's': 'Summed through period'},
+            'collection': {'s': 'Summed through period'},
+            'country': {'fra': 'France'},
+            'obs-status': {'e': 'Estimated value'}
+        })
+
+        '''new series - codes of the previous version are kept'''
+        codelists = {
+            "COUNTRY": {"FRA": "France", "AUS": "Australia"},
+            "COLLECTION": {"S": "Summed through period", "E": "End of period"},
+            "OBS_STATUS": {"E": "Estimated value", "U": "Low reliability"},                             
+        }
+        dataset.codelists = deepcopy(codelists)
+        
+        s = Series(dataset=dataset,
+                   provider_name=f.provider_name, 
+                   dataset_code=dataset_code, 
+                   bulk_size=1, 
+                   fetcher=f)
+
+        series2 = deepcopy(SERIES1)
+        series2["key"] = "key2"
+        series2["slug"] = "p1-d1-key2"
+        series2["dimensions"] = {
+            "COUNTRY": "AUS"
+        }
+        series2["values"][0]["attributes"] = None
+        
+        s.data_iterator = FakeSeriesIterator(dataset, [series2])
+        dataset.series = s
+        dataset.update_database()
+        
+        self.assertEqual(s.count_inserts, 1)
+        self.assertEqual(dataset.codelists, {
+            'collection': {'s': 'Summed through period'},
             'country': {'aus': 'Australia', 'fra': 'France'},
-            'decimals': {'15': 'Fifteen', '6': 'Six'},
-            'freq': {'m': 'Monthly', 'q': 'Quarterly'},
-            'obs-conf': {'c': 'Confidential statistical information', 'f': 'Free'},
-            'obs-status': {'e': 'Estimated value', 'u': 'Low reliability'}
+            'obs-status': {'e': 'Estimated value'}
         })
 
+        '''run without changes - the codelists of the DSD don't grow back'''
+        dataset = Datasets(provider_name=provider_name, 
+                           dataset_code=dataset_code,
+                           name=dataset_name,
+                           last_update=datetime.now(),
+                           fetcher=f, 
+                           is_load_previous_version=True)
+        dataset.codelists = deepcopy(codelists)
+        dataset.dimension_keys = ["COUNTRY"]
+        dataset.attribute_keys = ["COLLECTION", "OBS_STATUS"]
+
+        s = Series(dataset=dataset,
+                   provider_name=f.provider_name, 
+                   dataset_code=dataset_code, 
+                   bulk_size=1, 
+                   fetcher=f)
+        s.data_iterator = FakeSeriesIterator(dataset, [deepcopy(series2)])
+        dataset.series = s
+        dataset.update_database()
+
+        self.assertEqual(s.count_inserts + s.count_updates, 0)
+        expected = {
+            'collection': {'s': 'Summed through period'},
+            'country': {'aus': 'Australia', 'fra': 'France'},
+            'obs-status': {'e': 'Estimated value'}
+        }
+        self.assertEqual(dataset.codelists, expected)
+        doc = self.db[constants.COL_DATASETS].find_one({"slug": dataset.slug()})
+        self.assertEqual(doc["codelists"], expected)
+
+
 
     def test_revisions(self):        
 
@@ -1514,12 +1969,38 @@ class DB_SeriesTestCase(BaseDBTestCase):
         bson = self.db[constants.COL_SERIES].find_one({'slug': series_slug})
         self.assertIsNotNone(bson)
         self.assertEqual(bson["version"], 1)
-        self.assertEqual(bson["values"][0]["value"], "10")
+        self.assertEqual(bson["values"][0]["value"], 10.0)
         self.assertEqual(bson["last_update_ds"], datetime(2016, 1, 1, 0, 0))
 
+        vintage = self.db[constants.COL_SERIES_VINTAGES].find_one({'slug': series_slug})
+        self.assertIsNotNone(vintage)
+        self.assertEqual(vintage["period"], "1995")
+        self.assertEqual(vintage["old_value"], old_value)
+        self.assertEqual(vintage["new_value"], 10.0)
+        self.assertEqual(vintage["version"], 1)
+
+        '''first observation removed: the document is replaced - the revision is recorded'''
+        SERIES3 = deepcopy(SERIES2)
+        SERIES3["values"].pop(0)
+        SERIES3["values"][0]["value"] = "20"
+        SERIES3["start_date"] = SERIES3["end_date"]
+        s1.data_iterator = iter([SERIES3])
+        d.update_database()
+
+        bson = self.db[constants.COL_SERIES].find_one({'slug': series_slug})
+        self.assertEqual(bson["version"], 2)
+        self.assertEqual(len(bson["values"]), 1)
+        vintage = self.db[constants.COL_SERIES_VINTAGES].find_one({'slug': series_slug, 
+                                                                   'version': 2})
+        self.assertIsNotNone(vintage)
+        self.assertEqual(vintage["period"], "2014")
+        self.assertEqual(vintage["old_value"], 1.5)
+        self.assertEqual(vintage["new_value"], 20.0)
+
         bson_rev0 = self.db[constants.COL_SERIES_ARCHIVES].find_one({'slug': series_slug})
         self.assertIsNotNone(bson_rev0)
-        bson_rev0 = series_archives_load(bson_rev0)
+        bson_rev0 = series_archives_load_version(self.db, series_slug, 0)
+        self.assertIsNotNone(bson_rev0)
         self.assertEqual(bson_rev0["version"], 0)
         #FIXME: self.assertEqual(bson_rev0["last_update_ds"], old_release_date)
         self.assertEqual(bson_rev0["values"][0]["value"], old_value)
@@ -1561,6 +2042,7 @@ class DB_DummyTestCase(BaseDBTestCase):
         series.pop('_id')
         series.pop('last_update_ds')
         series.pop('last_update_widu')
+        self.assertTrue(isinstance(series.pop('tags'), list))
         
         bson = {
          'version': 0,
@@ -1579,10 +2061,10 @@ class DB_DummyTestCase(BaseDBTestCase):
          'end_ts': datetime(2001, 1, 1, 0, 0),
          'values': [{'attributes': {'obs-status': 'a'},
                      'period': '2000',
-                     'value': '1'},
+                     'value': 1.0},
                     {'attributes': None,
                      'period': '2001',
-                     'value': '10'}]
+                     'value': 10.0}]
         }
         self.assertEquals(series, bson)
         
\ No newline at end of file
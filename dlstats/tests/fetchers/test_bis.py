@@ -48,7 +48,7 @@ DATA_BIS_DSRP = {
     "series_accept": 66,
     "series_reject_frequency": 0,
     "series_reject_empty": 0,
-    "series_all_values": 4290,
+    "series_all_values": 4278,
     "series_key_first": "Q:AU:H",
     "series_key_last": "Q:ZA:P",
     "series_sample": {
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+import io
+import os
+import shutil
+import tempfile
+from xml.etree import ElementTree
+
+import requests
+
+from dlstats import constants
+from dlstats.fetchers.dummy import DUMMY, SyntheticDataset, SyntheticServer, get_period
+from dlstats.tests.base import BaseTestCase, BaseDBTestCase
+
+class SyntheticDatasetTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.fetchers.test_dummy:SyntheticDatasetTestCase
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        super().tearDown()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def test_get_period(self):
+        self.assertEqual(get_period("A", 30), "2000")
+        self.assertEqual(get_period("Q", 121), "2000-Q2")
+        self.assertEqual(get_period("M", 371), "2000-12")
+
+    def test_iter_series(self):
+
+        ds = SyntheticDataset("ds2", series_count=200, obs_count=8,
+                              frequencies={"A": 1, "Q": 1, "M": 2},
+                              dimensions=[("COUNTRY", 10), ("INDICATOR", 20)],
+                              attribute_density=0.5, seed=1)
+        series = list(ds.iter_series())
+
+        self.assertEqual(len(series), 200)
+        self.assertEqual(len(set(s["key"] for s in series)), 200)
+        self.assertEqual(set(s["frequency"] for s in series), {"A", "Q", "M"})
+        for bson in series:
+            self.assertEqual(len(bson["values"]), 8)
+            self.assertEqual(bson["end_date"] - bson["start_date"], 7)
+            self.assertEqual(bson["values"][-1]["period"],
+                             get_period(bson["frequency"], bson["end_date"]))
+
+        attributes = [obs["attributes"] for bson in series for obs in bson["values"]]
+        density = len([a for a in attributes if a]) / len(attributes)
+        self.assertTrue(0.4 < density < 0.6)
+
+        '''same seed: same series - other seed: other values'''
+        self.assertEqual(list(SyntheticDataset("ds2", series_count=200, obs_count=8,
+                                               frequencies={"A": 1, "Q": 1, "M": 2},
+                                               dimensions=[("COUNTRY", 10), ("INDICATOR", 20)],
+                                               attribute_density=0.5, seed=1).iter_series()),
+                         series)
+        other = SyntheticDataset("ds2", series_count=200, obs_count=8, seed=2)
+        self.assertNotEqual(other.build_series(0)["values"], series[0]["values"])
+
+        '''one series without the others'''
+        self.assertEqual(ds.build_series(150), series[150])
+
+        with self.assertRaises(ValueError):
+            SyntheticDataset("ds2", series_count=201, dimensions=[("COUNTRY", 10), ("INDICATOR", 20)])
+
+    def test_release(self):
+
+        ds = SyntheticDataset("ds2", series_count=1000, obs_count=10, revision_rate=0.2)
+        release0 = list(ds.iter_series())
+        release1 = list(ds.with_release(1).iter_series())
+
+        revised = [i for i in range(1000) if release0[i]["values"] != release1[i]["values"]]
+        self.assertTrue(150 < len(revised) < 250)
+
+        '''only the last values are revised'''
+        for i in revised:
+            self.assertEqual(release0[i]["values"][:6], release1[i]["values"][:6])
+
+    def test_csv(self):
+
+        ds = SyntheticDataset("ds2", series_count=50, obs_count=5,
+                              frequencies={"A": 1, "M": 1}, attribute_density=0.3)
+        filepath = os.path.join(self.tmpdir, "ds2.csv")
+        with open(filepath, "w", newline="", encoding="utf-8") as fp:
+            ds.write_csv(fp)
+
+        self.assertEqual(list(ds.iter_csv_series(filepath)), list(ds.iter_series()))
+
+    def test_sdmx(self):
+
+        ds = SyntheticDataset("ds2", series_count=10, obs_count=3, attribute_density=1)
+        fp = io.StringIO()
+        ds.write_sdmx(fp)
+
+        root = ElementTree.fromstring(fp.getvalue().encode("utf-8"))
+        ns = {"generic": "http://www.sdmx.org/resources/sdmxml/schemas/v2_1/data/generic"}
+        self.assertEqual(len(root.findall(".//generic:Series", ns)), 10)
+        self.assertEqual(len(root.findall(".//generic:Obs", ns)), 30)
+        self.assertEqual(len(root.findall(".//generic:Attributes", ns)), 30)
+
+    def test_server(self):
+
+        ds = SyntheticDataset("ds2", series_count=20, obs_count=4, revision_rate=1)
+        with SyntheticServer([ds]) as server:
+            response = requests.get("%s/ds2.csv" % server.url)
+            self.assertEqual(response.status_code, 200)
+            release0 = response.text
+            self.assertTrue(release0.startswith("KEY,FREQ,COUNTRY,INDICATOR,PERIOD,VALUE,OBS_STATUS"))
+            self.assertEqual(len(release0.splitlines()), 1 + 20 * 4)
+
+            release1 = requests.get("%s/ds2.csv?release=1" % server.url).text
+            self.assertNotEqual(release0, release1)
+
+            response = requests.get("%s/ds2.xml" % server.url)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b"generic:Series", response.content)
+
+            self.assertEqual(requests.get("%s/ds3.csv" % server.url).status_code, 404)
+
+class DB_SyntheticTestCase(BaseDBTestCase):
+
+    # nosetests -s -v dlstats.tests.fetchers.test_dummy:DB_SyntheticTestCase
+
+    def _series_count(self, dataset_code):
+        query = {"provider_name": "DUMMY", "dataset_code": dataset_code}
+        return self.db[constants.COL_SERIES].count(query)
+
+    def test_upsert_dataset(self):
+
+        ds = SyntheticDataset("ds2", series_count=30, obs_count=6,
+                              frequencies={"A": 1, "Q": 1}, revision_rate=0.5)
+        fetcher = DUMMY(db=self.db, datasets=[ds])
+
+        self.assertEqual([d["dataset_code"] for d in fetcher.build_data_tree()[0]["datasets"]],
+                         ["ds2"])
+
+        fetcher.upsert_dataset("ds2")
+        self.assertEqual(self._series_count("ds2"), 30)
+
+        series = self.db[constants.COL_SERIES].find_one({"key": "A.C0.I0"})
+        self.assertEqual(series["dimensions"], {"freq": "a", "country": "c0", "indicator": "i0"})
+        self.assertEqual(series["version"], 0)
+
+        '''release 1 - about half of the series revised'''
+        fetcher = DUMMY(db=self.db, datasets=[ds.with_release(1)])
+        fetcher.upsert_dataset("ds2")
+        query = {"provider_name": "DUMMY", "dataset_code": "ds2", "version": 1}
+        revised = self.db[constants.COL_SERIES].count(query)
+        self.assertTrue(5 < revised < 25)
+
+    def test_upsert_dataset_http(self):
+
+        ds = SyntheticDataset("ds2", series_count=30, obs_count=6)
+        with SyntheticServer([ds]) as server:
+            fetcher = DUMMY(db=self.db, datasets=[ds], base_url=server.url)
+            fetcher.upsert_dataset("ds2")
+
+        self.assertEqual(self._series_count("ds2"), 30)
@@ -3,12 +3,18 @@
 import re
 from datetime import datetime
 import os
+import json
+import shutil
+import tempfile
 from copy import deepcopy
 
-from dlstats.fetchers.imf import IMF as Fetcher
+from dlstats.fetchers.imf import IMF as Fetcher, IMF_XML_Data
+from dlstats.xml_utils import get_key_for_slice, get_filename_for_key
+from dlstats import artifacts
 from dlstats import constants
 
 import httpretty
+import requests
 import unittest
 
 from dlstats.tests.base import RESOURCES_DIR as BASE_RESOURCES_DIR
@@ -238,6 +244,105 @@ class UtilsTestCase(BaseTestCase):
         _date = (release_date.year, release_date.month, release_date.day)
         self.assertEqual(_date, (2006, 9, 1))
         
+class FakeXMLData(object):
+    """XMLData of the tests - the file is a list of series (json)"""
+
+    def process(self, filepath):
+        with open(filepath) as fp:
+            for bson in json.load(fp):
+                yield bson, None
+
+class SlicesTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.fetchers.test_imf:SlicesTestCase
+
+    DIMENSION_KEYS = ["FREQ", "REF_AREA", "INDICATOR"]
+
+    DIMENSIONS = {
+        "FREQ": {"A": "Annual"},
+        "REF_AREA": {"FR": "France", "DE": "Germany", "US": "United States"},
+        "INDICATOR": {"X": "Exports", "M": "Imports"},
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = artifacts.configure_artifacts(root=os.path.join(self.tmpdir, "artifacts"))
+
+    def tearDown(self):
+        super().tearDown()
+        artifacts.remove_artifacts()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _get_iterator(self):
+        iterator = IMF_XML_Data.__new__(IMF_XML_Data)
+        iterator.dataset_code = "DOT"
+        iterator.provider_name = "IMF"
+        iterator.store_path = os.path.join(self.tmpdir, "data")
+        iterator.dataset = mock.Mock(metadata={})
+        iterator.fetcher = mock.Mock(for_delete=[], requests_client=requests.Session())
+        iterator.xml_data = FakeXMLData()
+        iterator._get_dimensions_from_dsd = lambda: (self.DIMENSION_KEYS, self.DIMENSIONS)
+        return iterator
+
+    def _get_series(self, area, indicator, count=1):
+        return [{"key": "A.%s.%s.%s" % (area, indicator, i),
+                 "dimensions": {"FREQ": "A", "REF_AREA": area, "INDICATOR": indicator}}
+                for i in range(count)]
+
+    def _put(self, iterator, codes, series):
+        '''store the response of the slice in the artifacts'''
+        key = get_key_for_slice(self.DIMENSION_KEYS, codes)
+        url = "%s/%s" % (iterator._get_url_data(), key)
+        filepath = os.path.join(self.tmpdir, get_filename_for_key("DOT", key))
+        with open(filepath, "w") as fp:
+            json.dump(series, fp)
+        self.store.put(url, filepath, headers={"Content-Type": "application/xml"})
+        return url
+
+    def _get_rows(self, iterator):
+        '''load all slices without network'''
+        httpretty.enable(allow_net_connect=False)
+        try:
+            return [row for row, err in iterator._get_data_by_dimension() if row]
+        finally:
+            httpretty.disable()
+            httpretty.reset()
+
+    def test_slices_from_artifacts(self):
+
+        iterator = self._get_iterator()
+        series = self._get_series("FR", "X") + self._get_series("US", "M", 2)
+        self._put(iterator, {"REF_AREA": ["FR", "DE", "US"]}, series)
+
+        rows = self._get_rows(iterator)
+
+        self.assertEqual([row["key"] for row in rows], [s["key"] for s in series])
+        stats = iterator.dataset.metadata["slices"]
+        self.assertEqual(stats["counts"]["REF_AREA"], {"FR": 1, "US": 2})
+        self.assertEqual(stats["empty"]["REF_AREA"], ["DE"])
+
+    def test_slices_truncated(self):
+
+        iterator = self._get_iterator()
+        series_fr = self._get_series("FR", "X", 2000) + self._get_series("FR", "M", 1500)
+        series_others = self._get_series("DE", "X", 5) + self._get_series("US", "M", 5)
+
+        '''responses truncated at 2999 series (http 200)'''
+        self._put(iterator, {"REF_AREA": ["FR", "DE", "US"]}, (series_fr + series_others)[:2999])
+        self._put(iterator, {"REF_AREA": "FR"}, series_fr[:2999])
+        self._put(iterator, {"REF_AREA": ["DE", "US"]}, series_others)
+        self._put(iterator, {"REF_AREA": "FR", "INDICATOR": "X"}, series_fr[:2000])
+        self._put(iterator, {"REF_AREA": "FR", "INDICATOR": "M"}, series_fr[2000:])
+
+        rows = self._get_rows(iterator)
+
+        keys = [row["key"] for row in rows]
+        self.assertEqual(len(keys), len(set(keys)))
+        self.assertEqual(sorted(keys), sorted(s["key"] for s in series_fr + series_others))
+        stats = iterator.dataset.metadata["slices"]
+        self.assertEqual(stats["counts"]["REF_AREA"], {"FR": 3500, "DE": 5, "US": 5})
+
 #@unittest.skipIf(True, "TODO")
 class FetcherTestCase(BaseFetcherTestCase):
 
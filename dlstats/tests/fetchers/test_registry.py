@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+
+import os
+import sys
+import json
+import time
+import subprocess
+from unittest import mock
+
+from dlstats import fetchers
+from dlstats.tests.base import BaseTestCase
+
+# max seconds for import dlstats.fetchers and read the names (new interpreter)
+IMPORT_BUDGET = 2.0
+
+HEAVY_MODULES = ["pandas", "numpy", "lxml.etree", "xlrd"]
+
+IMPORT_SCRIPT = """
+import sys, json
+from dlstats.fetchers import FETCHERS
+names = list(FETCHERS.keys())
+heavy = [name for name in %r if name in sys.modules]
+loaded = [name for name in sys.modules if name.startswith("dlstats.fetchers.")]
+print(json.dumps({"names": names, "heavy": heavy, "loaded": loaded}))
+""" % HEAVY_MODULES
+
+class FakeFetcher(object):
+    pass
+
+class RegistryTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.fetchers.test_registry:RegistryTestCase
+
+    def test_lazy_load(self):
+
+        registry = fetchers.FetcherRegistry(
+            {"FAKE": "dlstats.tests.fetchers.test_registry:FakeFetcher"},
+            group=None)
+
+        self.assertEqual(list(registry.keys()), ["FAKE"])
+        self.assertTrue("FAKE" in registry)
+        self.assertFalse("OTHER" in registry)
+        self.assertFalse(registry.is_loaded("FAKE"))
+
+        self.assertIs(registry["FAKE"], FakeFetcher)
+        self.assertTrue(registry.is_loaded("FAKE"))
+
+        with self.assertRaises(KeyError):
+            registry["OTHER"]
+
+        registry.register("OTHER", FakeFetcher)
+        self.assertEqual(list(registry.keys()), ["FAKE", "OTHER"])
+        self.assertIs(registry["OTHER"], FakeFetcher)
+
+    def test_available(self):
+
+        registry = fetchers.FetcherRegistry(
+            {"FAKE": "dlstats.tests.fetchers.test_registry:FakeFetcher",
+             "NOT_INSTALLED": "dlstats.tests.fetchers.not_installed:Fetcher"},
+            group=None)
+
+        '''the names include the fetchers which can't be imported'''
+        self.assertEqual(list(registry.keys()), ["FAKE", "NOT_INSTALLED"])
+        with self.assertRaises(ImportError):
+            registry["NOT_INSTALLED"]
+
+        self.assertTrue(registry.is_available("FAKE"))
+        self.assertFalse(registry.is_available("NOT_INSTALLED"))
+        self.assertEqual(registry.available(), ["FAKE"])
+
+    @mock.patch("dlstats.fetchers.iter_entry_points")
+    def test_entry_points(self, iter_entry_points):
+
+        iter_entry_points.return_value = [
+            ("PLUGIN", "dlstats.tests.fetchers.test_registry:FakeFetcher"),
+            ("BIS", "mypackage:BIS"),
+        ]
+        registry = fetchers.FetcherRegistry(fetchers.FETCHERS_PATHS)
+
+        self.assertEqual(iter_entry_points.call_count, 0)
+        self.assertEqual(list(registry.keys())[-1], "PLUGIN")
+        self.assertEqual(registry.paths["BIS"], fetchers.FETCHERS_PATHS["BIS"])
+        self.assertIs(registry["PLUGIN"], FakeFetcher)
+        self.assertEqual(iter_entry_points.call_count, 1)
+
+    def test_import_budget(self):
+
+        env = dict(os.environ)
+        root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(
+                                                    os.path.abspath(__file__)))))
+        env["PYTHONPATH"] = os.pathsep.join([root] + [p for p in sys.path if p])
+
+        start = time.time()
+        output = subprocess.check_output([sys.executable, "-c", IMPORT_SCRIPT],
+                                         env=env)
+        duration = time.time() - start
+
+        result = json.loads(output.decode("utf-8").strip().splitlines()[-1])
+        self.assertEqual(result["names"][:len(fetchers.FETCHERS_PATHS)],
+                         list(fetchers.FETCHERS_PATHS.keys()))
+        self.assertEqual(result["heavy"], [])
+        self.assertEqual(result["loaded"], [])
+        self.assertTrue(duration < IMPORT_BUDGET,
+                        "import dlstats.fetchers: %.3fs > %.3fs" % (duration, IMPORT_BUDGET))
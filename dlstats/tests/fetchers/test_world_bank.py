@@ -1,14 +1,17 @@
 # -*- coding: utf-8 -*-
 
 from datetime import datetime
+import io
+import json
 import os
 import re
 
 import httpretty
 
+from dlstats.fetchers import world_bank
 from dlstats.fetchers.world_bank import WorldBankAPI as Fetcher
 
-from dlstats.tests.base import RESOURCES_DIR as BASE_RESOURCES_DIR
+from dlstats.tests.base import RESOURCES_DIR as BASE_RESOURCES_DIR, BaseTestCase
 from dlstats.tests.fetchers.base import BaseFetcherTestCase
 
 import unittest
@@ -152,6 +155,71 @@ DATA_WB_GEM = {
     }
 }
 
+class FakeResponse(object):
+
+    def __init__(self, content):
+        self.raw = io.BytesIO(content)
+
+    def close(self):
+        pass
+
+class WorldBankUtilsTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.fetchers.test_world_bank:WorldBankUtilsTestCase
+
+    def _page(self, page=1, pages=1, total=3):
+        records = []
+        for country, iso3 in [("FR", "FRA"), ("DE", "DEU"), ("1A", "")]:
+            records.append({"indicator": {"id": "X", "value": "X"},
+                            "country": {"id": country, "value": country},
+                            "countryiso3code": iso3,
+                            "date": "2015",
+                            "value": 1.5})
+        meta = {"page": page, "pages": pages, "per_page": 3,
+                "lastupdated": "2016-01-06", "total": total}
+        return json.dumps([meta, records]).encode("utf-8")
+
+    def test_iter_json_page(self):
+
+        items = list(world_bank.iter_json_page(io.BytesIO(self._page())))
+        self.assertEqual([item_type for item_type, value in items],
+                         ["meta", "item", "item", "item"])
+        self.assertEqual(items[0][1]["lastupdated"], "2016-01-06")
+        self.assertEqual(items[1][1]["country"], {"id": "FR", "value": "FR"})
+        self.assertEqual(items[1][1]["value"], 1.5)
+
+        '''no data'''
+        content = b'[{"page":0,"pages":0,"per_page":0,"lastupdated":null,"total":0},null]'
+        items = list(world_bank.iter_json_page(io.BytesIO(content)))
+        self.assertEqual(items, [("meta", {"page": 0, "pages": 0, "per_page": 0,
+                                           "lastupdated": None, "total": 0})])
+
+        '''without ijson'''
+        with mock.patch("dlstats.fetchers.world_bank.ijson", None):
+            items_json = list(world_bank.iter_json_page(io.BytesIO(self._page())))
+        self.assertEqual(items_json, list(world_bank.iter_json_page(io.BytesIO(self._page()))))
+
+    def test_iter_records(self):
+
+        fetcher = Fetcher()
+        calls = []
+
+        def open_stream(url, params={}):
+            calls.append(dict(params))
+            return FakeResponse(self._page(page=params.get("page", 1), pages=2, total=6))
+
+        with mock.patch.object(fetcher, "open_stream", open_stream):
+            records = list(fetcher.iter_records("countries/FRA;DEU/indicators/X",
+                                                kind="values"))
+            self.assertEqual(len(records), 6)
+            self.assertEqual([c.get("page") for c in calls], [None, 2])
+            self.assertEqual(calls[0]["per_page"], 1000)
+
+            '''next request - per_page from the total of the last request'''
+            calls.clear()
+            list(fetcher.iter_records("countries/ITA/indicators/X", kind="values"))
+            self.assertEqual(calls[0]["per_page"], world_bank.MIN_PER_PAGE)
+
 class FetcherTestCase(BaseFetcherTestCase):
 
     # nosetests -s -v dlstats.tests.fetchers.test_world_bank:FetcherTestCase
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+
+from copy import deepcopy
+from datetime import datetime
+
+from dlstats import constants
+from dlstats import archives
+from dlstats.tests.base import BaseTestCase, BaseDBTestCase
+
+SERIES = {
+    'version': 0,
+    'provider_name': 'p1',
+    'dataset_code': 'd1',
+    'name': 'series1',
+    'key': 'key1',
+    'slug': 'p1-d1-key1',
+    'values': [
+        {'period': '2000', 'value': '1.0', 'attributes': {'obs-status': 'a'}},
+        {'period': '2001', 'value': '1.5', 'attributes': None},
+        {'period': '2002', 'value': '2.0', 'attributes': None},
+    ],
+    'attributes': None,
+    'dimensions': {'country': 'fra'},
+    'start_date': 30,
+    'end_date': 32,
+    'last_update_ds': datetime(2015, 1, 1),
+    'frequency': 'A'
+}
+
+def next_version(bson, value=None, period=None):
+    new_bson = deepcopy(bson)
+    new_bson["version"] += 1
+    if value:
+        new_bson["values"][-1]["value"] = value
+    if period:
+        new_bson["values"].append({'period': period, 'value': '1', 'attributes': None})
+        new_bson["end_date"] += 1
+    return new_bson
+
+class ArchivesTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_archives:ArchivesTestCase
+
+    def test_series_delta(self):
+
+        old_bson = deepcopy(SERIES)
+        new_bson = next_version(old_bson, value="3.0", period="2003")
+        new_bson["notes"] = "new note"
+
+        delta = archives.series_delta(old_bson, new_bson)
+        self.assertEqual(delta["fields"], {"version": 0, "end_date": 32})
+        self.assertEqual(delta["unset"], ["notes"])
+        self.assertEqual(delta["values"]["count"], 3)
+        self.assertEqual(delta["values"]["changed"],
+                         [[2, {'period': '2002', 'value': '2.0', 'attributes': None}]])
+
+        self.assertEqual(archives.series_apply_delta(new_bson, delta), old_bson)
+
+    def test_series_delta_first_period_change(self):
+
+        old_bson = deepcopy(SERIES)
+        new_bson = next_version(old_bson)
+        new_bson["values"].pop(0)
+
+        delta = archives.series_delta(old_bson, new_bson)
+        self.assertTrue("full" in delta["values"])
+        self.assertEqual(archives.series_apply_delta(new_bson, delta), old_bson)
+
+    def test_compress_datas(self):
+
+        doc = archives.series_archives_delta_store(SERIES, next_version(SERIES))
+        self.assertEqual(doc["archive_format"], archives.ARCHIVE_FORMAT_DELTA)
+        self.assertEqual(doc["slug"], SERIES["slug"])
+        self.assertEqual(doc["version"], 0)
+
+        doc = archives.series_archives_delta_store(SERIES, next_version(SERIES),
+                                                   snapshot=True)
+        self.assertEqual(doc["archive_format"], archives.ARCHIVE_FORMAT_SNAPSHOT)
+        self.assertEqual(archives.uncompress_datas(doc["datas"]), SERIES)
+
+class DB_ArchivesTestCase(BaseDBTestCase):
+
+    # nosetests -s -v dlstats.tests.test_archives:DB_ArchivesTestCase
+
+    def test_series_archives_load_version(self):
+
+        versions = [deepcopy(SERIES)]
+        for i in range(constants.ARCHIVES_SNAPSHOT_INTERVAL + 3):
+            versions.append(next_version(versions[-1],
+                                         value=str(i),
+                                         period=str(2003 + i)))
+
+        for old_bson, new_bson in zip(versions[:-1], versions[1:]):
+            snapshot = archives.is_snapshot_version(old_bson["version"])
+            doc = archives.series_archives_delta_store(old_bson, new_bson,
+                                                       snapshot=snapshot)
+            self.db[constants.COL_SERIES_ARCHIVES].insert_one(doc)
+
+        self.db[constants.COL_SERIES].insert_one(deepcopy(versions[-1]))
+
+        for bson in versions:
+            result = archives.series_archives_load_version(self.db,
+                                                           SERIES["slug"],
+                                                           bson["version"])
+            self.assertEqual(result, bson)
+
+        self.assertIsNone(archives.series_archives_load_version(self.db,
+                                                                SERIES["slug"],
+                                                                len(versions)))
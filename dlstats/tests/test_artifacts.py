@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+import os
+import time
+import json
+import tempfile
+
+import httpretty
+from unittest import mock
+
+from dlstats import artifacts
+from dlstats.utils import Downloader
+from dlstats.tests.base import BaseTestCase
+
+class ArtifactsTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_artifacts:ArtifactsTestCase
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.store = artifacts.ArtifactStore(root=os.path.join(self.tmpdir, "store"))
+
+    def tearDown(self):
+        super().tearDown()
+        artifacts.remove_artifacts()
+
+    def _write(self, filename, content):
+        filepath = os.path.join(self.tmpdir, filename)
+        with open(filepath, "wb") as fp:
+            fp.write(content)
+        return filepath
+
+    def _read(self, filepath):
+        with open(filepath, "rb") as fp:
+            return fp.read()
+
+    def test_put_get(self):
+
+        url = "http://www.example.org/data.csv"
+        filepath = self._write("data.csv", b"a,b\n1,2\n")
+        sha256 = self.store.put(url, filepath)
+
+        self.assertTrue(os.path.exists(self.store.object_path(sha256)))
+        self.assertEqual(self.store.lookup(url)["size"], 8)
+
+        target = os.path.join(self.tmpdir, "copy.csv")
+        self.assertTrue(self.store.get(url, target))
+        self.assertEqual(self._read(target), b"a,b\n1,2\n")
+
+        self.assertFalse(self.store.get("http://www.example.org/other.csv", target))
+
+        '''same content for 2 urls - one object'''
+        self.store.put("http://www.example.org/data2.csv", filepath)
+        self.assertEqual(len(list(self.store.iter_objects())), 1)
+
+    def test_max_age(self):
+
+        url = "http://www.example.org/data.csv"
+        self.store.put(url, self._write("data.csv", b"content"))
+        target = os.path.join(self.tmpdir, "copy.csv")
+
+        self.assertIsNotNone(self.store.lookup(url, max_age=60))
+
+        entry = self.store.lookup(url)
+        entry["stored"] = time.time() - 3600
+        with open(self.store.url_path(url), "w") as fp:
+            json.dump(entry, fp)
+
+        self.assertFalse(self.store.get(url, target, max_age=60))
+        self.assertTrue(self.store.get(url, target, max_age=0))
+
+    def test_evict(self):
+
+        contents = [os.urandom(1000) for i in range(3)]
+        for i, content in enumerate(contents):
+            url = "http://www.example.org/%s" % i
+            sha256 = self.store.put(url, self._write(str(i), content))
+            past = time.time() - 100 + i
+            os.utime(self.store.object_path(sha256), (past, past))
+
+        '''read of the first object - most recently used'''
+        self.assertTrue(self.store.get("http://www.example.org/0",
+                                       os.path.join(self.tmpdir, "copy")))
+
+        size = self.store.size()
+        self.assertEqual(self.store.evict(max_size=size - 1), 1)
+        self.assertIsNotNone(self.store.lookup("http://www.example.org/0"))
+        self.assertIsNone(self.store.lookup("http://www.example.org/1"))
+        self.assertIsNotNone(self.store.lookup("http://www.example.org/2"))
+
+    def test_size(self):
+
+        store = artifacts.ArtifactStore(root=os.path.join(self.tmpdir, "store3"),
+                                        max_size=1000000)
+        with mock.patch.object(store, "iter_objects",
+                               wraps=store.iter_objects) as iter_objects:
+            for i in range(5):
+                store.put("http://www.example.org/%s" % i,
+                          self._write(str(i), os.urandom(1000)))
+
+            '''one scan of the store for all puts'''
+            self.assertEqual(iter_objects.call_count, 1)
+            self.assertEqual(store.current_size(), store.size())
+
+        store.max_size = store.current_size() - 1
+        store.put("http://www.example.org/5", self._write("5", os.urandom(1000)))
+        self.assertTrue(store.current_size() <= store.max_size)
+        self.assertEqual(store.current_size(), store.size())
+
+    @httpretty.activate
+    def test_downloader(self):
+
+        url = "http://www.example.org/data.csv"
+        httpretty.register_uri(httpretty.GET, url, body="a,b\n1,2\n",
+                               status=200, content_type="text/csv",
+                               adding_headers={"Last-Modified": "Tue, 05 Apr 2016 15:05:11 GMT"})
+
+        artifacts.configure_artifacts(root=os.path.join(self.tmpdir, "store2"))
+
+        store_filepath = os.path.join(self.tmpdir, "run1")
+        download = Downloader(url=url, filename="data.csv",
+                              store_filepath=store_filepath)
+        filepath = download.get_filepath()
+        self.assertEqual(self._read(filepath), b"a,b\n1,2\n")
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+
+        '''second run - read from the store'''
+        store_filepath = os.path.join(self.tmpdir, "run2")
+        download = Downloader(url=url, filename="data.csv",
+                              store_filepath=store_filepath)
+        filepath, response = download.get_filepath_and_response()
+        self.assertEqual(self._read(filepath), b"a,b\n1,2\n")
+        self.assertEqual(len(httpretty.latest_requests()), 1)
+
+        '''response of the store: status and headers of the first download'''
+        self.assertTrue(response.from_artifacts)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers["last-modified"], "Tue, 05 Apr 2016 15:05:11 GMT")
+        self.assertEqual(response.headers["Content-Type"], "text/csv")
+        self.assertIsNone(response.raise_for_status())
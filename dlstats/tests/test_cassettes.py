@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+
+import os
+import json
+import shutil
+import tempfile
+import zipfile
+from unittest import mock
+
+import httpretty
+import requests
+
+from dlstats import cassettes
+from dlstats import utils
+from dlstats.utils import Downloader, get_requests_session
+from dlstats.tests.base import BaseTestCase
+
+class CassettesTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_cassettes:CassettesTestCase
+
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "cassette.zip")
+
+    def tearDown(self):
+        super().tearDown()
+        cassettes.remove_cassette()
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+    def _read(self, filepath):
+        with open(filepath, "rb") as fp:
+            return fp.read()
+
+    @httpretty.activate
+    def _record(self):
+        url1 = "http://www.example.org/data.csv"
+        url2 = "http://api.example.org/countries"
+        httpretty.register_uri(httpretty.GET, url1, body="a,b\n1,2\n",
+                               status=200, content_type="text/csv")
+        httpretty.register_uri(httpretty.GET, url2,
+                               responses=[httpretty.Response(body='{"page": 1}'),
+                                          httpretty.Response(body='{"page": 2}')])
+
+        cassettes.configure_cassette(path=self.path, mode=cassettes.MODE_RECORD)
+
+        download = Downloader(url=url1, filename="data.csv",
+                              store_filepath=os.path.join(self.tmpdir, "record"),
+                              use_artifacts=False)
+        filepath = download.get_filepath()
+        self.assertEqual(self._read(filepath), b"a,b\n1,2\n")
+
+        session = get_requests_session()
+        response = session.get(url2, params={"format": "json"}, stream=True)
+        self.assertEqual(response.raw.read(), b'{"page": 1}')
+        response = session.get(url2, params={"format": "json"})
+        self.assertEqual(response.json(), {"page": 2})
+
+        cassettes.remove_cassette()
+        self.assertEqual(len(httpretty.latest_requests()), 3)
+
+    def test_record(self):
+
+        self._record()
+
+        with zipfile.ZipFile(self.path) as archive:
+            index = json.loads(archive.read(cassettes.INDEX_NAME).decode("utf-8"))
+            names = archive.namelist()
+
+        self.assertEqual([entry["url"] for entry in index],
+                         ["http://www.example.org/data.csv",
+                          "http://api.example.org/countries?format=json",
+                          "http://api.example.org/countries?format=json"])
+        self.assertEqual(index[0]["status"], 200)
+        self.assertEqual(index[0]["headers"]["content-type"], "text/csv")
+        '''one file by body + index'''
+        self.assertEqual(len(names), 4)
+
+    def test_replay(self):
+
+        self._record()
+
+        cassette = cassettes.configure_cassette(path=self.path, mode=cassettes.MODE_REPLAY)
+
+        '''no network'''
+        httpretty.enable(allow_net_connect=False)
+        try:
+            download = Downloader(url="http://www.example.org/data.csv",
+                                  filename="data.csv",
+                                  store_filepath=os.path.join(self.tmpdir, "replay"),
+                                  use_artifacts=False)
+            filepath = download.get_filepath()
+            self.assertEqual(self._read(filepath), b"a,b\n1,2\n")
+
+            '''responses in the recorded order - the last is repeated'''
+            session = get_requests_session()
+            url = "http://api.example.org/countries"
+            pages = [session.get(url, params={"format": "json"}).json()["page"]
+                     for i in range(3)]
+            self.assertEqual(pages, [1, 2, 2])
+
+            with self.assertRaises(cassettes.CassetteMissing):
+                session.get("http://api.example.org/indicators")
+
+            '''ConnectionError for the fetchers'''
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                session.get("http://api.example.org/indicators")
+        finally:
+            httpretty.disable()
+            httpretty.reset()
+
+        self.assertEqual(cassette.count_replays, 4)
+        self.assertEqual(cassette.count_missing, 2)
+
+    def test_latency(self):
+
+        self._record()
+
+        cassette = cassettes.configure_cassette(path=self.path, mode=cassettes.MODE_REPLAY,
+                                                latency=0.5)
+        session = get_requests_session()
+        with mock.patch("dlstats.cassettes.time.sleep") as sleep:
+            session.get("http://www.example.org/data.csv")
+            sleep.assert_called_once_with(0.5)
+
+        cassette.latency = cassettes.LATENCY_RECORDED
+        entry = cassette.entries["GET http://www.example.org/data.csv "][0]
+        self.assertEqual(cassette.get_delay(entry), entry["elapsed"])
+
+    def test_requests_client(self):
+
+        '''without cassette: requests module'''
+        self.assertIs(utils.get_requests_client(), requests)
+
+        cassettes.configure_cassette(path=self.path, mode=cassettes.MODE_RECORD)
+        client = utils.get_requests_client()
+        self.assertIsInstance(client.get_adapter("http://www.example.org"),
+                              cassettes.CassetteAdapter)
+
+        '''a client set by the caller is not changed'''
+        session = requests.Session()
+        self.assertIs(utils.get_requests_client(session), session)
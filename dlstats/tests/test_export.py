@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+
+import os
+import csv
+import tempfile
+
+from dlstats import constants
+from dlstats import export
+from dlstats.tests.base import BaseTestCase, BaseDBTestCase
+
+def make_series(key, country, values):
+    return {
+        'provider_name': 'p1',
+        'dataset_code': 'd1',
+        'key': key,
+        'name': 'name %s' % key,
+        'frequency': 'A',
+        'dimensions': {'country': country, 'unit': 'eur'},
+        'values': [{'period': period, 'value': value, 'attributes': None}
+                   for period, value in values]
+    }
+
+class ExportTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_export:ExportTestCase
+
+    def test_parse_dimensions_filter(self):
+
+        result = export.parse_dimensions_filter(["country=fra",
+                                                 "country = deu",
+                                                 "unit=eur"])
+        self.assertEqual(result, {"country": ["fra", "deu"], "unit": ["eur"]})
+
+        with self.assertRaises(ValueError):
+            export.parse_dimensions_filter(["country"])
+
+    def test_series_query(self):
+
+        query = export.series_query("p1", dataset_code="d1",
+                                    dimensions={"country": ["fra"]},
+                                    frequency="A")
+        self.assertEqual(query, {"provider_name": "p1",
+                                 "dataset_code": "d1",
+                                 "frequency": "A",
+                                 "dimensions.country": {"$in": ["fra"]}})
+
+class DB_ExportTestCase(BaseDBTestCase):
+
+    # nosetests -s -v dlstats.tests.test_export:DB_ExportTestCase
+
+    def setUp(self):
+        super().setUp()
+        self.db[constants.COL_DATASETS].insert_one({
+            'provider_name': 'p1',
+            'dataset_code': 'd1',
+            'dimension_keys': ['country', 'unit'],
+        })
+        self.db[constants.COL_SERIES].insert_many([
+            make_series('key1', 'fra', [('2000', 1.0), ('2001', 2.5)]),
+            make_series('key2', 'deu', [('2001', '3'), ('2002', '4')]),
+        ])
+        self.tmpdir = tempfile.mkdtemp()
+
+    def _read_csv(self, filepath):
+        with open(filepath, newline='') as fp:
+            return list(csv.reader(fp))
+
+    def test_export_csv_long(self):
+
+        filepath = os.path.join(self.tmpdir, "long.csv")
+        count = export.export_dataset(self.db, "p1", "d1", filepath,
+                                      export_format=export.EXPORT_CSV_LONG,
+                                      dimensions={"country": ["fra"]})
+        self.assertEqual(count, 2)
+        self.assertEqual(self._read_csv(filepath), [
+            ['key', 'frequency', 'country', 'unit', 'period', 'value', 'status'],
+            ['key1', 'A', 'fra', 'eur', '2000', '1', ''],
+            ['key1', 'A', 'fra', 'eur', '2001', '2.5', ''],
+        ])
+
+    def test_export_csv_wide(self):
+
+        filepath = os.path.join(self.tmpdir, "wide.csv")
+        count = export.export_dataset(self.db, "p1", "d1", filepath,
+                                      export_format=export.EXPORT_CSV_WIDE)
+        self.assertEqual(count, 2)
+        self.assertEqual(self._read_csv(filepath), [
+            ['key', 'name', 'frequency', 'country', 'unit', '2000', '2001', '2002'],
+            ['key1', 'name key1', 'A', 'fra', 'eur', '1', '2.5', ''],
+            ['key2', 'name key2', 'A', 'deu', 'eur', '', '3', '4'],
+        ])
+
+    def test_export_datasets(self):
+
+        results = export.export_datasets(self.db, "p1",
+                                         output_dir=self.tmpdir,
+                                         max_workers=2)
+        self.assertEqual(list(results.keys()), ["d1"])
+        filepath, count = results["d1"]
+        self.assertEqual(count, 4)
+        self.assertTrue(os.path.exists(filepath))
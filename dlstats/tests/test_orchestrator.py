@@ -0,0 +1,111 @@
+# -*- coding: utf-8 -*-
+
+import time
+import threading
+from datetime import datetime
+
+from dlstats import constants
+from dlstats import orchestrator
+from dlstats import utils
+from dlstats.tests.base import BaseTestCase, BaseDBTestCase
+
+class FakeFetcher(object):
+
+    provider_name = None
+    barrier = None
+
+    def __init__(self, db=None, **kwargs):
+        self.db = db
+        self.requests_client = None
+
+    def upsert_all_datasets(self):
+        FakeFetcher.clients.append((self.requests_client, utils.default_client))
+        if self.barrier:
+            # the providers run at the same time
+            self.barrier.wait(timeout=5)
+        self.db[constants.COL_STATS_RUN].insert_one({"provider_name": self.provider_name,
+                                                     "dataset_code": "d1",
+                                                     "count_accepts": 10,
+                                                     "count_inserts": 4,
+                                                     "count_updates": 1,
+                                                     "created": datetime.now()})
+
+class FakeFetcher1(FakeFetcher):
+    provider_name = "P1"
+
+class FakeFetcher2(FakeFetcher):
+    provider_name = "P2"
+
+class ErrorFetcher(FakeFetcher):
+    provider_name = "P3"
+
+    def upsert_all_datasets(self):
+        raise Exception("fetcher error")
+
+class HostLimiterTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_orchestrator:HostLimiterTestCase
+
+    def test_acquire(self):
+
+        limiter = orchestrator.HostLimiter(max_per_host=2)
+        active = {"count": 0, "max": 0}
+        lock = threading.Lock()
+
+        def request(url):
+            with limiter.acquire(url):
+                with lock:
+                    active["count"] += 1
+                    active["max"] = max(active["max"], active["count"])
+                time.sleep(0.05)
+                with lock:
+                    active["count"] -= 1
+
+        threads = [threading.Thread(target=request, args=("http://www.example.org/%s" % i,))
+                   for i in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(active["max"], 2)
+        self.assertIs(limiter.get_semaphore("www.example.org"),
+                      limiter.get_semaphore("www.example.org"))
+
+class DB_OrchestratorTestCase(BaseDBTestCase):
+
+    # nosetests -s -v dlstats.tests.test_orchestrator:DB_OrchestratorTestCase
+
+    def setUp(self):
+        super().setUp()
+        FakeFetcher.clients = []
+        FakeFetcher.barrier = None
+
+    def test_run(self):
+
+        FakeFetcher.barrier = threading.Barrier(2)
+        runner = orchestrator.Orchestrator(self.db, ["P1", "P2", "P3"],
+                                           fetchers={"P1": FakeFetcher1,
+                                                     "P2": FakeFetcher2,
+                                                     "P3": ErrorFetcher},
+                                           max_providers=2)
+        results, summary = runner.run()
+
+        results = {r["provider_name"]: r for r in results}
+        self.assertEqual(results["P1"]["status"], orchestrator.RUN_OK)
+        self.assertEqual(results["P1"]["count_inserts"], 4)
+        self.assertEqual(results["P1"]["datasets"], 1)
+        self.assertEqual(results["P3"]["status"], orchestrator.RUN_ERROR)
+        self.assertEqual(results["P3"]["error"], "fetcher error")
+
+        self.assertEqual(summary["providers"], 3)
+        self.assertEqual(summary["errors"], 1)
+        self.assertEqual(summary["count_accepts"], 20)
+        self.assertEqual(summary["count_inserts"] + summary["count_updates"], 10)
+
+        '''one session for all fetchers and the Downloader - removed at the end'''
+        self.assertEqual(len(FakeFetcher.clients), 2)
+        for requests_client, default_client in FakeFetcher.clients:
+            self.assertIs(requests_client, runner.session)
+            self.assertIs(default_client, runner.session)
+        self.assertIsNone(utils.default_client)
@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+
+from dlstats import constants
+from dlstats import purge
+from dlstats.tests.base import BaseDBTestCase
+
+class Interrupted(Exception):
+    pass
+
+class DB_PurgeTestCase(BaseDBTestCase):
+
+    # nosetests -s -v dlstats.tests.test_purge:DB_PurgeTestCase
+
+    def setUp(self):
+        super().setUp()
+        for provider_name, dataset_code, count in [("p1", "d1", 10),
+                                                   ("p1", "d2", 3),
+                                                   ("p2", "d1", 2)]:
+            docs = [{"provider_name": provider_name,
+                     "dataset_code": dataset_code,
+                     "key": "key%s" % i} for i in range(count)]
+            self.db[constants.COL_SERIES].insert_many(docs)
+            self.db[constants.COL_DATASETS].insert_one({"provider_name": provider_name,
+                                                        "dataset_code": dataset_code})
+
+    def test_purge_datasets(self):
+
+        calls = []
+        engine = purge.Purge(self.db, "p1", dataset_codes=["d1"], batch_size=4,
+                             progress=lambda *args: calls.append(args))
+        results = engine.run()
+
+        self.assertEqual(results[constants.COL_SERIES], 10)
+        self.assertEqual(results[constants.COL_DATASETS], 1)
+        self.assertEqual(results[constants.COL_SERIES_ARCHIVES], 0)
+
+        self.assertEqual(self.db[constants.COL_SERIES].count({"provider_name": "p1"}), 3)
+        self.assertEqual(self.db[constants.COL_SERIES].count({"provider_name": "p2"}), 2)
+        self.assertEqual(self.db[constants.COL_DATASETS].count(), 2)
+
+        series_calls = [c for c in calls if c[0] == constants.COL_SERIES]
+        self.assertEqual(series_calls[-1], (constants.COL_SERIES, 10, 10))
+        self.assertEqual(len(series_calls), 3)
+
+        self.assertEqual(self.db[constants.COL_PURGE_CHECKPOINTS].count(), 0)
+
+    def test_resume(self):
+
+        def progress(collection_name, deleted, total):
+            if deleted >= 8:
+                raise Interrupted()
+
+        engine = purge.Purge(self.db, "p1", batch_size=4, progress=progress)
+        with self.assertRaises(Interrupted):
+            engine.purge_collection(constants.COL_SERIES)
+
+        checkpoint = engine.load_checkpoint(constants.COL_SERIES)
+        self.assertEqual(checkpoint["deleted"], 8)
+        self.assertEqual(self.db[constants.COL_SERIES].count({"provider_name": "p1"}), 5)
+
+        engine = purge.Purge(self.db, "p1", batch_size=4)
+        self.assertEqual(engine.purge_collection(constants.COL_SERIES), 13)
+        self.assertEqual(self.db[constants.COL_SERIES].count({"provider_name": "p1"}), 0)
+        self.assertIsNone(engine.load_checkpoint(constants.COL_SERIES))
+
+    def test_replication_lag(self):
+
+        '''not a replica set'''
+        self.assertIsNone(purge.get_replication_lag(self.db))
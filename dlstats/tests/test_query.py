@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+
+import math
+from unittest import mock
+
+import pandas
+
+from dlstats import constants
+from dlstats import query
+from dlstats.tests.base import BaseDBTestCase
+
+def series_doc(key, values, start_date=180, frequency="Q", version=0, country="FRA"):
+    """start_date 180: 2015Q1"""
+    periods = pandas.period_range(start=pandas.Period(ordinal=start_date, freq=frequency),
+                                  periods=len(values), freq=frequency)
+    return {"provider_name": "p1",
+            "dataset_code": "d1",
+            "key": key,
+            "slug": "p1-d1-%s" % key.lower(),
+            "name": key,
+            "version": version,
+            "frequency": frequency,
+            "start_date": start_date,
+            "end_date": start_date + len(values) - 1,
+            "dimensions": {"country": country},
+            "values": [{"period": str(p), "value": v, "attributes": None}
+                       for p, v in zip(periods, values)]}
+
+class DB_QueryTestCase(BaseDBTestCase):
+
+    # nosetests -s -v dlstats.tests.test_query:DB_QueryTestCase
+
+    def setUp(self):
+        super().setUp()
+        self.db[constants.COL_SERIES].insert_many([
+            series_doc("A", ["1.5", "2", "NaN"]),
+            series_doc("B", ["3", ""], start_date=181, country="DEU"),
+        ])
+        self.reader = query.SeriesReader(self.db, batch_size=1)
+
+    def test_dataframe(self):
+
+        frame = self.reader.dataframe("p1", dataset_code="d1")
+        self.assertEqual(list(frame.columns), ["A", "B"])
+        self.assertEqual([str(p) for p in frame.index],
+                         ["2015Q1", "2015Q2", "2015Q3"])
+        self.assertEqual(frame["A"]["2015Q1"], 1.5)
+        self.assertTrue(math.isnan(frame["A"]["2015Q3"]))
+        self.assertTrue(math.isnan(frame["B"]["2015Q1"]))
+        self.assertEqual(frame["B"]["2015Q2"], 3.0)
+
+        frame = self.reader.dataframe("p1", dimensions={"country": ["DEU"]})
+        self.assertEqual(list(frame.columns), ["B"])
+
+        frame = self.reader.long_dataframe("p1", keys=["A"])
+        self.assertEqual(list(frame["period"]), ["2015Q1", "2015Q2", "2015Q3"])
+
+    def test_cache(self):
+
+        series = list(self.reader.iter_series("p1"))
+        self.assertEqual([s.key for s in series], ["A", "B"])
+        self.assertEqual(self.reader.cache.hits, 0)
+
+        series2 = list(self.reader.iter_series("p1"))
+        self.assertIs(series2[0], series[0])
+        self.assertEqual(self.reader.cache.hits, 2)
+
+        '''new version - read again'''
+        self.db[constants.COL_SERIES].update_one(
+            {"key": "A"}, {"$set": {"version": 1, "values.0.value": "10"}})
+        series3 = list(self.reader.iter_series("p1", keys=["A"]))
+        self.assertEqual(series3[0].version, 1)
+        self.assertEqual(series3[0].data.iloc[0], 10.0)
+
+    def test_not_contiguous(self):
+
+        docs = []
+        for key in ["C", "D", "E"]:
+            doc = series_doc(key, ["1", "2", "3"])
+            '''missing period 2015Q2'''
+            doc["values"].pop(1)
+            docs.append(doc)
+        self.db[constants.COL_SERIES].insert_many(docs)
+
+        reader = query.SeriesReader(self.db, batch_size=10)
+        with mock.patch.object(reader, "read_periods", wraps=reader.read_periods) as read_periods:
+            series = list(reader.iter_series("p1", keys=["A", "C", "D", "E"]))
+
+        '''one query for the periods of the batch'''
+        self.assertEqual(read_periods.call_count, 1)
+        self.assertEqual(sorted(read_periods.call_args[0][0]), 
+                         ["p1-d1-c", "p1-d1-d", "p1-d1-e"])
+        self.assertEqual([s.key for s in series], ["A", "C", "D", "E"])
+        self.assertEqual([str(p) for p in series[1].data.index], ["2015Q1", "2015Q3"])
+        self.assertEqual(list(series[1].data), [1.0, 3.0])
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime, timedelta
+
+from dlstats import constants
+from dlstats import scheduler
+from dlstats.tests.base import BaseDBTestCase
+
+class FakeFetcher(object):
+
+    calls = []
+    loaded = True
+
+    def __init__(self, db=None, **kwargs):
+        self.db = db
+
+    def wrap_upsert_dataset(self, dataset_code):
+        FakeFetcher.calls.append(dataset_code)
+        count = 1 if FakeFetcher.loaded else 0
+        self.db[constants.COL_STATS_RUN].insert_one({"provider_name": "P1",
+                                                     "dataset_code": dataset_code,
+                                                     "count_inserts": count,
+                                                     "count_updates": 0,
+                                                     "created": datetime.now()})
+
+    def upsert_all_datasets(self):
+        FakeFetcher.calls.append("ALL")
+
+class DB_SchedulerTestCase(BaseDBTestCase):
+
+    # nosetests -s -v dlstats.tests.test_scheduler:DB_SchedulerTestCase
+
+    def setUp(self):
+        super().setUp()
+        FakeFetcher.calls = []
+        FakeFetcher.loaded = True
+        self.now = datetime.now().replace(microsecond=0)
+        self.db[constants.COL_CALENDARS].insert_one({
+            "key": "cal1",
+            "action": "update-dataset",
+            "kwargs": {"provider_name": "P1", "dataset_code": "d1"},
+            "period_type": "date",
+            "period_kwargs": {"run_date": self.now - timedelta(hours=1)}
+        })
+        self.sched = scheduler.Scheduler(self.db,
+                                         fetchers={"P1": FakeFetcher,
+                                                   "P2": FakeFetcher},
+                                         delay=60, max_retries=1, backoff=600)
+
+    def _job(self, key):
+        return self.db[constants.COL_SCHEDULER_JOBS].find_one({"key": key})
+
+    def test_run_pending(self):
+
+        results = self.sched.run_pending(now=self.now)
+        self.assertEqual(sorted(results), [("cal1", scheduler.JOB_DONE),
+                                           ("sweep-P2", scheduler.JOB_PENDING)])
+        self.assertEqual(sorted(FakeFetcher.calls), ["ALL", "d1"])
+
+        '''sweep rescheduled after sweep_interval'''
+        job = self._job("sweep-P2")
+        self.assertEqual(job["next_run"],
+                         self.now + timedelta(seconds=self.sched.sweep_interval))
+
+        '''nothing to do'''
+        self.assertEqual(self.sched.run_pending(now=self.now), [])
+
+    def test_retry(self):
+
+        FakeFetcher.loaded = False
+        self.sched.providers = ["P1"]
+
+        results = self.sched.run_pending(now=self.now)
+        self.assertEqual(results, [("cal1", scheduler.JOB_PENDING)])
+        job = self._job("cal1")
+        self.assertEqual(job["attempts"], 1)
+        self.assertEqual(job["next_run"], self.now + timedelta(seconds=600))
+
+        '''not due'''
+        self.assertEqual(self.sched.run_pending(now=self.now), [])
+
+        later = self.now + timedelta(seconds=600)
+        results = self.sched.run_pending(now=later)
+        self.assertEqual(results, [("cal1", scheduler.JOB_FAILED)])
+        self.assertEqual(FakeFetcher.calls, ["d1", "d1"])
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+
+from datetime import datetime
+from unittest import mock
+
+from dlstats import constants
+from dlstats import stats
+from dlstats.tests.base import BaseTestCase, BaseDBTestCase
+
+def make_series(key, count, start_year=2000):
+    return {
+        'provider_name': 'p1',
+        'dataset_code': 'd1',
+        'key': key,
+        'start_ts': datetime(start_year, 1, 1),
+        'end_ts': datetime(start_year + count - 1, 1, 1),
+        'values': [{'period': str(start_year + i), 'value': str(i)}
+                   for i in range(count)]
+    }
+
+class DatasetStatsCounterTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_stats:DatasetStatsCounterTestCase
+
+    def test_counter(self):
+
+        counter = stats.DatasetStatsCounter()
+        self.assertFalse(counter)
+
+        bson = make_series("key1", 2)
+        counter.add_insert(bson)
+        self.assertTrue(counter)
+        self.assertEqual(counter.series_count, 1)
+        self.assertEqual(counter.obs_count, 2)
+        self.assertEqual(counter.bytes, stats.bson_size(bson))
+        self.assertEqual(counter.start_ts, datetime(2000, 1, 1))
+        self.assertEqual(counter.end_ts, datetime(2001, 1, 1))
+
+        new_bson = make_series("key1", 4, start_year=1999)
+        counter.add_update(new_bson, bson)
+        self.assertEqual(counter.series_count, 1)
+        self.assertEqual(counter.obs_count, 4)
+        self.assertEqual(counter.bytes, stats.bson_size(new_bson))
+        self.assertEqual(counter.start_ts, datetime(1999, 1, 1))
+        self.assertEqual(counter.end_ts, datetime(2002, 1, 1))
+
+    def test_bytes_sampled(self):
+
+        series = [make_series("key%s" % i, 10 + i % 20) for i in range(2000)]
+        exact = sum(stats.bson_size(bson) for bson in series)
+
+        counter = stats.DatasetStatsCounter()
+        with mock.patch("dlstats.stats.bson_size", wraps=stats.bson_size) as bson_size:
+            for bson in series:
+                counter.add_insert(bson, sample_rate=stats.BYTES_SAMPLE_RATE)
+
+        '''about one series by BYTES_SAMPLE_RATE is encoded'''
+        self.assertTrue(100 < bson_size.call_count < 300)
+        self.assertTrue(abs(counter.bytes - exact) < exact * 0.1)
+        self.assertEqual(counter.series_count, 2000)
+
+        '''same key: same choice for the updates'''
+        sampled = [bson for bson in series 
+                   if stats.is_sampled(bson, stats.BYTES_SAMPLE_RATE)]
+        bson = sampled[0]
+        new_bson = make_series(bson["key"], len(bson["values"]) + 5)
+        self.assertEqual(stats.update_counts(new_bson, bson, 
+                                             sample_rate=stats.BYTES_SAMPLE_RATE)[2],
+                         (stats.bson_size(new_bson) - stats.bson_size(bson)) * stats.BYTES_SAMPLE_RATE)
+
+    def test_bytes_small_dataset(self):
+
+        '''less than BYTES_SAMPLE_RATE series: all series are encoded'''
+        series = [make_series("key%s" % i, 10 + i) for i in range(5)]
+        exact = sum(stats.bson_size(bson) for bson in series)
+
+        counter = stats.DatasetStatsCounter()
+        for i, bson in enumerate(series):
+            counter.add_insert(bson, sample_rate=stats.get_sample_rate(i + 1))
+        self.assertEqual(counter.bytes, exact)
+        self.assertEqual(counter.series_count, 5)
+
+        self.assertEqual(stats.get_sample_rate(stats.BYTES_SAMPLE_MIN_SERIES), 1)
+        self.assertEqual(stats.get_sample_rate(stats.BYTES_SAMPLE_MIN_SERIES + 1), 
+                         stats.BYTES_SAMPLE_RATE)
+
+class DB_StatsTestCase(BaseDBTestCase):
+
+    # nosetests -s -v dlstats.tests.test_stats:DB_StatsTestCase
+
+    def test_update_dataset_stats(self):
+
+        counter = stats.DatasetStatsCounter()
+        counter.add_insert(make_series("key1", 2))
+        stats.update_dataset_stats(self.db, "p1", "d1", counter)
+        stats.update_dataset_stats(self.db, "p1", "d1", counter)
+
+        self.assertTrue(stats.is_stats_exist(self.db, "p1", "d1"))
+        self.assertFalse(stats.is_stats_exist(self.db, "p1", "d2"))
+
+        result = stats.get_datasets_stats(self.db, "p1")
+        self.assertEqual(list(result.keys()), [("p1", "d1")])
+        self.assertEqual(result[("p1", "d1")]["series_count"], 2)
+        self.assertEqual(result[("p1", "d1")]["obs_count"], 4)
+
+    def test_reconcile_datasets_stats(self):
+
+        self.db[constants.COL_SERIES].insert_many([make_series("key1", 2),
+                                                   make_series("key2", 3)])
+
+        self.assertEqual(stats.reconcile_datasets_stats(self.db, "p1"), 1)
+
+        result = stats.get_datasets_stats(self.db, "p1")[("p1", "d1")]
+        self.assertEqual(result["series_count"], 2)
+        self.assertEqual(result["obs_count"], 5)
+        self.assertEqual(result["start_ts"], datetime(2000, 1, 1))
+        self.assertEqual(result["end_ts"], datetime(2002, 1, 1))
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+
+from copy import deepcopy
+
+from dlstats import constants
+from dlstats import values
+from dlstats.fetchers._commons import series_is_changed
+from dlstats.tests.base import BaseTestCase, BaseDBTestCase
+
+def obs(period, value, **kwargs):
+    item = {"period": period, "value": value, "attributes": None}
+    item.update(kwargs)
+    return item
+
+class ValuesTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_values:ValuesTestCase
+
+    def test_parse_value(self):
+
+        self.assertEqual(values.parse_value("1.50"), (1.5, None))
+        self.assertEqual(values.parse_value(" -2 "), (-2.0, None))
+        self.assertEqual(values.parse_value(3), (3.0, None))
+        for missing in ["", "nan", "NaN", "n/a", "--", None, float("nan")]:
+            self.assertEqual(values.parse_value(missing), (None, values.STATUS_MISSING))
+        self.assertEqual(values.parse_value("(D)"), (None, "(D)"))
+
+        '''already normalized'''
+        self.assertEqual(values.parse_value(None, status="(D)"), (None, "(D)"))
+
+    def test_normalize_values(self):
+
+        items = [obs("2000", "1"), obs("2001", "2.5")]
+        values.normalize_values(items)
+        self.assertEqual(items, [obs("2000", 1.0), obs("2001", 2.5)])
+
+        items = [obs("2000", "1"), obs("2001", ""), obs("2002", "(NA)")]
+        values.normalize_values(items)
+        self.assertEqual(items, [obs("2000", 1.0),
+                                 obs("2001", None, status="NA"),
+                                 obs("2002", None, status="(NA)")])
+
+        '''idempotent'''
+        normalized = deepcopy(items)
+        values.normalize_values(normalized)
+        self.assertEqual(normalized, items)
+
+    def test_format_value(self):
+
+        self.assertEqual(values.format_value(obs("2000", 2.0)), "2")
+        self.assertEqual(values.format_value(obs("2000", 0.1)), "0.1")
+        self.assertEqual(values.format_value(obs("2000", None, status="NA")), "")
+        self.assertEqual(values.format_value(obs("2000", "1.5")), "1.5")
+
+    def test_series_is_changed(self):
+
+        old_bson = {"values": values.normalize_values([obs("2000", "1.50"), obs("2001", "")]),
+                    "start_date": 30, "end_date": 31}
+        new_bson = deepcopy(old_bson)
+        new_bson["values"] = values.normalize_values([obs("2000", "1.5"), obs("2001", "nan")])
+        self.assertFalse(series_is_changed(new_bson, old_bson))
+
+        new_bson["values"] = values.normalize_values([obs("2000", "1.5"), obs("2001", "(D)")])
+        self.assertTrue(series_is_changed(new_bson, old_bson))
+
+class DB_ValuesTestCase(BaseDBTestCase):
+
+    # nosetests -s -v dlstats.tests.test_values:DB_ValuesTestCase
+
+    def test_migrate_series_values(self):
+
+        self.db[constants.COL_SERIES].insert_many([
+            {"provider_name": "p1", "dataset_code": "d1", "key": "k1",
+             "values": [obs("2000", "1"), obs("2001", "")]},
+            {"provider_name": "p1", "dataset_code": "d1", "key": "k2",
+             "values": [obs("2000", 2.0)]},
+            {"provider_name": "p2", "dataset_code": "d1", "key": "k1",
+             "values": [obs("2000", "3")]},
+        ])
+
+        self.assertEqual(values.migrate_series_values(self.db, "p1", dry_run=True), 1)
+        self.assertEqual(values.migrate_series_values(self.db, "p1", batch_size=1), 1)
+
+        doc = self.db[constants.COL_SERIES].find_one({"provider_name": "p1", "key": "k1"})
+        self.assertEqual(doc["values"], [obs("2000", 1.0), obs("2001", None, status="NA")])
+        doc = self.db[constants.COL_SERIES].find_one({"provider_name": "p2"})
+        self.assertEqual(doc["values"], [obs("2000", "3")])
+
+        self.assertEqual(values.migrate_series_values(self.db, "p1"), 0)
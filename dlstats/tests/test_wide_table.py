@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+import io
+
+from dlstats import wide_table
+from dlstats.tests.base import BaseTestCase
+
+CSV_DATA = """KEY,2013,2014,2015,2016
+A,,1,2,
+B,1,,3,4
+C,,,,
+"""
+
+class WideTableTestCase(BaseTestCase):
+
+    # nosetests -s -v dlstats.tests.test_wide_table:WideTableTestCase
+
+    def test_iter_wide_rows(self):
+
+        columns = wide_table.read_wide_header(io.StringIO(CSV_DATA))
+        self.assertEqual(columns, ["KEY", "2013", "2014", "2015", "2016"])
+
+        periods = wide_table.WidePeriods(columns[1:], ordinals=[43, 44, 45, 46])
+        frames = wide_table.read_wide_csv(io.StringIO(CSV_DATA), chunksize=2)
+        rows = list(wide_table.iter_wide_rows(frames, periods.labels, ["KEY"]))
+
+        self.assertEqual(len(rows), 3)
+
+        self.assertEqual(rows[0].fields, {"KEY": "A"})
+        self.assertEqual(rows[0].values, ["1", "2"])
+        self.assertEqual(periods.start_date(rows[0]), 44)
+        self.assertEqual(periods.end_date(rows[0]), 45)
+        self.assertEqual(list(periods.iter_values(rows[0])),
+                         [("2014", "1"), ("2015", "2")])
+
+        '''empty values in the middle are kept'''
+        self.assertEqual(rows[1].values, ["1", "", "3", "4"])
+        self.assertEqual(rows[1].start, 0)
+
+        self.assertEqual(rows[2].values, [])
+
+    def test_iter_array_rows(self):
+
+        rows = [["x", 1, "", 2.5, 3.0, ""],
+                ["y", 2, "", ""]]
+        result = list(wide_table.iter_array_rows(rows, 2))
+        self.assertEqual(result[0].fields, {0: "x", 1: 1})
+        self.assertEqual(result[0].values, [2.5, 3.0])
+        self.assertEqual(result[0].start, 1)
+        self.assertEqual(result[1].values, [])
@@ -5,6 +5,8 @@ import traceback
 from pprint import pprint
 import time
 import os
+from datetime import datetime, timedelta
+from unittest import mock
 
 import unittest
 
@@ -140,6 +142,159 @@ class UtilsTestCase(BaseTestCase):
         self.assertEqual(position, 0)
         self.assertEqual(sorted(dimension_values), [])
 
+    def test_slice_planner(self):
+
+        # nosetests -s -v dlstats.tests.test_xml_utils:UtilsTestCase.test_slice_planner
+
+        dimension_keys = ["FREQ", "REF_AREA", "ITEM"]
+        dimensions = {"FREQ": {"A": "A", "M": "M"},
+                      "REF_AREA": {"FR": "FR", "DE": "DE", "IT": "IT"},
+                      "ITEM": {"i%s" % i: "" for i in range(10)}}
+
+        '''without stats - select_dimension'''
+        planner = xml_utils.SlicePlanner(dimension_keys, dimensions,
+                                         choice="avg", max_codes=1)
+        slices = planner.slices()
+        self.assertEqual(planner.dimension_key, "REF_AREA")
+        self.assertEqual(len(slices), 3)
+        self.assertEqual(xml_utils.get_key_for_slice(dimension_keys, slices[0]), ".FR.")
+
+        '''first run - IT is empty'''
+        for area in ["FR", "DE"]:
+            for item in range(10):
+                planner.add_series({"dimensions": {"FREQ": "M",
+                                                   "REF_AREA": area,
+                                                   "ITEM": "i%s" % item}})
+        planner.add_empty({"REF_AREA": "IT"})
+        stats = planner.get_stats()
+        self.assertTrue(stats["complete"])
+        self.assertEqual(stats["empty"]["REF_AREA"], ["IT"])
+        self.assertEqual(stats["empty"]["FREQ"], ["A"])
+        self.assertEqual(stats["counts"]["REF_AREA"], {"FR": 10, "DE": 10})
+
+        '''second run - one request for FREQ=M'''
+        planner = xml_utils.SlicePlanner(dimension_keys, dimensions, stats=stats)
+        self.assertEqual(planner.slices(), [{"FREQ": "M"}])
+
+        '''oversized slice - split on REF_AREA without empty codes'''
+        planner = xml_utils.SlicePlanner(dimension_keys, dimensions,
+                                         stats=stats, max_series=12)
+        self.assertEqual(planner.cost("FREQ"), (2, 20))
+        self.assertEqual(planner.cost("REF_AREA"), (2, 10))
+        slices = planner.slices()
+        self.assertEqual(planner.dimension_key, "REF_AREA")
+        self.assertEqual(slices, [{"REF_AREA": "FR"}, {"REF_AREA": "DE"}])
+
+        '''413 - split on the dimension with the fewest codes'''
+        self.assertEqual(planner.split({"REF_AREA": "FR"}),
+                         [{"REF_AREA": "FR", "ITEM": "i%s" % i} for i in range(10)])
+
+        '''incomplete run - merge with previous stats'''
+        planner.add_series({"dimensions": {"FREQ": "M", "REF_AREA": "FR", "ITEM": "i0"}})
+        planner.add_error({"REF_AREA": "DE"})
+        new_stats = planner.get_stats()
+        self.assertFalse(new_stats["complete"])
+        self.assertEqual(new_stats["counts"]["REF_AREA"], {"FR": 1, "DE": 10})
+        self.assertEqual(new_stats["empty"]["REF_AREA"], ["IT"])
+
+        '''empty codes are requested again after refresh_empty days'''
+        stats["empty_since"]["REF_AREA"]["IT"] -= timedelta(days=31)
+        planner = xml_utils.SlicePlanner(dimension_keys, dimensions,
+                                         stats=stats, max_series=12)
+        self.assertEqual(planner.slices(), [{"REF_AREA": "FR"},
+                                            {"REF_AREA": ["DE", "IT"]}])
+
+    def test_slice_planner_refresh_empty(self):
+
+        # nosetests -s -v dlstats.tests.test_xml_utils:UtilsTestCase.test_slice_planner_refresh_empty
+
+        dimension_keys = ["REF_AREA"]
+        dimensions = {"REF_AREA": {"FR": "FR", "DE": "DE", "IT": "IT"}}
+        day0 = datetime(2016, 1, 1)
+
+        def run(stats, day, areas):
+            '''one run of the planner at day0 + day - return (requested codes, stats)'''
+            with mock.patch("dlstats.xml_utils.clean_datetime",
+                            return_value=day0 + timedelta(days=day)):
+                planner = xml_utils.SlicePlanner(dimension_keys, dimensions,
+                                                 stats=stats, choice="max",
+                                                 max_codes=1)
+                requested = [_slice["REF_AREA"] for _slice in planner.slices()]
+                for area in requested:
+                    if area in areas:
+                        planner.add_series({"dimensions": {"REF_AREA": area}})
+                    else:
+                        planner.add_empty({"REF_AREA": area})
+                return requested, planner.get_stats()
+
+        '''day 0: IT is empty'''
+        requested, stats = run(None, 0, ["FR", "DE"])
+        self.assertEqual(requested, ["FR", "DE", "IT"])
+        self.assertEqual(stats["empty"]["REF_AREA"], ["IT"])
+
+        '''daily runs: IT is skipped and keeps the date of day 0'''
+        for day in range(1, 30):
+            requested, stats = run(stats, day, ["FR", "DE", "IT"])
+            self.assertEqual(requested, ["FR", "DE"])
+        self.assertEqual(stats["empty"]["REF_AREA"], ["IT"])
+        self.assertEqual(stats["empty_since"]["REF_AREA"]["IT"], day0)
+        self.assertEqual(stats["updated"], day0 + timedelta(days=29))
+
+        '''after refresh_empty days: IT is requested again - new data'''
+        requested, stats = run(stats, 31, ["FR", "DE", "IT"])
+        self.assertEqual(requested, ["FR", "DE", "IT"])
+        self.assertEqual(stats["empty"]["REF_AREA"], [])
+        self.assertEqual(stats["counts"]["REF_AREA"], {"FR": 1, "DE": 1, "IT": 1})
+
+        '''stats without empty_since: the date of the run'''
+        stats = {"empty": {"REF_AREA": ["IT"]}, "updated": day0}
+        requested, stats = run(stats, 10, ["FR", "DE"])
+        self.assertEqual(requested, ["FR", "DE"])
+        self.assertEqual(stats["empty_since"]["REF_AREA"]["IT"], day0)
+
+    def test_slice_planner_batch(self):
+
+        # nosetests -s -v dlstats.tests.test_xml_utils:UtilsTestCase.test_slice_planner_batch
+
+        self.assertEqual(xml_utils.get_key_for_dimension(3, 1, ["b1", "b2"]), ".b1+b2.")
+        self.assertEqual(xml_utils.get_key_for_slice(["A", "B", "C"],
+                                                     {"A": "a1", "C": ["c1", "c2"]}),
+                         "a1..c1+c2")
+
+        codes = ["c%s" % i for i in range(5)]
+        self.assertEqual(xml_utils.batch_codes(codes, max_codes=2),
+                         [["c0", "c1"], ["c2", "c3"], ["c4"]])
+        self.assertEqual(xml_utils.batch_codes(codes, max_length=9),
+                         [["c0", "c1", "c2"], ["c3", "c4"]])
+        counts = {"c0": 5, "c1": 5, "c2": 20, "c3": 1}
+        self.assertEqual(xml_utils.batch_codes(codes, counts=counts, max_series=10),
+                         [["c0", "c1"], ["c2"], ["c3", "c4"]])
+
+        dimension_keys = ["FREQ", "REF_AREA"]
+        dimensions = {"FREQ": {"A": "A"},
+                      "REF_AREA": {"FR": "FR", "DE": "DE", "IT": "IT"}}
+
+        planner = xml_utils.SlicePlanner(dimension_keys, dimensions, choice="max")
+        slices = planner.slices()
+        self.assertEqual(slices, [{"REF_AREA": ["FR", "DE", "IT"]}])
+
+        '''413 - split the group in two groups, then the codes'''
+        self.assertEqual(planner.split(slices[0]), [{"REF_AREA": "FR"},
+                                                    {"REF_AREA": ["DE", "IT"]}])
+        self.assertEqual(planner.split({"REF_AREA": ["DE", "IT"]}),
+                         [{"REF_AREA": "DE"}, {"REF_AREA": "IT"}])
+
+        '''404 for a group - all codes are empty'''
+        planner.add_empty({"REF_AREA": ["DE", "IT"]})
+        planner.add_series({"dimensions": {"FREQ": "A", "REF_AREA": "FR"}})
+        stats = planner.get_stats()
+        self.assertEqual(stats["empty"]["REF_AREA"], ["DE", "IT"])
+
+        self.assertEqual(xml_utils.get_filename_for_key("D1", "A.FR+DE."),
+                         "data-D1-A_FR-DE_.xml")
+        self.assertEqual(len(xml_utils.get_filename_for_key("D1", "+".join(codes * 30))),
+                         len("data-D1-.xml") + 40)
+
 class BaseXMLStructureTestCase(BaseTestCase):
     
     XMLStructureKlass = None
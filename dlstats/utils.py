@@ -48,6 +48,34 @@ def make_store_path(base_path=None, provider_name=None, dataset_code=None):
 def get_url_hash(url):
     return hashlib.sha224(url.encode("utf-8")).hexdigest()
 
+# shared HTTP client of the Downloader instances without client
+# (see dlstats.orchestrator)
+default_client = None
+
+def configure_requests_client(client=None):
+    """Set (None: remove) the default HTTP client of the Downloader"""
+    global default_client
+    default_client = client
+    return default_client
+
+def get_requests_session():
+    """New requests.Session - with the HTTP cassette if configured"""
+    from dlstats import cassettes
+    return cassettes.mount_cassette(requests.Session())
+
+def get_requests_client(client=None):
+    """HTTP client of the Downloader
+
+    client, default client or requests module (a new session with the
+    HTTP cassette if configured)
+    """
+    from dlstats import cassettes
+    if client or default_client:
+        return client or default_client
+    if cassettes.cassette:
+        return get_requests_session()
+    return requests
+
 class Downloader:
 
     DEFAULT_HEADERS = {
@@ -57,7 +85,13 @@ class Downloader:
     def __init__(self, url=None, filename=None, store_filepath=None,
                  timeout=None, max_retries=0,
                  replace=True, force_replace=True, use_existing_file=False,
-                 headers={}, client=None):
+                 headers={}, client=None, 
+                 use_artifacts=True, max_age=None):
+        """
+        :param bool use_artifacts: Read through the artifact store if configured
+        :param int max_age: Freshness of the stored artifact (seconds) - 
+                            default: max_age of the store
+        """
 
         self.url = url
         self.filename = filename
@@ -66,8 +100,10 @@ class Downloader:
         self.max_retries = max_retries
         self.force_replace = force_replace
         self.headers = headers
-        self.client = client or requests
+        self.client = get_requests_client(client)
         self.use_existing_file = use_existing_file
+        self.use_artifacts = use_artifacts
+        self.max_age = max_age
 
         if not self.url:
             raise ValueError("url is required")
@@ -89,11 +125,24 @@ class Downloader:
         if os.path.exists(self.filepath) and not self.use_existing_file and not replace:
             raise Exception("filepath is already exist : %s" % self.filepath)
 
+    def get_artifacts(self):
+        if not self.use_artifacts:
+            return None
+        from dlstats import artifacts
+        return artifacts.artifacts
+
     def _download(self, raise_errors=True):
 
         #TODO: max_retries (self.max_retries)
         #TODO: analyse rate limit dans headers
 
+        store = self.get_artifacts()
+        entry = store and store.get(self.url, self.filepath, max_age=self.max_age)
+        if entry:
+            from dlstats.artifacts import ArtifactResponse
+            logger.info("use artifact for url[%s] - file[%s]" % (self.url, self.filepath))
+            return ArtifactResponse(self.url, entry)
+
         start = time.time()
         try:
             response = self.client.get(self.url,
@@ -120,6 +169,12 @@ class Downloader:
                 for chunk in response.iter_content(chunk_size=8192):
                     f.write(chunk)
 
+            if store:
+                try:
+                    store.put(self.url, self.filepath, headers=response.headers)
+                except Exception as err:
+                    logger.error("store artifact for url[%s] : %s" % (self.url, str(err)))
+
             return response
 
         except Exception as err:
@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+
+"""Numeric observation values
+
+The fetchers build the observations with the values of the source files
+(str: "1.5", "", "nan", "(NA)"...). Before the write, the values are
+converted to float and the not numeric values are stored with a status:
+
+- {"value": 1.5} : number (no status)
+- {"value": None, "status": "NA"} : missing value ("", "nan", "n/a", "--"...)
+- {"value": None, "status": "(D)"} : flag of the provider (the stripped text)
+
+The conversion is idempotent: the values of the stored series (number or
+legacy str) can be normalized again before the comparisons, so "1.50" and
+"1.5" are the same value.
+"""
+
+import math
+import logging
+
+from widukind_common.debug import timeit
+
+from dlstats import constants
+
+logger = logging.getLogger(__name__)
+
+STATUS_MISSING = "NA"
+
+MISSING_VALUES = frozenset(["", "nan", "na", "n/a", "none", "null",
+                            "-", "--", ".", ".."])
+
+def parse_value(value, status=None):
+    """Return (float or None, status or None) for one value
+
+    :param status: Current status of a value already normalized
+    """
+    if value is None:
+        return None, status or STATUS_MISSING
+
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        number = float(value)
+    else:
+        text = str(value).strip()
+        try:
+            number = float(text)
+        except ValueError:
+            if text.lower() in MISSING_VALUES:
+                return None, STATUS_MISSING
+            return None, text
+
+    if math.isnan(number) or math.isinf(number):
+        return None, STATUS_MISSING
+
+    return number, None
+
+def _set_value(obs, number, status):
+    obs["value"] = number
+    if status:
+        obs["status"] = status
+    else:
+        obs.pop("status", None)
+
+def normalize_values(values):
+    """Convert in place the values of the observations - return values"""
+    if not values:
+        return values
+
+    try:
+        # fast path: all values are numbers
+        numbers = list(map(float, [obs["value"] for obs in values]))
+    except (TypeError, ValueError):
+        numbers = None
+
+    if numbers is not None and all(not math.isnan(n) and not math.isinf(n) for n in numbers):
+        for obs, number in zip(values, numbers):
+            _set_value(obs, number, None)
+        return values
+
+    for obs in values:
+        number, status = parse_value(obs["value"], status=obs.get("status"))
+        _set_value(obs, number, status)
+    return values
+
+def format_value(obs):
+    """Text of the value of an observation (export)
+
+    "" for the missing values, repr() of the float without ".0" for the
+    integers.
+    """
+    value = obs.get("value")
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        if value.is_integer() and abs(value) < 1e16:
+            return str(int(value))
+        return repr(value)
+    return str(value)
+
+@timeit("values.migrate_series_values")
+def migrate_series_values(db, provider_name=None, dataset_codes=None,
+                          batch_size=500, dry_run=False):
+    """Normalize the values of the stored series - return the count updated
+
+    Only the series with str values are read.
+
+    :param pymongo.database.Database db: MongoDB Database instance
+    :param str provider_name: Provider name - all providers if None
+    :param list dataset_codes: Datasets to migrate - all if None
+    :param int batch_size: Series updated by bulk
+    :param bool dry_run: Count the series without update
+    """
+    query = {"values.value": {"$type": "string"}}
+    if provider_name:
+        query["provider_name"] = provider_name
+    if dataset_codes:
+        query["dataset_code"] = {"$in": list(dataset_codes)}
+
+    collection = db[constants.COL_SERIES]
+    cursor = collection.find(query, {"values": True}).batch_size(batch_size)
+
+    count = 0
+    bulk_requests = None
+    for doc in cursor:
+        count += 1
+        if dry_run:
+            continue
+        if bulk_requests is None:
+            bulk_requests = collection.initialize_unordered_bulk_op()
+        values = normalize_values(doc["values"])
+        bulk_requests.find({"_id": doc["_id"]}).update_one({"$set": {"values": values}})
+        if count % batch_size == 0:
+            bulk_requests.execute()
+            bulk_requests = None
+            logger.info("values migration: provider[%s] - series[%s]" % (provider_name, count))
+
+    if bulk_requests is not None:
+        bulk_requests.execute()
+
+    return count
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+
+"""Chunked reader for the wide tables: one row by series, one column by period
+
+The periods (labels and ordinals) are computed once by file and the values
+of a chunk are trimmed in bulk: each row is returned with the values
+between its first and its last not empty value.
+
+>>> periods = WidePeriods(["2014", "2015", "2016"], freq="A")
+>>> for row in iter_wide_rows(read_wide_csv(filepath), periods, ["KEY"]):
+...     row.fields["KEY"], row.start, row.values
+"""
+
+from collections import namedtuple
+import logging
+
+import numpy
+import pandas
+
+from dlstats.utils import get_ordinal_from_period
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNKSIZE = 10000
+
+NA_VALUES = ("",)
+
+WideRow = namedtuple("WideRow", ["fields", "values", "start"])
+"""One row of a wide table
+
+- fields: dict of the not period columns
+- values: not empty values of the periods[start:start + len(values)]
+- start: position of the first value in the periods
+"""
+
+class WidePeriods(object):
+
+    def __init__(self, labels, freq=None, ordinals=None):
+        """
+        :param list labels: Period labels in the order of the columns
+        :param str freq: Frequency for compute the ordinals
+        :param list ordinals: Ordinals of the labels if already known
+        """
+        self.labels = list(labels)
+        self.freq = freq
+        if ordinals is None:
+            ordinals = [get_ordinal_from_period(label, freq=freq) for label in self.labels]
+        self.ordinals = list(ordinals)
+
+    @classmethod
+    def from_range(cls, start, count, freq):
+        """Periods from start for count periods (pandas format)"""
+        periods = pandas.period_range(start=pandas.Period(start, freq=freq),
+                                      periods=count, freq=freq)
+        return cls([str(p) for p in periods], freq=freq,
+                   ordinals=[int(p.ordinal) for p in periods])
+
+    def __len__(self):
+        return len(self.labels)
+
+    def start_date(self, row):
+        return self.ordinals[row.start]
+
+    def end_date(self, row):
+        return self.ordinals[row.start + len(row.values) - 1]
+
+    def iter_values(self, row):
+        """Yield (period, value) of the row"""
+        return zip(self.labels[row.start:row.start + len(row.values)], row.values)
+
+def trim_bounds(values, na_values=NA_VALUES):
+    """Return (first, last) of the not empty values of each row
+
+    values[i, first[i]:last[i]] are the values of the row i without the
+    leading and trailing empty values - first == last if all are empty.
+    """
+    mask = ~numpy.isin(values, list(na_values))
+    count = mask.shape[1]
+    first = mask.argmax(axis=1)
+    last = count - mask[:, ::-1].argmax(axis=1)
+    empty = ~mask.any(axis=1)
+    first[empty] = 0
+    last[empty] = 0
+    return first, last
+
+def read_wide_header(filepath_or_buffer, **kwargs):
+    """Return the columns of a CSV file"""
+    return list(pandas.read_csv(filepath_or_buffer, nrows=0, dtype=str, **kwargs).columns)
+
+def read_wide_csv(filepath_or_buffer, chunksize=DEFAULT_CHUNKSIZE, **kwargs):
+    """Yield the chunks (pandas.DataFrame of str) of a CSV file
+
+    The empty cells are "", not NaN.
+    """
+    kwargs.setdefault("dtype", str)
+    kwargs.setdefault("keep_default_na", False)
+    kwargs.setdefault("na_filter", False)
+    for frame in pandas.read_csv(filepath_or_buffer, chunksize=chunksize, **kwargs):
+        yield frame.fillna("")
+
+def iter_wide_rows(frames, period_columns, field_columns,
+                   na_values=NA_VALUES, clean=None):
+    """Yield a WideRow for each row of the chunks
+
+    :param frames: Iterable of pandas.DataFrame
+    :param list period_columns: Columns of the values
+    :param list field_columns: Other columns returned in WideRow.fields
+    :param tuple na_values: Empty values trimmed at start and end
+    :param callable clean: clean(DataFrame) -> DataFrame for the values of a chunk
+    """
+    for frame in frames:
+        values_frame = frame[period_columns]
+        if clean:
+            values_frame = clean(values_frame)
+        values = values_frame.to_numpy(dtype=object)
+        first, last = trim_bounds(values, na_values=na_values)
+        fields = frame[field_columns].to_dict("records")
+        for i, row_fields in enumerate(fields):
+            yield WideRow(row_fields, values[i, first[i]:last[i]].tolist(), int(first[i]))
+
+def iter_array_rows(rows, fields_count, na_values=NA_VALUES):
+    """WideRow for rows of an already loaded table (list of lists)
+
+    The field_count first cells are the fields ({position: value}).
+    """
+    rows = list(rows)
+    if not rows:
+        return
+    width = max(len(row) for row in rows)
+    values = numpy.full((len(rows), width - fields_count), "", dtype=object)
+    for i, row in enumerate(rows):
+        values[i, :len(row) - fields_count] = row[fields_count:]
+    first, last = trim_bounds(values, na_values=na_values)
+    for i, row in enumerate(rows):
+        yield WideRow(dict(enumerate(row[:fields_count])),
+                      values[i, first[i]:last[i]].tolist(), int(first[i]))
@@ -61,10 +61,11 @@ def parse_special_date(period, time_format, dataset_code=None):
         raise Exception(msg)
 
 def get_key_for_dimension(count_dimensions, position, dimension_value):
+    """SDMX key for one code or a list of codes (A+B+C) of one dimension"""
     sdmx_key = []
     for i in range(count_dimensions):
         if i == position:
-            sdmx_key.append(dimension_value)
+            sdmx_key.append(_join_codes(dimension_value))
         else:
             sdmx_key.append(".")
     return "".join(sdmx_key)
@@ -120,6 +121,329 @@ def select_dimension(dimension_keys, dimensions, choice="avg"):
     dimension_values = list(dimensions[_key])
     return position, _key, dimension_values
 
+def _slice_codes(value):
+    if isinstance(value, (list, tuple)):
+        return list(value)
+    return [value]
+
+def _join_codes(value):
+    return "+".join(_slice_codes(value))
+
+def get_key_for_slice(dimension_keys, codes):
+    """SDMX key of a slice - codes: {dimension_key: code or [codes]}
+
+    >>> get_key_for_slice(["A", "B", "C"], {"B": "b1"})
+    '.b1.'
+    >>> get_key_for_slice(["A", "B", "C"], {"A": "a1", "B": ["b1", "b2"]})
+    'a1.b1+b2.'
+    """
+    return ".".join(_join_codes(codes[key]) if key in codes else ""
+                    for key in dimension_keys)
+
+def get_filename_for_key(dataset_code, key, max_length=100):
+    """Filename of the data of a SDMX key - hashed if the key is long"""
+    name = key.replace(".", "_").replace("+", "-")
+    if len(name) > max_length:
+        name = hashlib.sha1(key.encode("utf-8")).hexdigest()
+    return "data-%s-%s.xml" % (dataset_code, name)
+
+SLICE_MAX_SERIES = 2000
+
+SLICE_MAX_CODES = 20
+
+SLICE_MAX_KEY_LENGTH = 1000
+
+SLICE_REFRESH_EMPTY = 30 #days
+
+def batch_codes(codes, counts=None,
+                max_codes=SLICE_MAX_CODES,
+                max_series=SLICE_MAX_SERIES,
+                max_length=SLICE_MAX_KEY_LENGTH):
+    """Group the codes for the A+B+C syntax of the SDMX keys
+
+    A group has max_codes codes, max_length characters and, if the counts
+    are known, max_series series. A code over max_series is alone.
+
+    >>> batch_codes(["a", "b", "c"], max_codes=2)
+    [['a', 'b'], ['c']]
+    """
+    counts = counts or {}
+    batches = []
+    batch = []
+    length = 0
+    series = 0
+    for code in codes:
+        count = counts.get(code, 0)
+        if batch and (len(batch) >= max_codes or
+                      length + len(code) + 1 > max_length or
+                      (max_series and series + count > max_series)):
+            batches.append(batch)
+            batch = []
+            length = 0
+            series = 0
+        batch.append(code)
+        length += len(code) + 1
+        series += count
+    if batch:
+        batches.append(batch)
+    return batches
+
+class SlicePlanner(object):
+    """Plan the per-dimension downloads of a SDMX dataset
+
+    The counts of series by dimension and code of the previous run (or
+    from an availability query) are used to select the dimension with the
+    lowest cost:
+
+    - one request by group of codes (A+B+C) under max_series
+    - the codes over max_series are split on one more dimension
+
+    The codes known to be empty are not requested. The date each code was
+    first found empty is kept in the stats and the code is requested again
+    refresh_empty days after this date. Without counts, the dimension is
+    selected with select_dimension(choice) and the codes are grouped by
+    max_codes.
+
+    The stats of the run are returned by get_stats() for store it in the
+    metadata of the dataset.
+    """
+
+    def __init__(self, dimension_keys, dimensions,
+                 stats=None,
+                 choice="avg",
+                 max_series=SLICE_MAX_SERIES,
+                 max_codes=SLICE_MAX_CODES,
+                 max_key_length=SLICE_MAX_KEY_LENGTH,
+                 refresh_empty=SLICE_REFRESH_EMPTY,
+                 max_depth=3):
+        """
+        :param list dimension_keys: Dimension keys in order of the SDMX key
+        :param dict dimensions: {dimension_key: {code: name}}
+        :param dict stats: Stats of the previous run (get_stats())
+        :param str choice: select_dimension choice if not stats
+        :param int max_series: Max series by request
+        :param int max_codes: Max codes by request - 1 for disable A+B+C keys
+        :param int max_key_length: Max length of the codes of one dimension
+        :param int refresh_empty: Empty codes are requested again
+                                  refresh_empty days after the date they
+                                  were found empty
+        :param int max_depth: Max dimensions by slice
+        """
+        self.dimension_keys = dimension_keys
+        self.dimensions = dimensions
+        self.choice = choice
+        self.max_series = max_series
+        self.max_codes = max_codes
+        self.max_key_length = max_key_length
+        self.max_depth = max_depth
+
+        stats = stats or {}
+        self.previous_counts = stats.get("counts") or {}
+
+        # {dimension_key: {code: date first found empty}} - not expired codes
+        self.previous_empty = {}
+        now = clean_datetime()
+        # stats without empty_since: the date of the run for all codes
+        updated = stats.get("updated")
+        empty_since = stats.get("empty_since") or {}
+        for key, codes in (stats.get("empty") or {}).items():
+            since = empty_since.get(key) or {}
+            for code in codes:
+                date = since.get(code) or updated or now
+                if refresh_empty and (now - date).days >= refresh_empty:
+                    continue
+                self.previous_empty.setdefault(key, {})[code] = date
+
+        self.dimension_key = None
+        self.counts = {}
+        self.empty = {}
+        self.complete = True
+
+    def known_empty(self, dimension_key):
+        return set(self.previous_empty.get(dimension_key, []))
+
+    def codes(self, dimension_key):
+        """Codes of the dimension without known empty codes"""
+        empty = self.known_empty(dimension_key)
+        return [code for code in self.dimensions[dimension_key] if not code in empty]
+
+    def estimated_count(self, dimension_key, code):
+        """Series of the code (or the group of codes) - None if unknown"""
+        counts = self.previous_counts.get(dimension_key)
+        if counts:
+            return sum(counts.get(c, 0) for c in _slice_codes(code))
+        return None
+
+    def batch(self, dimension_key, codes):
+        """Group the codes - a code is alone if it is not grouped"""
+        batches = batch_codes(codes,
+                              counts=self.previous_counts.get(dimension_key),
+                              max_codes=self.max_codes,
+                              max_series=self.max_series,
+                              max_length=self.max_key_length)
+        return [batch if len(batch) > 1 else batch[0] for batch in batches]
+
+    def cost(self, dimension_key):
+        """Return (requests, largest slice) or None if not counts"""
+        if not self.previous_counts.get(dimension_key):
+            return None
+        requests = 0
+        largest = 0
+        for value in self.batch(dimension_key, self.codes(dimension_key)):
+            count = self.estimated_count(dimension_key, value)
+            requests += max(1, -(-count // self.max_series))
+            largest = max(largest, count)
+        return requests, largest
+
+    def select(self):
+        """Return position, dimension_key, codes"""
+        costs = []
+        for key in self.dimension_keys:
+            if not self.dimensions.get(key):
+                continue
+            cost = self.cost(key)
+            if cost:
+                costs.append((cost, key))
+
+        if not costs:
+            position, key, values = select_dimension(self.dimension_keys,
+                                                     self.dimensions,
+                                                     choice=self.choice)
+            if not key:
+                return position, key, values
+            return position, key, self.codes(key)
+
+        cost, key = min(costs, key=lambda c: c[0])
+        return self.dimension_keys.index(key), key, self.codes(key)
+
+    def slices(self):
+        """Return the planned slices [{dimension_key: code or [codes]}]"""
+        position, key, codes = self.select()
+        self.dimension_key = key
+        if not key:
+            return []
+
+        slices = []
+        for value in self.batch(key, codes):
+            _slice = {key: value}
+            count = self.estimated_count(key, value)
+            if count and count > self.max_series and not isinstance(value, list):
+                slices.extend(self.split(_slice) or [_slice])
+            else:
+                slices.append(_slice)
+        return slices
+
+    def split(self, _slice):
+        """Split the slice - [] if not possible
+
+        A group of codes is split in two groups. A slice with one code is
+        split on one more dimension: the dimension with the fewest codes for
+        slices under max_series is selected.
+        """
+        for key, value in _slice.items():
+            codes = _slice_codes(value)
+            if len(codes) > 1:
+                middle = len(codes) // 2
+                sub_slices = []
+                for part in (codes[:middle], codes[middle:]):
+                    sub_slice = dict(_slice)
+                    sub_slice[key] = part if len(part) > 1 else part[0]
+                    sub_slices.append(sub_slice)
+                return sub_slices
+
+        if len(_slice) >= self.max_depth:
+            return []
+
+        count = None
+        for key, code in _slice.items():
+            value = self.estimated_count(key, code)
+            if value is not None:
+                count = value if count is None else min(count, value)
+
+        candidates = []
+        for key in self.dimension_keys:
+            if key in _slice:
+                continue
+            codes = self.codes(key)
+            if len(codes) < 2:
+                continue
+            candidates.append((len(codes), key, codes))
+
+        if not candidates:
+            return []
+
+        candidates.sort()
+        selected = candidates[-1]
+        if count:
+            for candidate in candidates:
+                if -(-count // candidate[0]) <= self.max_series:
+                    selected = candidate
+                    break
+
+        length, key, codes = selected
+        sub_slices = []
+        for code in codes:
+            sub_slice = dict(_slice)
+            sub_slice[key] = code
+            sub_slices.append(sub_slice)
+        return sub_slices
+
+    def add_series(self, bson):
+        """Count the series by dimension and code"""
+        for key, code in bson.get("dimensions", {}).items():
+            counts = self.counts.setdefault(key, {})
+            counts[code] = counts.get(code, 0) + 1
+
+    def add_empty(self, _slice):
+        """Slice without result (404)"""
+        if len(_slice) == 1:
+            key, value = list(_slice.items())[0]
+            self.empty.setdefault(key, set()).update(_slice_codes(value))
+
+    def add_error(self, _slice):
+        """Slice not loaded - the counts are not complete"""
+        self.complete = False
+
+    def get_stats(self):
+        """Stats of the run for the next planner
+
+        The counts and the empty codes of an incomplete run are merged with
+        the previous stats. The codes already known empty keep the date they
+        were first found empty.
+        """
+        now = clean_datetime()
+        empty = {}
+        if self.complete:
+            counts = self.counts
+            for key in self.dimension_keys:
+                _counts = counts.get(key, {})
+                empty[key] = set(code for code in self.dimensions.get(key, {})
+                                 if not _counts.get(code))
+        else:
+            counts = dict(self.previous_counts)
+            for key, values in self.counts.items():
+                _counts = dict(counts.get(key, {}))
+                _counts.update(values)
+                counts[key] = _counts
+            for key, codes in self.previous_empty.items():
+                empty[key] = set(codes)
+            for key, codes in self.empty.items():
+                empty.setdefault(key, set()).update(codes)
+            for key, codes in empty.items():
+                codes.difference_update(self.counts.get(key, {}).keys())
+
+        empty_since = {}
+        for key, codes in empty.items():
+            previous = self.previous_empty.get(key, {})
+            empty_since[key] = {code: previous.get(code, now) for code in codes}
+
+        return {"counts": counts,
+                "empty": {key: sorted(codes) for key, codes in empty.items()},
+                "empty_since": empty_since,
+                "dimension": self.dimension_key,
+                "complete": self.complete,
+                "updated": now}
+
 #TODO: url diff for data and structure
 SDMX_PROVIDERS = {
     'ECB': {